@@ -1,5 +1,6 @@
+from typing import Iterable, Iterator
 from mc_diag_boat.vec2 import Vec2
-from mc_diag_boat.pattern import Pattern, PatternGenerator
+from mc_diag_boat.pattern import Pattern, PatternGenerator, unique_patterns
 import mc_diag_boat.optimization as opt
 import mc_diag_boat.input as inp
 import mc_diag_boat.formatting as fmt
@@ -12,31 +13,25 @@ def get_boat_offsets(offset: Vec2[int]) -> list[Vec2[float]]:
     ]
 
 
-def get_patterns(offsets: list[Vec2[float]]) -> list[Pattern]:
-    return [
+def get_patterns(offsets: list[Vec2[float]]) -> Iterator[Pattern]:
+    return (
         pattern
         for offset in offsets
         for pattern in PatternGenerator(offset).patterns
-    ]
+    )
 
 
 def get_pareto_patterns(
     offset: Vec2[int],
-    patterns: list[Pattern],
+    patterns: Iterable[Pattern],
 ) -> list[Pattern]:
-    patterns_attrs = [
-        (-(offset - pattern.target).length(), -pattern.deviation(), -len(pattern))
-        for pattern in patterns
-    ]
-    pareto_patterns = [
-        patterns[index]
-        for index in opt.pareto_indices(patterns_attrs)
-    ]
-    return [
-        pattern
-        for index, pattern in enumerate(pareto_patterns)
-        if not any(pattern == other for other in pareto_patterns[:index])
-    ]
+    archive: opt.ParetoArchive[Pattern] = opt.ParetoArchive(3)
+    for pattern in patterns:
+        archive.insert(
+            (-(offset - pattern.target).length(), -pattern.deviation(), -len(pattern)),
+            pattern,
+        )
+    return unique_patterns(archive.items, match_target=False)
 
 
 def choose_pattern(
@@ -15,7 +15,10 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-from typing import ClassVar, Self, overload
+from typing import ClassVar, Self, SupportsIndex, overload
+from math import radians, sin, cos
+import numpy as np
+from numpy.typing import ArrayLike
 
 
 class Angle(float):
@@ -31,10 +34,10 @@ class Angle(float):
         return super().__new__(cls, (degrees + 180) % 360 - 180)
 
     def __pos__(self) -> Self:
-        return type(self)(+self)
+        return type(self)(float(self))
 
     def __neg__(self) -> Self:
-        return type(self)(-self)
+        return type(self)(-float(self))
 
     def angular_dist(self, other: float) -> Self:
         """The angle from this angle to another, [-180, 180).
@@ -72,12 +75,12 @@ class Angle(float):
             The valid boat angle(s) which is/are closest to this angle. If `n`
             is not given or `1`, the return type is `Angle`.
         """
+        if n is None or n == 1:
+            return BoatAngle.from_angle(self).to_angle()
         sorted_boat_angles = sorted(
             self.BOAT_ANGLES,
             key=lambda x: abs(self.angular_dist(x))
         )
-        if n is None or n == 1:
-            return sorted_boat_angles[0]
         if n == -1:
             n = 256
         if 0 < n <= 256:
@@ -112,3 +115,205 @@ Angle.SOUTH = Angle(0.0)
 Angle.EAST = Angle(-90.0)
 Angle.BOAT_ANGLES = [Angle(index * Angle.BOAT_ANGLE_STEP) for index in range(-128, 128)]
 
+
+class BoatAngle:
+    """One of the 256 angles a boat can face, stored as its index.
+
+    Index `0` faces South (`0.0` degrees) and each subsequent index turns by
+    `Angle.BOAT_ANGLE_STEP`, wrapping at 256, so arithmetic between boat angles
+    is exact. There is only ever one instance per index, and all derived values
+    (degrees, unit vectors, F3 display angles and placement ranges) are read
+    from precomputed tables. The class-level tables may also be indexed
+    directly with arrays of indices for bulk use.
+    """
+    __slots__ = ("index",)
+
+    index: int
+    DEGREES: ClassVar[np.ndarray]
+    UNIT_VECTORS: ClassVar[np.ndarray]
+    F3_DEGREES: ClassVar[np.ndarray]
+    _INSTANCES: ClassVar[tuple[Self, ...]]
+    _ANGLES: ClassVar[tuple[Angle, ...]]
+    _PLACEMENT_RANGES: ClassVar[tuple[tuple[Angle, Angle] | None, ...]]
+
+    def __new__(cls, index: SupportsIndex) -> Self:
+        return cls._INSTANCES[int(index) % 256]
+
+    @classmethod
+    def from_angle(cls, degrees: float) -> Self:
+        """The closest boat angle to the given angle.
+
+        Parameters
+        ----------
+        `degrees` : `float`
+            The angle, in degrees, in terms of Minecraft horizontal facing
+            direction.
+
+        Returns
+        -------
+        `boat_angle` : `BoatAngle`
+            The same boat angle that `Angle(degrees).closest_boat_angle()` gives.
+        """
+        return cls(cls.from_angles(degrees))
+
+    @classmethod
+    def from_angles(cls, degrees: ArrayLike) -> np.ndarray:
+        """The index of the closest boat angle to each of the given angles.
+
+        Parameters
+        ----------
+        `degrees` : `ArrayLike`
+            The angles, in degrees, in terms of Minecraft horizontal facing
+            direction.
+
+        Returns
+        -------
+        `indices` : `numpy.ndarray`
+            An array of `numpy.uint8` boat angle indices, with the same shape
+            as `degrees`.
+        """
+        degrees = (np.asarray(degrees, dtype=float) + 180) % 360 - 180
+        lower = np.floor(degrees / Angle.BOAT_ANGLE_STEP).astype(np.int64)
+        lower_degrees = cls.DEGREES[lower % 256]
+        upper_degrees = cls.DEGREES[(lower + 1) % 256]
+        lower_dist = np.abs((lower_degrees - degrees + 180) % 360 - 180)
+        upper_dist = np.abs((upper_degrees - degrees + 180) % 360 - 180)
+        # Ties go to whichever angle is first in `Angle.BOAT_ANGLES`
+        use_upper = (upper_dist < lower_dist) | ((upper_dist == lower_dist) & (lower == 127))
+        return ((lower + use_upper) % 256).astype(np.uint8)
+
+    @classmethod
+    def closest(cls, degrees: float, n: int) -> list[Self]:
+        """The `n` closest boat angles to the given angle.
+
+        Parameters
+        ----------
+        `degrees` : `float`
+            The angle, in degrees, in terms of Minecraft horizontal facing
+            direction.
+        `n` : `int`
+            The number of boat angles, in [1, 256].
+
+        Returns
+        -------
+        `boat_angles` : `list[BoatAngle]`
+            The boat angles in ascending order of angular distance, as for
+            `Angle(degrees).closest_boat_angle(n)`, but always as a list.
+        """
+        if not 1 <= n <= 256:
+            raise ValueError("n must be in [1, 256]")
+        return [cls.from_angle(angle) for angle in Angle(degrees).closest_boat_angle(-1)[:n]]
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self) -> tuple[type[Self], tuple[int]]:
+        return type(self), (self.index,)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.index})"
+
+    def __index__(self) -> int:
+        return self.index
+
+    def __int__(self) -> int:
+        return self.index
+
+    def __add__(self, steps: SupportsIndex) -> Self:
+        return type(self)(self.index + int(steps))
+
+    __radd__ = __add__
+
+    def __sub__(self, steps: SupportsIndex) -> Self:
+        return type(self)(self.index - int(steps))
+
+    def __neg__(self) -> Self:
+        return type(self)(-self.index)
+
+    def __pos__(self) -> Self:
+        return self
+
+    @property
+    def degrees(self) -> float:
+        """`float` : The angle, in degrees, in terms of Minecraft horizontal
+        facing direction, in [-180, 180).
+        """
+        return float(self.DEGREES[self.index])
+
+    @property
+    def f3_degrees(self) -> float:
+        """`float` : The angle shown on the F3 screen while in the boat.
+        """
+        return float(self.F3_DEGREES[self.index])
+
+    def to_angle(self) -> Angle:
+        """This boat angle as an `Angle`.
+
+        Returns
+        -------
+        `angle` : `Angle`
+            The corresponding item of `Angle.BOAT_ANGLES`.
+        """
+        return self._ANGLES[self.index]
+
+    def angular_dist(self, other: SupportsIndex) -> int:
+        """The number of boat angle steps from this boat angle to another,
+        [-128, 128).
+
+        Parameters
+        ----------
+        `other` : `BoatAngle` or `int`
+            The comparison boat angle or index.
+
+        Returns
+        -------
+        `steps` : `int`
+            The steps which would add with this boat angle to reach `other`.
+        """
+        return (int(other) - self.index + 128) % 256 - 128
+
+    def unit_vector(self) -> tuple[float, float]:
+        """The `x` and `z` components of a unit vector facing this boat angle.
+
+        Returns
+        -------
+        `unit_vector` : `tuple[float, float]`
+            The same components as `Vec2.from_polar(1.0, self.to_angle())`.
+        """
+        x, z = self.UNIT_VECTORS[self.index]
+        return float(x), float(z)
+
+    def boat_placement_range(self) -> tuple[Angle, Angle] | None:
+        """The angular range within which a boat can be placed to face
+        this boat angle.
+
+        Returns
+        -------
+        `angular_range` : `tuple[Angle, Angle]` or `None`
+            The same range as `self.to_angle().boat_placement_range()`.
+        """
+        return self._PLACEMENT_RANGES[self.index]
+
+
+def _placement_range(boat_angle: Angle) -> tuple[Angle, Angle] | None:
+    if boat_angle == 180.0 or boat_angle == -180.0:
+        return None
+    if boat_angle < 0.0:
+        return Angle(boat_angle - Angle.BOAT_ANGLE_STEP), boat_angle
+    if boat_angle > 0.0:
+        return boat_angle, Angle(boat_angle + Angle.BOAT_ANGLE_STEP)
+    return -Angle.BOAT_ANGLE_STEP, Angle.BOAT_ANGLE_STEP
+
+
+BoatAngle._ANGLES = tuple(Angle.BOAT_ANGLES[(index + 128) % 256] for index in range(256))
+BoatAngle._PLACEMENT_RANGES = tuple(_placement_range(angle) for angle in BoatAngle._ANGLES)
+BoatAngle.DEGREES = np.array(BoatAngle._ANGLES, dtype=float)
+BoatAngle.UNIT_VECTORS = np.array([
+    (-sin(radians(angle)), cos(radians(angle)))
+    for angle in BoatAngle._ANGLES
+])
+BoatAngle.F3_DEGREES = np.array([round(angle, 1) for angle in BoatAngle._ANGLES])
+BoatAngle._INSTANCES = tuple(object.__new__(BoatAngle) for _ in range(256))
+for _index, _instance in enumerate(BoatAngle._INSTANCES):
+    object.__setattr__(_instance, "index", _index)
+del _index, _instance
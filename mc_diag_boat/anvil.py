@@ -0,0 +1,470 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Reading and writing blocks in the Anvil region files of a local world save
+(Minecraft 1.18 and later).
+"""
+
+
+from typing import Iterable, Sequence
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+import io
+import os
+import re
+import time
+import gzip
+import zlib
+import numpy as np
+import nbtlib
+import litemapy as lm
+from .vec2 import Vec2
+from .schematic import Layout, _as_cells, _as_stacks
+from .commands import _placements
+
+
+SECTOR_SIZE = 4096
+REGION_CHUNKS = 32
+SECTION_VOLUME = 4096
+COMPRESSION_GZIP = 1
+COMPRESSION_ZLIB = 2
+COMPRESSION_NONE = 3
+_EXTERNAL = 128
+DIMENSION_DIRS = {
+    "minecraft:overworld": "region",
+    "minecraft:the_nether": "DIM-1/region",
+    "minecraft:the_end": "DIM1/region",
+}
+
+_BLOCK_PATTERN = re.compile(r"^([a-z0-9_.\-:/]+)(?:\[(.*)\])?$")
+_AIR = ("minecraft:air", ())
+
+
+def region_path(region_dir: str | Path, chunk_x: int, chunk_z: int) -> Path:
+    """The region file holding a chunk, e.g., `region/r.-1.0.mca`."""
+    return Path(region_dir) / f"r.{chunk_x >> 5}.{chunk_z >> 5}.mca"
+
+
+class RegionFile:
+    """An Anvil region file, held in memory while its chunks are edited.
+
+    Parameters
+    ----------
+    `path` : `str` or `Path`
+        The region file. It need not exist, in which case it has no chunks.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        # Index -> (compression type, compressed payload or None if external)
+        self._chunks: dict[int, tuple[int, bytes | None]] = {}
+        self._timestamps = np.zeros(REGION_CHUNKS ** 2, dtype=">u4")
+        if not self.path.exists() or self.path.stat().st_size < 2 * SECTOR_SIZE:
+            return
+        data = self.path.read_bytes()
+        locations = np.frombuffer(data, dtype=">u4", count=REGION_CHUNKS ** 2)
+        self._timestamps[:] = np.frombuffer(data, dtype=">u4", count=REGION_CHUNKS ** 2, offset=SECTOR_SIZE)
+        for index in np.flatnonzero(locations).tolist():
+            start = int(locations[index] >> 8) * SECTOR_SIZE
+            length = int.from_bytes(data[start:start + 4], "big")
+            if length == 0:
+                continue
+            compression = data[start + 4]
+            if compression & _EXTERNAL:
+                self._chunks[index] = (compression, None)
+            else:
+                self._chunks[index] = (compression, data[start + 5:start + 4 + length])
+
+    @staticmethod
+    def _index(chunk_x: int, chunk_z: int) -> int:
+        return (chunk_x % REGION_CHUNKS) + (chunk_z % REGION_CHUNKS) * REGION_CHUNKS
+
+    def _external_path(self, chunk_x: int, chunk_z: int) -> Path:
+        return self.path.with_name(f"c.{chunk_x}.{chunk_z}.mcc")
+
+    def __contains__(self, chunk: tuple[int, int]) -> bool:
+        return self._index(*chunk) in self._chunks
+
+    def chunks(self) -> list[tuple[int, int]]:
+        """The region-relative positions of the chunks in the file."""
+        return sorted((index % REGION_CHUNKS, index // REGION_CHUNKS) for index in self._chunks)
+
+    def read_chunk(self, chunk_x: int, chunk_z: int) -> nbtlib.File | None:
+        """The NBT data of a chunk, or `None` if it has not been generated.
+
+        Raises `ValueError` for compression types other than gzip, zlib and
+        none.
+        """
+        entry = self._chunks.get(self._index(chunk_x, chunk_z))
+        if entry is None:
+            return None
+        compression, payload = entry
+        if payload is None:
+            payload = self._external_path(chunk_x, chunk_z).read_bytes()
+        compression &= ~_EXTERNAL
+        if compression == COMPRESSION_GZIP:
+            payload = gzip.decompress(payload)
+        elif compression == COMPRESSION_ZLIB:
+            payload = zlib.decompress(payload)
+        elif compression != COMPRESSION_NONE:
+            raise ValueError(f"Unsupported chunk compression type: {compression}")
+        return nbtlib.File.parse(io.BytesIO(payload))
+
+    def write_chunk(self, chunk_x: int, chunk_z: int, chunk: nbtlib.File, compression_level: int = 6) -> None:
+        """Replace a chunk's NBT data. Nothing is written until `save`."""
+        buffer = io.BytesIO()
+        chunk.write(buffer)
+        payload = zlib.compress(buffer.getvalue(), compression_level)
+        index = self._index(chunk_x, chunk_z)
+        external = self._external_path(chunk_x, chunk_z)
+        if len(payload) + 5 > 255 * SECTOR_SIZE:
+            external.write_bytes(payload)
+            self._chunks[index] = (COMPRESSION_ZLIB | _EXTERNAL, None)
+        else:
+            external.unlink(missing_ok=True)
+            self._chunks[index] = (COMPRESSION_ZLIB, payload)
+        self._timestamps[index] = int(time.time())
+
+    def save(self) -> None:
+        """Write the file, replacing the old one atomically."""
+        locations = np.zeros(REGION_CHUNKS ** 2, dtype=">u4")
+        body = io.BytesIO()
+        sector = 2
+        for index in sorted(self._chunks):
+            compression, payload = self._chunks[index]
+            payload = payload or b""
+            record = (len(payload) + 1).to_bytes(4, "big") + bytes((compression,)) + payload
+            record += bytes(-len(record) % SECTOR_SIZE)
+            n_sectors = len(record) // SECTOR_SIZE
+            locations[index] = (sector << 8) | n_sectors
+            body.write(record)
+            sector += n_sectors
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, "wb") as file:
+            file.write(locations.tobytes())
+            file.write(self._timestamps.tobytes())
+            file.write(body.getbuffer())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+
+def _block_key(identifier: str) -> tuple[str, tuple[tuple[str, str], ...]]:
+    """The block id and sorted properties of a block state identifier."""
+    match = _BLOCK_PATTERN.match(identifier)
+    if match is None:
+        raise ValueError(f"Invalid block state: {identifier}")
+    block_id, properties = match.groups()
+    if not properties:
+        return block_id, ()
+    return block_id, tuple(sorted(tuple(prop.split("=", 1)) for prop in properties.split(",")))
+
+
+def _palette_key(entry: nbtlib.Compound) -> tuple[str, tuple[tuple[str, str], ...]]:
+    properties = entry.get("Properties", {})
+    return str(entry["Name"]), tuple(sorted((str(key), str(value)) for key, value in properties.items()))
+
+
+def _palette_entry(key: tuple[str, tuple[tuple[str, str], ...]]) -> nbtlib.Compound:
+    block_id, properties = key
+    entry = nbtlib.Compound({"Name": nbtlib.String(block_id)})
+    if properties:
+        entry["Properties"] = nbtlib.Compound({name: nbtlib.String(value) for name, value in properties})
+    return entry
+
+
+def _bits_per_block(palette_size: int) -> int:
+    return max(4, int(palette_size - 1).bit_length())
+
+
+def decode_block_states(block_states: nbtlib.Compound) -> tuple[list, np.ndarray]:
+    """The palette keys and 4096 palette indices of a section's `block_states`,
+    in y, z, x order.
+    """
+    palette = [_palette_key(entry) for entry in block_states["palette"]]
+    if "data" not in block_states or len(palette) == 1:
+        return palette, np.zeros(SECTION_VOLUME, dtype=np.int64)
+    bits = _bits_per_block(len(palette))
+    per_long = 64 // bits
+    longs = np.asarray(block_states["data"]).astype(np.int64).view(np.uint64)
+    shifts = np.arange(per_long, dtype=np.uint64) * np.uint64(bits)
+    values = (longs[:, None] >> shifts) & np.uint64((1 << bits) - 1)
+    return palette, values.reshape(-1)[:SECTION_VOLUME].astype(np.int64)
+
+
+def encode_block_states(palette: Sequence, states: np.ndarray) -> nbtlib.Compound:
+    """The `block_states` compound for palette keys and 4096 palette indices.
+    Unused palette entries are dropped.
+    """
+    used, states = np.unique(states, return_inverse=True)
+    block_states = nbtlib.Compound({
+        "palette": nbtlib.List[nbtlib.Compound]([_palette_entry(palette[i]) for i in used.tolist()]),
+    })
+    if len(used) == 1:
+        return block_states
+    bits = _bits_per_block(len(used))
+    per_long = 64 // bits
+    values = np.zeros(-(-SECTION_VOLUME // per_long) * per_long, dtype=np.uint64)
+    values[:SECTION_VOLUME] = states
+    shifts = np.arange(per_long, dtype=np.uint64) * np.uint64(bits)
+    longs = np.bitwise_or.reduce(values.reshape(-1, per_long) << shifts, axis=1)
+    block_states["data"] = nbtlib.LongArray(longs.view(np.int64))
+    return block_states
+
+
+def _set_chunk_blocks(chunk: nbtlib.Compound, x: np.ndarray, y: np.ndarray, z: np.ndarray, keys: list) -> None:
+    """Set blocks in a chunk, given chunk-relative x and z, absolute y and
+    palette keys.
+    """
+    sections = {int(section["Y"]): section for section in chunk["sections"]}
+    for section_y in np.unique(y >> 4).tolist():
+        in_section = np.flatnonzero((y >> 4) == section_y)
+        section = sections.get(section_y)
+        if section is None:
+            nearest = min(sections, key=lambda other: abs(other - section_y))
+            section = nbtlib.Compound({
+                "Y": nbtlib.Byte(section_y),
+                "block_states": nbtlib.Compound({"palette": nbtlib.List[nbtlib.Compound]([_palette_entry(_AIR)])}),
+                "biomes": sections[nearest]["biomes"],
+            })
+            chunk["sections"].append(section)
+            sections[section_y] = section
+        palette, states = decode_block_states(section["block_states"])
+        lookup = {key: i for i, key in enumerate(palette)}
+        for key in dict.fromkeys(keys[i] for i in in_section.tolist()):
+            if key not in lookup:
+                lookup[key] = len(palette)
+                palette.append(key)
+        indices = ((y[in_section] & 15) << 8) | (z[in_section] << 4) | x[in_section]
+        # Where a position repeats, the last block placed there wins
+        indices, last = np.unique(indices[::-1], return_index=True)
+        states[indices] = [lookup[keys[i]] for i in in_section[::-1][last].tolist()]
+        section["block_states"] = encode_block_states(palette, states)
+    # Remove block entities which the new blocks replace
+    if "block_entities" in chunk:
+        replaced = set(zip(
+            (x + chunk["xPos"] * 16).tolist(), y.tolist(), (z + chunk["zPos"] * 16).tolist(),
+        ))
+        chunk["block_entities"] = nbtlib.List[nbtlib.Compound]([
+            entity for entity in chunk["block_entities"]
+            if (int(entity["x"]), int(entity["y"]), int(entity["z"])) not in replaced
+        ])
+    # Make the game relight the chunk and recompute its heightmaps
+    chunk["isLightOn"] = nbtlib.Byte(0)
+    chunk.pop("Heightmaps", None)
+
+
+@dataclass
+class WriteReport:
+    """The chunks touched by a world write.
+
+    Attributes
+    ----------
+    `chunks` : `list[tuple[int, int]]`
+        The chunks written, or which would be written in a dry run.
+    `missing` : `list[tuple[int, int]]`
+        The chunks which would be touched but have not been generated.
+    `skipped` : `list[tuple[int, int]]`
+        The chunks which were not written because their format is unsupported.
+    `n_blocks` : `int`
+        The number of blocks placed in written chunks.
+    """
+    chunks: list[tuple[int, int]] = field(default_factory=list)
+    missing: list[tuple[int, int]] = field(default_factory=list)
+    skipped: list[tuple[int, int]] = field(default_factory=list)
+    n_blocks: int = 0
+
+    def __add__(self, other: "WriteReport") -> "WriteReport":
+        return WriteReport(
+            sorted(self.chunks + other.chunks),
+            sorted(self.missing + other.missing),
+            sorted(self.skipped + other.skipped),
+            self.n_blocks + other.n_blocks,
+        )
+
+
+def _write_region(
+    path: Path,
+    positions: np.ndarray,
+    block_ids: np.ndarray,
+    identifiers: tuple[str, ...],
+    dry_run: bool,
+    compression_level: int,
+) -> WriteReport:
+    """Place blocks in one region file. `positions` is an (n, 3) array of
+    world x, y, z, and `block_ids` index `identifiers`.
+    """
+    region = RegionFile(path)
+    keys = [_block_key(identifier) for identifier in identifiers]
+    chunk_xz = positions[:, [0, 2]] >> 4
+    order = np.lexsort((chunk_xz[:, 0], chunk_xz[:, 1]))
+    positions, block_ids, chunk_xz = positions[order], block_ids[order], chunk_xz[order]
+    starts = np.flatnonzero(np.any(np.diff(chunk_xz, axis=0) != 0, axis=1)) + 1
+    report = WriteReport()
+    for group in np.split(np.arange(len(positions)), starts):
+        if len(group) == 0:
+            continue
+        chunk_x, chunk_z = chunk_xz[group[0]].tolist()
+        if (chunk_x, chunk_z) not in region:
+            report.missing.append((chunk_x, chunk_z))
+            continue
+        if dry_run:
+            report.chunks.append((chunk_x, chunk_z))
+            report.n_blocks += len(group)
+            continue
+        try:
+            chunk = region.read_chunk(chunk_x, chunk_z)
+        except ValueError:
+            chunk = None
+        if chunk is None or "sections" not in chunk:
+            report.skipped.append((chunk_x, chunk_z))
+            continue
+        x, y, z = (positions[group] - [chunk_x * 16, 0, chunk_z * 16]).T
+        _set_chunk_blocks(chunk, x, y, z, [keys[i] for i in block_ids[group].tolist()])
+        region.write_chunk(chunk_x, chunk_z, chunk, compression_level)
+        report.chunks.append((chunk_x, chunk_z))
+        report.n_blocks += len(group)
+    if report.chunks and not dry_run:
+        region.save()
+    return report
+
+
+def _world_blocks(
+    cells: np.ndarray,
+    stack_ids: np.ndarray,
+    stacks: list[list[str]],
+    identifiers: dict[str, int],
+    origin: Vec2[int],
+    y: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """The world positions and block indices of placed stacks, level by level,
+    with later cells overwriting earlier ones.
+    """
+    positions, block_ids = [], []
+    for level in range(max(len(stack) for stack in stacks)):
+        level_ids = np.array([
+            identifiers[stack[level]] if level < len(stack) else -1 for stack in stacks
+        ])[stack_ids]
+        keep = level_ids >= 0
+        level_positions = np.empty((int(keep.sum()), 3), dtype=np.int64)
+        level_positions[:, 0] = cells[keep, 0] + origin.x
+        level_positions[:, 1] = y + level
+        level_positions[:, 2] = cells[keep, 1] + origin.z
+        positions.append(level_positions)
+        block_ids.append(level_ids[keep])
+    return np.concatenate(positions), np.concatenate(block_ids)
+
+
+def write_to_world(
+    world: str | Path,
+    raster: np.ndarray | Sequence[Vec2[int]] | Iterable[np.ndarray],
+    gap_size: int = 0,
+    blocks: lm.BlockState | Sequence[lm.BlockState] | Sequence[Sequence[lm.BlockState]] = lm.BlockState("minecraft:blue_ice"),
+    origin: Vec2[int] = Vec2(0, 0),
+    y: int = 0,
+    layout: Layout | None = None,
+    dimension: str = "minecraft:overworld",
+    dry_run: bool = False,
+    executor: Executor | None = None,
+    compression_level: int = 6,
+) -> WriteReport:
+    """Place a path's blocks directly into the region files of a world save.
+
+    Each region file is edited by one worker, which reads, modifies and
+    recompresses each touched chunk once. Lighting and heightmaps of written
+    chunks are recomputed by the game when they next load. The world must not
+    be open in the game while it is written.
+
+    Parameters
+    ----------
+    `world` : `str` or `Path`
+        The world save directory.
+    `raster` : `numpy.ndarray`, `Sequence[Vec2[int]]` or `Iterable[numpy.ndarray]`
+        The raster of the path, whole or in chunks, e.g., from
+        `Vec2.raster_chunks` or `RasterFile.chunks`.
+    `gap_size` : `int`, default `0`
+        The number of blocks to skip between each included block.
+    `blocks` : `litemapy.BlockState` or `Sequence` thereof, or `Sequence` of `Sequence`s
+        The stack of blocks to place at each position, or, with a `layout`,
+        a sequence of stacks.
+    `origin` : `Vec2[int]`, default `Vec2(0, 0)`
+        The world position of raster cell (0, 0).
+    `y` : `int`, default `0`
+        The world height of the bottom block of each stack.
+    `layout` : `numpy.ndarray` or `Callable[[numpy.ndarray], numpy.ndarray]`, optional
+        The stack index of each raster position. See `commands.fill_runs`.
+    `dimension` : `str`, default `"minecraft:overworld"`
+        The dimension to write in.
+    `dry_run` : `bool`, default `False`
+        Report the chunks which would be touched without writing anything.
+    `executor` : `concurrent.futures.Executor`, optional
+        The executor to edit region files with. A `ProcessPoolExecutor` is
+        created and shut down if not given.
+    `compression_level` : `int`, default `6`
+        The zlib compression level of written chunks.
+
+    Returns
+    -------
+    `report` : `WriteReport`
+        The chunks written, missing and skipped.
+    """
+    region_dir = Path(world) / DIMENSION_DIRS[dimension]
+    if isinstance(raster, np.ndarray) or (
+        isinstance(raster, Sequence) and (len(raster) == 0 or isinstance(raster[0], Vec2))
+    ):
+        raster = [_as_cells(raster)]
+    stacks = [[block.to_block_state_identifier() for block in stack] for stack in _as_stacks(blocks)]
+    identifiers = {identifier: i for i, identifier in enumerate(dict.fromkeys(sum(stacks, [])))}
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor()
+    futures: dict[tuple[int, int], Future] = {}
+    pending: dict[tuple[int, int], list[tuple[np.ndarray, np.ndarray]]] = {}
+
+    def submit(key: tuple[int, int]) -> None:
+        positions, block_ids = zip(*pending.pop(key))
+        if key in futures:
+            # A region the raster returns to is edited after its earlier edit
+            report_parts.append(futures.pop(key).result())
+        futures[key] = executor.submit(
+            _write_region, region_dir / f"r.{key[0]}.{key[1]}.mca",
+            np.concatenate(positions), np.concatenate(block_ids),
+            tuple(identifiers), dry_run, compression_level,
+        )
+
+    report_parts: list[WriteReport] = []
+    try:
+        for cells, stack_ids in _placements(raster, gap_size, layout, len(stacks)):
+            positions, block_ids = _world_blocks(cells, stack_ids, stacks, identifiers, origin, y)
+            regions = positions[:, [0, 2]] >> 9
+            keys = set(map(tuple, np.unique(regions, axis=0).tolist()))
+            for key in keys:
+                in_region = np.all(regions == key, axis=1)
+                pending.setdefault(key, []).append((positions[in_region], block_ids[in_region]))
+            # A straight path is done with a region once it leaves it
+            for key in [key for key in pending if key not in keys]:
+                submit(key)
+        for key in list(pending):
+            submit(key)
+        report = WriteReport()
+        for part in report_parts + [future.result() for future in futures.values()]:
+            report = report + part
+        return report
+    finally:
+        if own_executor:
+            executor.shutdown()
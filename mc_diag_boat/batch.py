@@ -0,0 +1,354 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Batch planning and schematic generation which can be interrupted and
+resumed, recording each finished piece of work in an append-only journal.
+"""
+
+
+from typing import Any, Callable, Collection, Sequence
+from concurrent.futures import Executor, Future, as_completed
+from pathlib import Path
+import hashlib
+import io
+import json
+import os
+import struct
+import time
+import numpy as np
+import nbtlib
+import litemapy as lm
+from .vec2 import Vec2
+from .schematic import _as_cells, _as_stacks, _stack_ids, _region_bounds
+from .litematic import _block_spec, _build_shard, _schematic_root, _write_schematic
+from .service import pareto_job
+
+
+class Journal:
+    """An append-only log of finished work, one JSON record per line.
+
+    Each record is flushed and synced to disk before `record` returns, so
+    every recorded piece of work survives a crash. The first line holds the
+    parameters of the run, and reopening the journal for a different run
+    raises a `ValueError`. A last line cut short by a crash is discarded.
+
+    Parameters
+    ----------
+    `path` : `str` or `Path`
+        The journal file, created if it does not exist.
+    `params` : `dict[str, Any]`
+        The JSON-serializable parameters of the run.
+    """
+
+    def __init__(self, path: str | Path, params: dict[str, Any]) -> None:
+        self.path = Path(path)
+        self.params = json.loads(json.dumps(params))
+        self.records: dict[str, Any] = {}
+        header = None
+        end = 0
+        if self.path.exists():
+            with open(self.path, "rb") as file:
+                data = file.read()
+            for line in data.splitlines(keepends=True):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if entry is None or not line.endswith(b"\n"):
+                    if end + len(line) < len(data):
+                        raise ValueError(f"Corrupt journal record at byte {end} of {self.path}")
+                    break
+                if header is None:
+                    header = entry
+                else:
+                    self.records[entry["key"]] = entry["value"]
+                end += len(line)
+        if header is not None and header.get("params") != self.params:
+            raise ValueError(f"{self.path} is the journal of a run with different parameters")
+        self._file = open(self.path, "ab")
+        # Drop a record cut short by a crash, so new records start on a fresh line
+        self._file.truncate(end)
+        if header is None:
+            self._append({"params": self.params})
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.records
+
+    def __getitem__(self, key: str) -> Any:
+        return self.records[key]
+
+    def _append(self, entry: dict[str, Any]) -> None:
+        self._file.write(json.dumps(entry, separators=(",", ":")).encode() + b"\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record(self, key: str, value: Any) -> Any:
+        """Durably record a finished piece of work.
+
+        Parameters
+        ----------
+        `key` : `str`
+            The name of the piece of work.
+        `value`
+            Its JSON-serializable result.
+
+        Returns
+        -------
+        `value`
+            The result as it will be read back from the journal, so that
+            resumed and uninterrupted runs see identical values.
+        """
+        value = json.loads(json.dumps(value))
+        self._append({"key": key, "value": value})
+        self.records[key] = value
+        return value
+
+    def close(self) -> None:
+        """Close the journal file."""
+        self._file.close()
+
+
+def _durable_write(path: Path, data: bytes) -> None:
+    """Write a file so that it either holds all of `data` or is left as before."""
+    temp = path.with_name(path.name + ".tmp")
+    with open(temp, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, path)
+
+
+def _run(
+    journal: Journal,
+    tasks: dict[str, tuple[Callable[..., Any], tuple]],
+    finish: Callable[[str, Any], Any],
+    executor: Executor | None,
+    redo: Collection[str] = (),
+) -> None:
+    """Run the tasks which are not yet in the journal, or are in `redo`,
+    recording the value `finish` makes of each result as soon as it is ready.
+    """
+    pending = {key: task for key, task in tasks.items() if key not in journal or key in redo}
+    if executor is None:
+        for key, (function, args) in pending.items():
+            journal.record(key, finish(key, function(*args)))
+        return
+    futures: dict[Future, str] = {executor.submit(function, *args): key for key, (function, args) in pending.items()}
+    try:
+        for future in as_completed(futures):
+            key = futures[future]
+            journal.record(key, finish(key, future.result()))
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def plan_routes(
+    routes: Sequence[tuple[Vec2[int], Vec2[int]]],
+    journal: str | Path,
+    n_angles: int = 4,
+    max_pattern_len: int = 64,
+    executor: Executor | None = None,
+) -> list[list[dict[str, Any]]]:
+    """The pareto front of patterns for each route, recording each finished
+    route in a journal so that an interrupted run can be resumed.
+
+    Parameters
+    ----------
+    `routes` : `Sequence[tuple[Vec2[int], Vec2[int]]]`
+        The origin and destination of each route.
+    `journal` : `str` or `Path`
+        The journal file. Rerunning with the same journal and parameters
+        skips every route already recorded.
+    `n_angles`, `max_pattern_len`
+        As for `service.pareto_job`.
+    `executor` : `concurrent.futures.Executor`, optional
+        An executor to plan routes in parallel. Routes are planned in order,
+        one at a time, if not given.
+
+    Returns
+    -------
+    `fronts` : `list[list[dict[str, Any]]]`
+        The records of `service.pareto_job` for each route, in order, as read
+        back from the journal.
+    """
+    # Checked before the journal is created, so bad parameters leave no journal behind
+    if not 1 <= n_angles <= 256:
+        raise ValueError("n_angles must be in [1, 256]")
+    offsets = [(destination - origin).as_tuple() for origin, destination in routes]
+    params = {"kind": "routes", "offsets": offsets, "n_angles": n_angles, "max_pattern_len": max_pattern_len}
+    with Journal(journal, params) as log:
+        _run(
+            log,
+            {str(index): (pareto_job, (offset, n_angles, max_pattern_len)) for index, offset in enumerate(offsets)},
+            lambda key, front: front,
+            executor,
+        )
+        return [log[str(index)] for index in range(len(offsets))]
+
+
+def _part_path(directory: Path, name: str, batch: int) -> Path:
+    return directory / f"{name}.litematic.part{batch:05d}"
+
+
+def save_path_schematics(
+    paths: Sequence[tuple[str, Vec2]],
+    directory: str | Path,
+    journal: str | Path,
+    gap_size: int = 0,
+    blocks: lm.BlockState | Sequence[lm.BlockState] | Sequence[Sequence[lm.BlockState]] = lm.BlockState("minecraft:blue_ice"),
+    regions_per_batch: int = 4096,
+    compression_level: int = 6,
+    executor: Executor | None = None,
+) -> list[Path]:
+    """Build and save the schematic of each path, as `generate_schematic`
+    would, recording progress in a journal so that an interrupted run can be
+    resumed.
+
+    The regions of each path are built in batches. Each finished batch is
+    saved to a part file next to the schematic and recorded in the journal,
+    and the schematic is assembled from the parts once all are done, after
+    which they are deleted. A rerun with the same journal skips every
+    recorded batch and schematic, rebuilding only batches whose part file
+    is gone, and writes files identical to those of an uninterrupted run,
+    down to the creation time, which is recorded when the run first starts.
+
+    Parameters
+    ----------
+    `paths` : `Sequence[tuple[str, Vec2]]`
+        The name and offset of each path, as passed to `generate_schematic`.
+        Each schematic is saved as `<name>.litematic` in `directory`, so the
+        names must be unique.
+    `directory` : `str` or `Path`
+        The directory to save the schematics in.
+    `journal` : `str` or `Path`
+        The journal file.
+    `gap_size`, `blocks`
+        As for `generate_schematic`.
+    `regions_per_batch` : `int`, default `4096`
+        The number of regions built and recorded at a time.
+    `compression_level` : `int`, default `6`
+        The gzip compression level, from `0` (fastest) to `9` (smallest).
+    `executor` : `concurrent.futures.Executor`, optional
+        An executor to build batches in parallel, e.g., a `ProcessPoolExecutor`.
+
+    Returns
+    -------
+    `files` : `list[Path]`
+        The saved schematic of each path, in order.
+    """
+    if regions_per_batch < 1:
+        raise ValueError("regions_per_batch must be positive")
+    names = [name for name, _ in paths]
+    if len(set(names)) != len(names):
+        raise ValueError("Path names must be unique")
+    directory = Path(directory)
+    stacks = _as_stacks(blocks)
+    stack_specs = [[_block_spec(block) for block in stack] for stack in stacks]
+    params = {
+        "kind": "schematics",
+        "paths": [(name, offset.as_tuple()) for name, offset in paths],
+        "directory": str(directory),
+        "gap_size": gap_size,
+        "blocks": stack_specs,
+        "regions_per_batch": regions_per_batch,
+        "compression_level": compression_level,
+    }
+    files = []
+    with Journal(journal, params) as log:
+        created = log["created"] if "created" in log else log.record("created", int(time.time() * 1000))
+        for name, offset in paths:
+            file = directory / f"{name}.litematic"
+            files.append(file)
+            if f"schematic/{name}" in log:
+                continue
+            cells = _as_cells(offset.raster_array())
+            stack_ids = _stack_ids(cells, gap_size, None, len(stacks))
+            placed = np.flatnonzero(stack_ids >= 0)
+            cells, stack_ids = cells[placed], stack_ids[placed]
+            bounds = _region_bounds(cells)
+            if not bounds:
+                raise ValueError(f"Path {name} has no regions")
+            tasks = {}
+            for batch, first in enumerate(range(0, len(bounds), regions_per_batch)):
+                batch_bounds = bounds[first:first + regions_per_batch]
+                start, stop = batch_bounds[0][0], batch_bounds[-1][1]
+                tasks[f"batch/{name}/{batch}"] = (_build_shard, (
+                    cells[start:stop], stack_ids[start:stop], None,
+                    [(a - start, b - start) for a, b in batch_bounds], stack_specs,
+                ))
+
+            def finish(key: str, results: list[tuple[bytes, int, int, tuple[int, ...]]]) -> dict[str, Any]:
+                # Regions are named by their index in the whole schematic
+                batch = int(key.rsplit("/", 1)[1])
+                buffer = io.BytesIO()
+                for index, (payload, *_) in enumerate(results, batch * regions_per_batch):
+                    region_name = str(index).encode()
+                    buffer.write(b"\x0a" + struct.pack(">H", len(region_name)) + region_name)
+                    buffer.write(payload)
+                data = buffer.getvalue()
+                _durable_write(_part_path(directory, name, batch), data)
+                corners = np.array([result[3] for result in results])
+                return {
+                    "regions": len(results),
+                    "blocks": int(sum(result[1] for result in results)),
+                    "volume": int(sum(result[2] for result in results)),
+                    "low": corners[:, :3].min(axis=0).tolist(),
+                    "high": corners[:, 3:].max(axis=0).tolist(),
+                    "sha256": hashlib.sha256(data).hexdigest(),
+                }
+
+            # A recorded batch whose part file is gone is built again
+            lost = {key for batch, key in enumerate(tasks) if key in log and not _part_path(directory, name, batch).exists()}
+            _run(log, tasks, finish, executor, lost)
+            batches = [log[key] for key in tasks]
+            low = np.min([batch["low"] for batch in batches], axis=0)
+            high = np.max([batch["high"] for batch in batches], axis=0)
+            schem = lm.Schematic(name=name, author="mc_diag_boat")
+            schem.created = schem.modified = created
+            root = _schematic_root(
+                schem,
+                tuple((high - low + 1).tolist()),
+                sum(batch["regions"] for batch in batches),
+                sum(batch["blocks"] for batch in batches),
+                sum(batch["volume"] for batch in batches),
+            )
+            buffer = io.BytesIO()
+            nbtlib.File(root).write(buffer)
+            # The root ends with the empty Regions compound's end tag, then its own
+            buffer.seek(-2, io.SEEK_END)
+            for batch, record in enumerate(batches):
+                data = _part_path(directory, name, batch).read_bytes()
+                if hashlib.sha256(data).hexdigest() != record["sha256"]:
+                    raise ValueError(f"Part {batch} of {name} does not match the journal")
+                buffer.write(data)
+            buffer.write(b"\x00\x00")
+            temp = file.with_name(file.name + ".tmp")
+            _write_schematic(temp, buffer.getvalue(), compression_level, None)
+            with open(temp, "rb+") as handle:
+                os.fsync(handle.fileno())
+            os.replace(temp, file)
+            log.record(f"schematic/{name}", {"file": str(file), "regions": sum(batch["regions"] for batch in batches)})
+            for batch in range(len(batches)):
+                _part_path(directory, name, batch).unlink(missing_ok=True)
+    return files
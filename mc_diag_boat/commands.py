@@ -0,0 +1,287 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from typing import Iterable, Iterator, NamedTuple, Sequence
+from pathlib import Path
+import numpy as np
+import litemapy as lm
+from .vec2 import Vec2
+from .schematic import Layout, _as_cells, _as_stacks, _stack_ids
+
+
+MAX_COMMANDS = 65536
+MAX_FILL_VOLUME = 32768
+
+
+class Run(NamedTuple):
+    """Cells which share a block stack and lie in a straight, axis-aligned,
+    unbroken line.
+    """
+    start: tuple[int, int]
+    step: tuple[int, int]
+    length: int
+    stack_id: int
+
+
+def _placements(
+    chunks: Iterable[np.ndarray],
+    gap_size: int,
+    layout: Layout | None,
+    n_stacks: int,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """The placed cells and their stack indices, one chunk at a time, leaving
+    the endpoint of the whole raster empty.
+    """
+    index = 0
+    held: tuple[np.ndarray, np.ndarray] | None = None
+    for chunk in chunks:
+        cells = _as_cells(chunk)
+        if len(cells) == 0:
+            continue
+        stack_ids = _stack_ids(
+            np.concatenate((cells, cells[-1:])),
+            gap_size,
+            None if layout is None else _chunk_layout(layout, cells, index),
+            n_stacks,
+            index,
+        )[:-1]
+        if held is not None:
+            yield held
+        # The last cell of each chunk is held back in case it is the endpoint
+        held_mask = stack_ids[-1:] >= 0
+        placed = stack_ids[:-1] >= 0
+        yield cells[:-1][placed], stack_ids[:-1][placed]
+        held = cells[-1:][held_mask], stack_ids[-1:][held_mask]
+        index += len(cells)
+
+
+def _chunk_layout(layout: Layout, cells: np.ndarray, index: int) -> np.ndarray:
+    if callable(layout):
+        return np.append(layout(cells), -1)
+    return np.append(np.asarray(layout[index:index + len(cells)]), -1)
+
+
+def fill_runs(
+    chunks: Iterable[np.ndarray],
+    gap_size: int = 0,
+    layout: Layout | None = None,
+    n_stacks: int = 1,
+) -> Iterator[Run]:
+    """Merge the placed cells of a raster into straight runs.
+
+    Parameters
+    ----------
+    `chunks` : `Iterable[numpy.ndarray]`
+        Consecutive chunks of the raster, e.g., from `Vec2.raster_chunks` or
+        `RasterFile.chunks`. A whole raster array may be passed in a list.
+    `gap_size` : `int`, default `0`
+        The number of blocks to skip between each included block.
+    `layout` : `numpy.ndarray` or `Callable[[numpy.ndarray], numpy.ndarray]`, optional
+        The stack index of each raster position. An array is sliced by the
+        position of each chunk, so it may be memory mapped. A callable is called
+        with the cells of each chunk in turn.
+    `n_stacks` : `int`, default `1`
+        The number of stacks the layout may refer to.
+
+    Returns
+    -------
+    `runs` : `Iterator[Run]`
+        The runs, in raster order. Placing each run's stack along it, in order,
+        gives the same blocks as `schematic_from_raster`.
+    """
+    open_run: Run | None = None
+    last_cell = np.zeros(2, dtype=np.int64)
+    for cells, stack_ids in _placements(chunks, gap_size, layout, n_stacks):
+        if len(cells) == 0:
+            continue
+        if open_run is not None:
+            cells = np.concatenate((last_cell[None], cells))
+            stack_ids = np.concatenate(([open_run.stack_id], stack_ids))
+        # A repeated cell with the same stack adds nothing
+        steps = np.diff(cells, axis=0)
+        repeat = np.zeros(len(cells), dtype=bool)
+        repeat[1:] = np.all(steps == 0, axis=1) & (stack_ids[1:] == stack_ids[:-1])
+        cells, stack_ids = cells[~repeat], stack_ids[~repeat]
+        steps = np.diff(cells, axis=0)
+        link = (np.abs(steps).sum(axis=1) == 1) & (stack_ids[1:] == stack_ids[:-1])
+        turn = np.zeros(len(steps), dtype=bool)
+        turn[1:] = link[:-1] & np.any(steps[1:] != steps[:-1], axis=1)
+        if open_run is not None and open_run.length > 1 and len(steps) > 0:
+            turn[0] = tuple(steps[0].tolist()) != open_run.step
+        starts = np.concatenate(([0], np.flatnonzero(~link | turn) + 1))
+        lengths = np.diff(np.append(starts, len(cells)))
+        runs = [
+            Run(
+                tuple(cells[start].tolist()),
+                tuple(steps[start].tolist()) if length > 1 else (0, 0),
+                int(length),
+                int(stack_ids[start]),
+            )
+            for start, length in zip(starts.tolist(), lengths.tolist())
+        ]
+        if open_run is not None:
+            runs[0] = Run(
+                open_run.start,
+                open_run.step if open_run.length > 1 else runs[0].step,
+                open_run.length + runs[0].length - 1,
+                open_run.stack_id,
+            )
+        yield from runs[:-1]
+        open_run = runs[-1]
+        last_cell = cells[-1]
+    if open_run is not None:
+        yield open_run
+
+
+def block_id(block: lm.BlockState) -> str:
+    """The block state argument for commands, e.g., `minecraft:lever[face=floor]`.
+
+    Parameters
+    ----------
+    `block` : `litemapy.BlockState`
+        The block state.
+
+    Returns
+    -------
+    `block_id` : `str`
+        The block id followed by its properties, if any.
+    """
+    return block.to_block_state_identifier()
+
+
+def run_commands(
+    runs: Iterable[Run],
+    blocks: lm.BlockState | Sequence[lm.BlockState] | Sequence[Sequence[lm.BlockState]],
+    origin: Vec2[int] = Vec2(0, 0),
+    y: int = 0,
+) -> Iterator[str]:
+    """The `fill` and `setblock` commands which place each run's block stack.
+
+    Levels of a stack which hold the same block are filled together, and runs
+    are split where needed to stay within the `fill` volume limit.
+
+    Parameters
+    ----------
+    `runs` : `Iterable[Run]`
+        The runs to place, e.g., from `fill_runs`.
+    `blocks` : `litemapy.BlockState` or `Sequence` thereof, or `Sequence` of `Sequence`s
+        The block stack, or stacks, referred to by the runs.
+    `origin` : `Vec2[int]`, default `Vec2(0, 0)`
+        The world position of raster cell (0, 0).
+    `y` : `int`, default `0`
+        The world height of the bottom block of each stack.
+
+    Returns
+    -------
+    `commands` : `Iterator[str]`
+        The commands, without leading slashes, in placement order.
+    """
+    # Each stack as (first level, last level, block id) groups
+    groups = []
+    for stack in _as_stacks(blocks):
+        stack_groups: list[tuple[int, int, str]] = []
+        for level, block_state in enumerate(stack):
+            name = block_id(block_state)
+            if stack_groups and stack_groups[-1][2] == name:
+                stack_groups[-1] = (stack_groups[-1][0], level, name)
+            else:
+                stack_groups.append((level, level, name))
+        groups.append(stack_groups)
+    for (x, z), (step_x, step_z), length, stack_id in runs:
+        stack_groups = groups[stack_id]
+        max_length = MAX_FILL_VOLUME // max(top - bottom + 1 for bottom, top, _ in stack_groups)
+        for first in range(0, length, max_length):
+            last = min(first + max_length, length) - 1
+            x1, z1 = origin.x + x + step_x * first, origin.z + z + step_z * first
+            x2, z2 = origin.x + x + step_x * last, origin.z + z + step_z * last
+            for bottom, top, name in stack_groups:
+                if first == last and bottom == top:
+                    yield f"setblock {x1} {y + bottom} {z1} {name}"
+                else:
+                    yield f"fill {x1} {y + bottom} {z1} {x2} {y + top} {z2} {name}"
+
+
+def export_mcfunction(
+    directory: str | Path,
+    name: str,
+    raster: np.ndarray | Sequence[Vec2[int]] | Iterable[np.ndarray],
+    gap_size: int = 0,
+    blocks: lm.BlockState | Sequence[lm.BlockState] | Sequence[Sequence[lm.BlockState]] = lm.BlockState("minecraft:blue_ice"),
+    origin: Vec2[int] = Vec2(0, 0),
+    y: int = 0,
+    layout: Layout | None = None,
+    max_commands: int = MAX_COMMANDS,
+) -> list[Path]:
+    """Write the commands which build a path to `.mcfunction` files.
+
+    Commands are generated and written as the raster is read, so memory use
+    does not grow with the length of the path. Each file holds at most
+    `max_commands` commands, so it can run within the game's command chain
+    limit. All chunks a file places blocks in must be loaded when it runs.
+
+    Parameters
+    ----------
+    `directory` : `str` or `Path`
+        The directory to write to, e.g., a datapack's `function` directory.
+    `name` : `str`
+        The file name stem. Files are numbered, e.g., `name_0000.mcfunction`.
+    `raster` : `numpy.ndarray`, `Sequence[Vec2[int]]` or `Iterable[numpy.ndarray]`
+        The raster of the path, whole or in chunks, e.g., from
+        `Vec2.raster_chunks` or `RasterFile.chunks`.
+    `gap_size` : `int`, default `0`
+        The number of blocks to skip between each included block.
+    `blocks` : `litemapy.BlockState` or `Sequence` thereof, or `Sequence` of `Sequence`s
+        The stack of blocks to place at each position, or, with a `layout`,
+        a sequence of stacks.
+    `origin` : `Vec2[int]`, default `Vec2(0, 0)`
+        The world position of raster cell (0, 0).
+    `y` : `int`, default `0`
+        The world height of the bottom block of each stack.
+    `layout` : `numpy.ndarray` or `Callable[[numpy.ndarray], numpy.ndarray]`, optional
+        The stack index of each raster position. See `fill_runs`.
+    `max_commands` : `int`, default `65536`
+        The maximum number of commands in each file.
+
+    Returns
+    -------
+    `paths` : `list[Path]`
+        The files written, in the order they should be run.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    if isinstance(raster, np.ndarray) or (
+        isinstance(raster, Sequence) and (len(raster) == 0 or isinstance(raster[0], Vec2))
+    ):
+        raster = [_as_cells(raster)]
+    runs = fill_runs(raster, gap_size, layout, len(_as_stacks(blocks)))
+    paths: list[Path] = []
+    file = None
+    n_commands = max_commands
+    try:
+        for command in run_commands(runs, blocks, origin, y):
+            if n_commands == max_commands:
+                if file is not None:
+                    file.close()
+                paths.append(directory / f"{name}_{len(paths):04d}.mcfunction")
+                file = open(paths[-1], "w")
+                n_commands = 0
+            file.write(command + "\n")
+            n_commands += 1
+    finally:
+        if file is not None:
+            file.close()
+    return paths
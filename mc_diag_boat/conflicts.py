@@ -0,0 +1,273 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Checking planned paths against blocks already in a world or schematic."""
+
+
+from typing import Callable, Iterable, Sequence
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+import numpy as np
+import litemapy as lm
+from .vec2 import Vec2
+from .schematic import _as_cells, _as_levels, _block_array
+from .anvil import DIMENSION_DIRS, RegionFile, decode_block_states
+
+
+AIR_BLOCKS = frozenset({"minecraft:air", "minecraft:cave_air", "minecraft:void_air"})
+_Y_OFFSET = 1 << 12
+
+
+def _chunk_keys(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+    """Keys of positions within their chunks, which sort by y, z, x."""
+    return ((y + _Y_OFFSET) << 8) | ((z & 15) << 4) | (x & 15)
+
+
+@dataclass
+class Conflicts:
+    """The occupied positions a path would pass through.
+
+    Attributes
+    ----------
+    `positions` : `numpy.ndarray`
+        The `(n, 3)` world x, y and z of each occupied position, in path order.
+    `chunks` : `list[tuple[int, int]]`
+        The chunks containing those positions.
+    """
+    positions: np.ndarray
+    chunks: list[tuple[int, int]]
+
+    def __bool__(self) -> bool:
+        return len(self.positions) > 0
+
+
+class BlockIndex:
+    """An index of occupied block positions, keyed by chunk.
+
+    Chunks are loaded on first use and at most `max_chunks` are kept, so large
+    worlds are never held in memory at once.
+
+    Parameters
+    ----------
+    `load_chunk` : `Callable[[int, int], numpy.ndarray]`
+        Returns the sorted keys, as from `_chunk_keys`, of the occupied
+        positions in a chunk.
+    `max_chunks` : `int`, default `4096`
+        The number of loaded chunks to keep.
+    """
+
+    def __init__(self, load_chunk: Callable[[int, int], np.ndarray], max_chunks: int = 4096) -> None:
+        self._load_chunk = load_chunk
+        self._max_chunks = max_chunks
+        self._chunks: OrderedDict[tuple[int, int], np.ndarray] = OrderedDict()
+
+    @classmethod
+    def from_world(
+        cls,
+        world: str | Path,
+        dimension: str = "minecraft:overworld",
+        ignore: Iterable[str] = AIR_BLOCKS,
+        max_chunks: int = 4096,
+    ) -> "BlockIndex":
+        """Index the blocks of a world save. Chunks which have not been
+        generated are empty.
+
+        Parameters
+        ----------
+        `world` : `str` or `Path`
+            The world save directory.
+        `dimension` : `str`, default `"minecraft:overworld"`
+            The dimension to index.
+        `ignore` : `Iterable[str]`, default `AIR_BLOCKS`
+            Block ids which do not count as occupied, e.g., to also allow
+            paths through `"minecraft:short_grass"`.
+        `max_chunks` : `int`, default `4096`
+            The number of loaded chunks to keep.
+        """
+        region_dir = Path(world) / DIMENSION_DIRS[dimension]
+        ignore = frozenset(ignore)
+        regions: OrderedDict[tuple[int, int], RegionFile] = OrderedDict()
+
+        def load_chunk(chunk_x: int, chunk_z: int) -> np.ndarray:
+            key = (chunk_x >> 5, chunk_z >> 5)
+            if key in regions:
+                regions.move_to_end(key)
+            else:
+                regions[key] = RegionFile(region_dir / f"r.{key[0]}.{key[1]}.mca")
+                if len(regions) > 4:
+                    regions.popitem(last=False)
+            chunk = regions[key].read_chunk(chunk_x, chunk_z)
+            if chunk is None:
+                return np.zeros(0, dtype=np.int64)
+            keys = []
+            for section in chunk.get("sections", []):
+                if "block_states" not in section:
+                    continue
+                palette, states = decode_block_states(section["block_states"])
+                occupied = np.array([block_id not in ignore for block_id, _ in palette])
+                if not occupied.any():
+                    continue
+                # States are in y, z, x order, like the keys
+                local = np.flatnonzero(occupied[states])
+                keys.append(((int(section["Y"]) * 16 + _Y_OFFSET) << 8) + local)
+            return np.sort(np.concatenate(keys)) if keys else np.zeros(0, dtype=np.int64)
+
+        return cls(load_chunk, max_chunks)
+
+    @classmethod
+    def from_schematics(
+        cls,
+        schematics: Iterable[lm.Schematic | tuple[lm.Schematic, tuple[int, int, int]]],
+        ignore: Iterable[str] = AIR_BLOCKS,
+    ) -> "BlockIndex":
+        """Index the blocks of litematica schematics, e.g., existing builds
+        or other planned paths.
+
+        Parameters
+        ----------
+        `schematics` : `Iterable[litemapy.Schematic]`
+            The schematics, each optionally paired with the world x, y and z it
+            is placed at. Schematics without a position are placed at the origin.
+        `ignore` : `Iterable[str]`, default `AIR_BLOCKS`
+            Block ids which do not count as occupied.
+        """
+        ignore = frozenset(ignore)
+        positions = []
+        for schematic in schematics:
+            schematic, (x, y, z) = schematic if isinstance(schematic, tuple) else (schematic, (0, 0, 0))
+            for region in schematic.regions.values():
+                palette = region._Region__palette
+                occupied = np.array([block.id not in ignore for block in palette])
+                stored = np.argwhere(occupied[_block_array(region)])
+                positions.append(stored + [
+                    x + region.min_schem_x(), y + region.min_schem_y(), z + region.min_schem_z(),
+                ])
+        positions = np.concatenate(positions) if positions else np.zeros((0, 3), dtype=np.int64)
+        chunks: dict[tuple[int, int], np.ndarray] = {}
+        if len(positions) > 0:
+            chunk_xz = positions[:, [0, 2]] >> 4
+            order = np.lexsort((chunk_xz[:, 1], chunk_xz[:, 0]))
+            positions, chunk_xz = positions[order], chunk_xz[order]
+            starts = np.flatnonzero(np.any(np.diff(chunk_xz, axis=0) != 0, axis=1)) + 1
+            for group in np.split(np.arange(len(positions)), starts):
+                x, y, z = positions[group].T
+                chunks[tuple(chunk_xz[group[0]].tolist())] = np.unique(_chunk_keys(x, y, z))
+        empty = np.zeros(0, dtype=np.int64)
+        return cls(lambda chunk_x, chunk_z: chunks.get((chunk_x, chunk_z), empty), max_chunks=len(chunks) + 1)
+
+    def chunk(self, chunk_x: int, chunk_z: int) -> np.ndarray:
+        """The sorted keys of the occupied positions in a chunk."""
+        key = (chunk_x, chunk_z)
+        if key in self._chunks:
+            self._chunks.move_to_end(key)
+            return self._chunks[key]
+        keys = self._load_chunk(chunk_x, chunk_z)
+        self._chunks[key] = keys
+        if len(self._chunks) > self._max_chunks:
+            self._chunks.popitem(last=False)
+        return keys
+
+    def occupied(self, positions: np.ndarray) -> np.ndarray:
+        """Whether each of an `(n, 3)` array of world positions is occupied."""
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 3)
+        x, y, z = positions.T
+        keys = _chunk_keys(x, y, z)
+        chunk_xz = positions[:, [0, 2]] >> 4
+        result = np.zeros(len(positions), dtype=bool)
+        if len(positions) == 0:
+            return result
+        order = np.lexsort((chunk_xz[:, 1], chunk_xz[:, 0]))
+        starts = np.flatnonzero(np.any(np.diff(chunk_xz[order], axis=0) != 0, axis=1)) + 1
+        for group in np.split(order, starts):
+            occupied = self.chunk(*chunk_xz[group[0]].tolist())
+            if len(occupied) == 0:
+                continue
+            found = np.minimum(np.searchsorted(occupied, keys[group]), len(occupied) - 1)
+            result[group] = occupied[found] == keys[group]
+        return result
+
+    def check_path(
+        self,
+        raster: np.ndarray | Sequence[Vec2[int]],
+        origin: Vec2[int] = Vec2(0, 0),
+        levels: int | np.ndarray = 0,
+        height: int = 3,
+        margin: int = 0,
+    ) -> Conflicts:
+        """Find the occupied positions in the space a path needs.
+
+        Parameters
+        ----------
+        `raster` : `numpy.ndarray` or `Sequence[Vec2[int]]`
+            The raster of the path.
+        `origin` : `Vec2[int]`, default `Vec2(0, 0)`
+            The world position of raster cell (0, 0).
+        `levels` : `int` or `numpy.ndarray`, default `0`
+            The height of the path's bottom block, or of each raster position,
+            e.g., from `heightmap.path_levels`.
+        `height` : `int`, default `3`
+            The number of blocks from the bottom block upwards which must be
+            free, e.g., the road block and the space for a boat and its rider.
+        `margin` : `int`, default `0`
+            The number of blocks to each side of the raster which must also be
+            free. A boat is 1.375 blocks wide, so it overhangs the neighbours
+            of its raster cell slightly; use `1` to keep those clear as well.
+
+        Returns
+        -------
+        `conflicts` : `Conflicts`
+            The occupied positions and their chunks.
+        """
+        cells = _as_cells(raster) + [origin.x, origin.z]
+        cell_levels = _as_levels(levels, len(cells))
+        offsets = np.arange(-margin, margin + 1)
+        around = np.stack(np.meshgrid(offsets, offsets, indexing="ij"), axis=-1).reshape(-1, 2)
+        # Positions in path order: each cell, its neighbours, then upwards
+        columns = (cells[:, None] + around[None]).reshape(-1, 2)
+        column_levels = np.repeat(cell_levels, len(around))
+        positions = np.empty((len(columns), height, 3), dtype=np.int64)
+        positions[..., 0] = columns[:, None, 0]
+        positions[..., 1] = column_levels[:, None] + np.arange(height)
+        positions[..., 2] = columns[:, None, 1]
+        positions = positions.reshape(-1, 3)
+        _, first = np.unique(positions, axis=0, return_index=True)
+        positions = positions[np.sort(first)]
+        positions = positions[self.occupied(positions)]
+        chunks = sorted(set(map(tuple, (positions[:, [0, 2]] >> 4).tolist())))
+        return Conflicts(positions, chunks)
+
+    def check_paths(
+        self,
+        paths: Iterable[tuple[np.ndarray | Sequence[Vec2[int]], Vec2[int]]],
+        levels: int | Sequence[int | np.ndarray] = 0,
+        height: int = 3,
+        margin: int = 0,
+    ) -> list[Conflicts]:
+        """Check many paths, each given as its raster and origin. See
+        `check_path`.
+
+        Paths are checked in order, so listing nearby paths together lets them
+        share loaded chunks.
+        """
+        paths = list(paths)
+        if isinstance(levels, int):
+            levels = [levels] * len(paths)
+        return [
+            self.check_path(raster, origin, path_levels, height, margin)
+            for (raster, origin), path_levels in zip(paths, levels)
+        ]
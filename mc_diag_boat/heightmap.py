@@ -0,0 +1,206 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Terrain heights for placing paths over uneven ground."""
+
+
+from typing import Sequence
+from pathlib import Path
+import numpy as np
+import nbtlib
+from .vec2 import Vec2
+from .schematic import _as_cells, _region_bounds
+from .anvil import DIMENSION_DIRS, RegionFile, decode_block_states
+
+
+MISSING = np.iinfo(np.int32).min
+_AIR_BLOCKS = {"minecraft:air", "minecraft:cave_air", "minecraft:void_air"}
+
+
+class Heightmap:
+    """The surface height of each column in a rectangle of the world, i.e.,
+    the lowest height above the terrain at which blocks can be placed.
+
+    Parameters
+    ----------
+    `heights` : `numpy.ndarray`
+        An integer array of surface heights, indexed by `[x, z]` relative to
+        `origin`. May be memory mapped, e.g., from `numpy.load(path, mmap_mode="r")`.
+        Columns with no known height hold `MISSING`.
+    `origin` : `Vec2[int]`, default `Vec2(0, 0)`
+        The world position of `heights[0, 0]`.
+    """
+
+    def __init__(self, heights: np.ndarray, origin: Vec2[int] = Vec2(0, 0)) -> None:
+        if heights.ndim != 2:
+            raise ValueError("heights must be a 2D array")
+        self.heights = heights
+        self.origin = origin
+
+    @classmethod
+    def open(cls, path: str | Path, origin: Vec2[int] = Vec2(0, 0)) -> "Heightmap":
+        """Memory map a heightmap saved as a `.npy` file, e.g., by `from_world`."""
+        return cls(np.load(path, mmap_mode="r"), origin)
+
+    @classmethod
+    def from_world(
+        cls,
+        world: str | Path,
+        low: Vec2[int],
+        high: Vec2[int],
+        dimension: str = "minecraft:overworld",
+        kind: str = "MOTION_BLOCKING",
+        path: str | Path | None = None,
+    ) -> "Heightmap":
+        """Extract the heightmap of a rectangle of a world save.
+
+        Heights are read from the chunks' stored heightmaps. Chunks without
+        one, e.g., after `anvil.write_to_world`, use the highest non-air block
+        instead. Columns in chunks which have not been generated are `MISSING`.
+
+        Parameters
+        ----------
+        `world` : `str` or `Path`
+            The world save directory.
+        `low`, `high` : `Vec2[int]`
+            The minimum and maximum corners of the rectangle, inclusive.
+        `dimension` : `str`, default `"minecraft:overworld"`
+            The dimension to read.
+        `kind` : `str`, default `"MOTION_BLOCKING"`
+            The stored heightmap to read, e.g., `"MOTION_BLOCKING_NO_LEAVES"`
+            or `"OCEAN_FLOOR"`.
+        `path` : `str` or `Path`, optional
+            A `.npy` file to write the heights to, so the result is memory
+            mapped and can be reopened with `open`.
+
+        Returns
+        -------
+        `heightmap` : `Heightmap`
+            The heights of the rectangle, with `low` as its origin.
+        """
+        region_dir = Path(world) / DIMENSION_DIRS[dimension]
+        shape = (high.x - low.x + 1, high.z - low.z + 1)
+        if path is None:
+            heights = np.full(shape, MISSING, dtype=np.int32)
+        else:
+            heights = np.lib.format.open_memmap(path, mode="w+", dtype=np.int32, shape=shape)
+            heights[:] = MISSING
+        for region_x in range(low.x >> 9, (high.x >> 9) + 1):
+            for region_z in range(low.z >> 9, (high.z >> 9) + 1):
+                region = RegionFile(region_dir / f"r.{region_x}.{region_z}.mca")
+                for chunk_x in range(max(low.x >> 4, region_x * 32), min(high.x >> 4, region_x * 32 + 31) + 1):
+                    for chunk_z in range(max(low.z >> 4, region_z * 32), min(high.z >> 4, region_z * 32 + 31) + 1):
+                        if (chunk_x, chunk_z) not in region:
+                            continue
+                        columns = _chunk_heights(region.read_chunk(chunk_x, chunk_z), kind)
+                        # The part of the chunk inside the rectangle
+                        x0, z0 = chunk_x * 16, chunk_z * 16
+                        x_start, x_stop = max(low.x, x0), min(high.x, x0 + 15) + 1
+                        z_start, z_stop = max(low.z, z0), min(high.z, z0 + 15) + 1
+                        heights[x_start - low.x:x_stop - low.x, z_start - low.z:z_stop - low.z] = \
+                            columns[x_start - x0:x_stop - x0, z_start - z0:z_stop - z0]
+        if path is not None:
+            heights.flush()
+        return cls(heights, low)
+
+    def at(self, cells: np.ndarray | Sequence[Vec2[int]]) -> np.ndarray:
+        """The surface heights at world positions.
+
+        Parameters
+        ----------
+        `cells` : `numpy.ndarray` or `Sequence[Vec2[int]]`
+            The `(n, 2)` world x and z positions to look up.
+
+        Returns
+        -------
+        `heights` : `numpy.ndarray`
+            An integer array of shape `(n,)`.
+        """
+        cells = _as_cells(cells)
+        x = cells[:, 0] - self.origin.x
+        z = cells[:, 1] - self.origin.z
+        outside = (x < 0) | (z < 0) | (x >= self.heights.shape[0]) | (z >= self.heights.shape[1])
+        if np.any(outside):
+            raise ValueError(f"{int(outside.sum())} positions are outside of the heightmap")
+        heights = np.asarray(self.heights[x, z], dtype=np.int64)
+        if np.any(heights == MISSING):
+            raise ValueError(f"{int((heights == MISSING).sum())} positions have no known height")
+        return heights
+
+
+def _chunk_heights(chunk: nbtlib.Compound, kind: str) -> np.ndarray:
+    """The surface heights of a chunk, indexed by `[x, z]`."""
+    sections = [section for section in chunk["sections"] if "block_states" in section]
+    min_section = min(int(section["Y"]) for section in sections)
+    min_y = int(chunk.get("yPos", min_section)) * 16
+    world_height = (max(int(section["Y"]) for section in sections) + 1) * 16 - min_y
+    if kind in chunk.get("Heightmaps", {}):
+        # Entries do not span longs, and are stored relative to the world bottom
+        bits = int(world_height).bit_length()
+        per_long = 64 // bits
+        longs = np.asarray(chunk["Heightmaps"][kind]).astype(np.int64).view(np.uint64)
+        shifts = np.arange(per_long, dtype=np.uint64) * np.uint64(bits)
+        values = (longs[:, None] >> shifts) & np.uint64((1 << bits) - 1)
+        return values.reshape(-1)[:256].astype(np.int32).reshape(16, 16).T + min_y
+    heights = np.full((16, 16), min_y, dtype=np.int32)
+    for section in sorted(sections, key=lambda section: int(section["Y"])):
+        palette, states = decode_block_states(section["block_states"])
+        solid = np.array([block_id not in _AIR_BLOCKS for block_id, _ in palette])[states].reshape(16, 16, 16)
+        # Indexed [y, z, x]; the highest solid block of each column, if any
+        has_solid = solid.any(axis=0)
+        top = 15 - np.argmax(solid[::-1], axis=0)
+        heights = np.where(has_solid.T, int(section["Y"]) * 16 + top.T + 1, heights)
+    return heights
+
+
+def path_levels(
+    raster: np.ndarray | Sequence[Vec2[int]],
+    heightmap: Heightmap,
+    origin: Vec2[int] = Vec2(0, 0),
+    clearance: int = 0,
+    per_region: bool = False,
+) -> np.ndarray:
+    """The height of the bottom block at each position of a path, a constant
+    clearance above the terrain.
+
+    Parameters
+    ----------
+    `raster` : `numpy.ndarray` or `Sequence[Vec2[int]]`
+        The raster of the path.
+    `heightmap` : `Heightmap`
+        The terrain heights.
+    `origin` : `Vec2[int]`, default `Vec2(0, 0)`
+        The world position of raster cell (0, 0).
+    `clearance` : `int`, default `0`
+        The number of blocks between the terrain surface and the path.
+    `per_region` : `bool`, default `False`
+        Use one level for each chunk-sized region of the path, clearing the
+        highest terrain in it, rather than following the terrain block by block.
+
+    Returns
+    -------
+    `levels` : `numpy.ndarray`
+        An integer array of shape `(len(raster),)`, e.g., for the `levels` of
+        `schematic.generate_schematic`. The schematic should then be placed with
+        its origin at `(origin.x, 0, origin.z)`.
+    """
+    cells = _as_cells(raster)
+    levels = heightmap.at(cells + [origin.x, origin.z]) + clearance
+    if per_region and len(cells) > 0:
+        starts = np.array([start for start, _ in _region_bounds(cells)])
+        levels = np.repeat(np.maximum.reduceat(levels, starts), np.diff(np.append(starts, len(cells))))
+    return levels
@@ -0,0 +1,551 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Fast reading and writing of litematica files, including building and
+saving the schematic of a path across worker processes.
+"""
+
+
+from typing import Iterable, Iterator, Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+import io
+import gzip
+import struct
+import numpy as np
+import nbtlib
+from nbtlib.tag import Int, Long, String, Compound, List
+import litemapy as lm
+from litemapy.info import LITEMAPY_NAME, LITEMAPY_VERSION
+from .vec2 import Vec2
+from .conflicts import AIR_BLOCKS
+from .schematic import (
+    Layout, _as_cells, _as_levels, _as_stacks, _stack_ids, _region_bounds,
+    _block_array, _fill_region, _copy_region, _template_key,
+)
+
+
+GZIP_BLOCK_SIZE = 1 << 22
+
+
+def pack_bits(values: np.ndarray, nbits: int) -> np.ndarray:
+    """Pack non-negative integers into longs, `nbits` bits each, the way
+    litematica does: entries are stored from the lowest bit up and may span
+    two longs.
+
+    Parameters
+    ----------
+    `values` : `numpy.ndarray`
+        The integers to pack, each less than `2 ** nbits`.
+    `nbits` : `int`
+        The number of bits per entry, at most 64.
+
+    Returns
+    -------
+    `longs` : `numpy.ndarray`
+        A signed 64-bit integer array of length `ceil(len(values) * nbits / 64)`.
+    """
+    values = np.asarray(values).astype(np.uint64).ravel()
+    longs = np.zeros(-(-len(values) * nbits // 64), dtype=np.uint64)
+    if len(values) == 0:
+        return longs.view(np.int64)
+    start = np.arange(len(values), dtype=np.uint64) * np.uint64(nbits)
+    index = (start >> np.uint64(6)).astype(np.int64)
+    offset = start & np.uint64(63)
+    # Each long is the union of the entries starting in it, plus the high part
+    # of at most one entry spilling over from the previous long
+    firsts = np.flatnonzero(np.diff(index, prepend=-1))
+    longs[index[firsts]] = np.bitwise_or.reduceat(values << offset, firsts)
+    spill = np.flatnonzero(offset + np.uint64(nbits) > np.uint64(64))
+    longs[index[spill] + 1] |= values[spill] >> (np.uint64(64) - offset[spill])
+    return longs.view(np.int64)
+
+
+def unpack_bits(longs: np.ndarray, size: int, nbits: int) -> np.ndarray:
+    """Unpack `size` integers of `nbits` bits each from longs, the inverse of
+    `pack_bits`.
+
+    Parameters
+    ----------
+    `longs` : `numpy.ndarray`
+        The packed 64-bit integers.
+    `size` : `int`
+        The number of entries.
+    `nbits` : `int`
+        The number of bits per entry.
+
+    Returns
+    -------
+    `values` : `numpy.ndarray`
+        A signed 64-bit integer array of shape `(size,)`.
+    """
+    longs = np.asarray(longs).astype(np.int64).view(np.uint64)
+    if len(longs) != -(-size * nbits // 64):
+        raise ValueError(f"Expected {-(-size * nbits // 64)} longs for {size} entries of {nbits} bits, not {len(longs)}")
+    start = np.arange(size, dtype=np.uint64) * np.uint64(nbits)
+    index = (start >> np.uint64(6)).astype(np.int64)
+    offset = start & np.uint64(63)
+    spill = offset + np.uint64(nbits) > np.uint64(64)
+    values = longs[index] >> offset
+    high = longs[np.minimum(index + 1, len(longs) - 1)] << np.where(spill, np.uint64(64) - offset, np.uint64(0))
+    values |= np.where(spill, high, np.uint64(0))
+    return (values & np.uint64((1 << nbits) - 1)).astype(np.int64)
+
+
+def _needed_bits(palette_size: int) -> int:
+    return max(int(palette_size - 1).bit_length(), 2)
+
+
+def region_to_nbt(region: lm.Region) -> Compound:
+    """The NBT of a region, as `litemapy.Region.to_nbt` produces, with the
+    block states packed in bulk rather than one at a time.
+    """
+    region._optimize_palette()
+    palette = region._Region__palette
+    root = Compound()
+    root["Position"] = Compound({"x": Int(region.x), "y": Int(region.y), "z": Int(region.z)})
+    root["Size"] = Compound({"x": Int(region.width), "y": Int(region.height), "z": Int(region.length)})
+    root["BlockStatePalette"] = List[Compound]([block.to_nbt() for block in palette])
+    root["Entities"] = List[Compound]([entity.to_nbt() for entity in region.entities])
+    root["TileEntities"] = List[Compound]([tile_entity.to_nbt() for tile_entity in region.tile_entities])
+    root["PendingBlockTicks"] = List[Compound](region.block_ticks)
+    root["PendingFluidTicks"] = List[Compound](region.fluid_ticks)
+    # Block states are stored in y, z, x order
+    states = _block_array(region).transpose(1, 2, 0)
+    root["BlockStates"] = nbtlib.LongArray(pack_bits(states, _needed_bits(len(palette))))
+    return root
+
+
+def _schematic_root(
+    schem: lm.Schematic,
+    enclosing_size: tuple[int, int, int],
+    n_regions: int,
+    total_blocks: int,
+    total_volume: int,
+    save_soft: bool = True,
+) -> Compound:
+    """The root of a schematic's NBT, as `litemapy.Schematic.to_nbt` produces,
+    with an empty `Regions` compound as its last entry.
+    """
+    root = Compound()
+    root["Version"] = Int(schem.lm_version)
+    root["SubVersion"] = Int(schem.lm_subversion)
+    root["MinecraftDataVersion"] = Int(schem.mc_version)
+    meta = Compound()
+    meta["EnclosingSize"] = Compound({
+        "x": Int(enclosing_size[0]), "y": Int(enclosing_size[1]), "z": Int(enclosing_size[2]),
+    })
+    meta["Author"] = String(schem.author)
+    meta["Description"] = String(schem.description)
+    meta["Name"] = String(schem.name)
+    if save_soft:
+        meta["Software"] = String(LITEMAPY_NAME + "_" + LITEMAPY_VERSION)
+    meta["RegionCount"] = Int(n_regions)
+    meta["TimeCreated"] = Long(schem.created)
+    meta["TimeModified"] = Long(schem.modified)
+    meta["TotalBlocks"] = Int(total_blocks)
+    meta["TotalVolume"] = Int(total_volume)
+    meta["PreviewImageData"] = schem._Schematic__preview
+    root["Metadata"] = meta
+    root["Regions"] = Compound()
+    return root
+
+
+def schematic_to_nbt(schem: lm.Schematic, save_soft: bool = True) -> Compound:
+    """The NBT of a schematic, as `litemapy.Schematic.to_nbt` produces, using
+    `region_to_nbt` for its regions.
+    """
+    if len(schem.regions) < 1:
+        raise ValueError("Empty schematic does not have any regions")
+    regions = schem.regions.values()
+    root = _schematic_root(
+        schem,
+        (schem.width, schem.height, schem.length),
+        len(regions),
+        sum(region.count_blocks() for region in regions),
+        sum(region.volume() for region in regions),
+        save_soft,
+    )
+    for name, region in schem.regions.items():
+        root["Regions"][name] = region_to_nbt(region)
+    return root
+
+
+def gzip_compress(
+    data: bytes,
+    compression_level: int = 6,
+    executor: Executor | None = None,
+    block_size: int = GZIP_BLOCK_SIZE,
+) -> bytes:
+    """Gzip data, optionally compressing blocks of it in parallel.
+
+    With an `executor`, the data is split into blocks which are compressed
+    separately and concatenated as gzip members. Such files are read as one
+    stream by gzip readers, including Minecraft's and litematica's, and are
+    slightly bigger than a single member.
+
+    Parameters
+    ----------
+    `data` : `bytes`
+        The data to compress.
+    `compression_level` : `int`, default `6`
+        The gzip compression level, from `0` (fastest) to `9` (smallest).
+    `executor` : `concurrent.futures.Executor`, optional
+        The executor to compress blocks with. A `ThreadPoolExecutor` suffices,
+        as zlib releases the GIL.
+    `block_size` : `int`, default `4 MiB`
+        The size of each block of uncompressed data.
+
+    Returns
+    -------
+    `compressed` : `bytes`
+        The gzipped data.
+    """
+    compress = partial(gzip.compress, compresslevel=compression_level, mtime=0)
+    if executor is None or len(data) <= block_size:
+        return compress(data)
+    blocks = [data[start:start + block_size] for start in range(0, len(data), block_size)]
+    return b"".join(executor.map(compress, blocks))
+
+
+def _write_schematic(path: str | Path, nbt_data: bytes, compression_level: int, executor: Executor | None) -> None:
+    with open(path, "wb") as file:
+        file.write(gzip_compress(nbt_data, compression_level, executor))
+
+
+def save_schematic(
+    schem: lm.Schematic,
+    path: str | Path,
+    compression_level: int = 6,
+    executor: Executor | None = None,
+    update_meta: bool = True,
+    save_soft: bool = True,
+) -> None:
+    """Save a schematic, as `litemapy.Schematic.save` does, but with bulk block
+    state packing and a choice of compression.
+
+    Parameters
+    ----------
+    `schem` : `litemapy.Schematic`
+        The schematic to save.
+    `path` : `str` or `Path`
+        The file to write.
+    `compression_level` : `int`, default `6`
+        The gzip compression level, from `0` (fastest) to `9` (smallest).
+    `executor` : `concurrent.futures.Executor`, optional
+        An executor to compress blocks of the file in parallel. See
+        `gzip_compress`.
+    `update_meta` : `bool`, default `True`
+        Set the schematic's modified time to now.
+    `save_soft` : `bool`, default `True`
+        Record litemapy as the software in the metadata.
+    """
+    if update_meta:
+        schem.update_metadata()
+    buffer = io.BytesIO()
+    nbtlib.File(schematic_to_nbt(schem, save_soft)).write(buffer)
+    _write_schematic(path, buffer.getvalue(), compression_level, executor)
+
+
+def _block_spec(block: lm.BlockState) -> tuple[str, dict[str, str]]:
+    """A picklable description of a block state, which litemapy's are not."""
+    return block.id, dict(block._BlockState__properties)
+
+
+def _build_shard(
+    cells: np.ndarray,
+    stack_ids: np.ndarray,
+    levels: np.ndarray | None,
+    bounds: list[tuple[int, int]],
+    stack_specs: list[list[tuple[str, dict[str, str]]]],
+) -> list[tuple[bytes, int, int, tuple[int, ...]]]:
+    """Build and serialize the regions of one shard of placed cells.
+
+    Returns, for each region, its NBT payload, block count, volume and
+    minimum and maximum schematic coordinates.
+    """
+    stacks = [[lm.BlockState(block_id, **properties) for block_id, properties in stack] for stack in stack_specs]
+    templates: dict[bytes, lm.Region] = {}
+    results = []
+    for start, stop in bounds:
+        region_cells = cells[start:stop]
+        region_stack_ids = stack_ids[start:stop]
+        y = 0 if levels is None else levels[start]
+        key = _template_key(region_cells, region_stack_ids)
+        if key in templates:
+            region = _copy_region(templates[key], region_cells, y)
+        else:
+            region = templates[key] = _fill_region(region_cells, region_stack_ids, stacks, y)
+        buffer = io.BytesIO()
+        region_to_nbt(region).write(buffer)
+        corners = (
+            region.min_schem_x(), region.min_schem_y(), region.min_schem_z(),
+            region.max_schem_x(), region.max_schem_y(), region.max_schem_z(),
+        )
+        results.append((buffer.getvalue(), region.count_blocks(), region.volume(), corners))
+    return results
+
+
+def save_path_schematic(
+    path: str | Path,
+    raster: Sequence[Vec2[int]] | np.ndarray,
+    gap_size: int = 0,
+    blocks: lm.BlockState | Sequence[lm.BlockState] | Sequence[Sequence[lm.BlockState]] = lm.BlockState("minecraft:blue_ice"),
+    name: str | None = None,
+    layout: Layout | None = None,
+    levels: int | np.ndarray | None = None,
+    executor: Executor | None = None,
+    n_shards: int | None = None,
+    compression_level: int = 6,
+) -> int:
+    """Build and save the schematic of a path, with regions built and
+    serialized across worker processes.
+
+    The file holds the same regions, in the same order, as saving the result of
+    `schematic.schematic_from_raster`, so paths too long to build comfortably
+    in one process can use all cores. The regions are not kept in memory.
+
+    Parameters
+    ----------
+    `path` : `str` or `Path`
+        The file to write.
+    `raster` : `Sequence[Vec2[int]]` or `numpy.ndarray`
+        The block positions of the path.
+    `gap_size`, `blocks`, `name`, `layout`, `levels`
+        As for `schematic.schematic_from_raster`.
+    `executor` : `concurrent.futures.Executor`, optional
+        The executor to build regions and compress with. A
+        `ProcessPoolExecutor` is created and shut down if not given.
+    `n_shards` : `int`, optional
+        The number of contiguous groups of regions to build, one per task.
+        Defaults to 4 per CPU.
+    `compression_level` : `int`, default `6`
+        The gzip compression level, from `0` (fastest) to `9` (smallest).
+
+    Returns
+    -------
+    `n_regions` : `int`
+        The number of regions written.
+    """
+    cells = _as_cells(raster)
+    stacks = _as_stacks(blocks)
+    stack_ids = _stack_ids(cells, gap_size, layout, len(stacks))
+    all_levels = _as_levels(levels, len(cells))
+    placed = np.flatnonzero(stack_ids >= 0)
+    cells, stack_ids = cells[placed], stack_ids[placed]
+    levels = None if all_levels is None else all_levels[placed]
+    bounds = _region_bounds(cells, levels)
+    if not bounds:
+        raise ValueError("Empty schematic does not have any regions")
+    stack_specs = [[_block_spec(block) for block in stack] for stack in stacks]
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor()
+    try:
+        if n_shards is None:
+            n_shards = 4 * (getattr(executor, "_max_workers", None) or 1)
+        edges = np.linspace(0, len(bounds), min(n_shards, len(bounds)) + 1).astype(int)
+        futures = []
+        for first, last in zip(edges[:-1], edges[1:]):
+            start, stop = bounds[first][0], bounds[last - 1][1]
+            futures.append(executor.submit(
+                _build_shard,
+                cells[start:stop],
+                stack_ids[start:stop],
+                None if levels is None else levels[start:stop],
+                [(a - start, b - start) for a, b in bounds[first:last]],
+                stack_specs,
+            ))
+        results = [result for future in futures for result in future.result()]
+        corners = np.array([result[3] for result in results])
+        low, high = corners[:, :3].min(axis=0), corners[:, 3:].max(axis=0)
+        schem = lm.Schematic(name=lm.info.DEFAULT_NAME if name is None else name, author="mc_diag_boat")
+        root = _schematic_root(
+            schem,
+            tuple((high - low + 1).tolist()),
+            len(results),
+            sum(result[1] for result in results),
+            sum(result[2] for result in results),
+        )
+        buffer = io.BytesIO()
+        nbtlib.File(root).write(buffer)
+        # The root ends with the empty Regions compound's end tag, then its own
+        buffer.seek(-2, io.SEEK_END)
+        for index, (payload, *_) in enumerate(results):
+            region_name = str(index).encode()
+            buffer.write(b"\x0a" + struct.pack(">H", len(region_name)) + region_name)
+            buffer.write(payload)
+        buffer.write(b"\x00\x00")
+        _write_schematic(path, buffer.getvalue(), compression_level, executor)
+        return len(results)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+_NBT_FIXED_SIZES = {1: 1, 2: 2, 3: 4, 4: 8, 5: 4, 6: 8}
+_NBT_FIXED_FORMATS = {1: ">b", 2: ">h", 3: ">i", 4: ">q", 5: ">f", 6: ">d"}
+_NBT_ARRAY_TYPES = {7: ">i1", 11: ">i4", 12: ">i8"}
+_REGION_KEYS = frozenset({"Position", "Size", "BlockStatePalette", "BlockStates"})
+
+
+def _nbt_string(data: bytes, pos: int) -> tuple[str, int]:
+    (length,) = struct.unpack_from(">H", data, pos)
+    return data[pos + 2:pos + 2 + length].decode("utf-8", errors="surrogateescape"), pos + 2 + length
+
+
+def _nbt_skip(data: bytes, pos: int, tag: int) -> int:
+    """The position after a payload of type `tag` starting at `pos`."""
+    if tag in _NBT_FIXED_SIZES:
+        return pos + _NBT_FIXED_SIZES[tag]
+    if tag in _NBT_ARRAY_TYPES:
+        (length,) = struct.unpack_from(">i", data, pos)
+        return pos + 4 + length * np.dtype(_NBT_ARRAY_TYPES[tag]).itemsize
+    if tag == 8:
+        return _nbt_string(data, pos)[1]
+    if tag == 9:
+        item, length = struct.unpack_from(">bi", data, pos)
+        pos += 5
+        if item in _NBT_FIXED_SIZES:
+            return pos + length * _NBT_FIXED_SIZES[item]
+        for _ in range(length):
+            pos = _nbt_skip(data, pos, item)
+        return pos
+    if tag == 10:
+        while (child := data[pos]) != 0:
+            pos = _nbt_skip(data, _nbt_string(data, pos + 1)[1], child)
+        return pos + 1
+    raise ValueError(f"Unknown NBT tag type {tag}")
+
+
+def _nbt_read(data: bytes, pos: int, tag: int, keys: frozenset[str] | None = None) -> tuple[object, int]:
+    """Decode a payload of type `tag` starting at `pos` into plain Python and
+    numpy values, and the position after it. Compounds only decode `keys`,
+    if given, and skip their other entries.
+    """
+    if tag in _NBT_FIXED_FORMATS:
+        return struct.unpack_from(_NBT_FIXED_FORMATS[tag], data, pos)[0], pos + _NBT_FIXED_SIZES[tag]
+    if tag in _NBT_ARRAY_TYPES:
+        (length,) = struct.unpack_from(">i", data, pos)
+        return np.frombuffer(data, _NBT_ARRAY_TYPES[tag], length, pos + 4), _nbt_skip(data, pos, tag)
+    if tag == 8:
+        return _nbt_string(data, pos)
+    if tag == 9:
+        item, length = struct.unpack_from(">bi", data, pos)
+        pos += 5
+        values = []
+        for _ in range(length):
+            value, pos = _nbt_read(data, pos, item)
+            values.append(value)
+        return values, pos
+    if tag == 10:
+        values = {}
+        while (child := data[pos]) != 0:
+            name, pos = _nbt_string(data, pos + 1)
+            if keys is None or name in keys:
+                values[name], pos = _nbt_read(data, pos, child)
+            else:
+                pos = _nbt_skip(data, pos, child)
+        return values, pos + 1
+    raise ValueError(f"Unknown NBT tag type {tag}")
+
+
+def _iter_regions(data: bytes) -> Iterator[tuple[str, dict]]:
+    """The name and block data of each region of an uncompressed litematic."""
+    if data[0] != 10:
+        raise ValueError("Not a litematic: the root tag is not a compound")
+    pos = _nbt_string(data, 1)[1]
+    while (tag := data[pos]) != 0:
+        name, pos = _nbt_string(data, pos + 1)
+        if name != "Regions" or tag != 10:
+            pos = _nbt_skip(data, pos, tag)
+            continue
+        while (child := data[pos]) != 0:
+            region_name, pos = _nbt_string(data, pos + 1)
+            region, pos = _nbt_read(data, pos, child, _REGION_KEYS)
+            yield region_name, region
+        return
+    raise ValueError("Not a litematic: no regions")
+
+
+def iter_region_blocks(
+    path: str | Path,
+    ignore: Iterable[str] = AIR_BLOCKS,
+) -> Iterator[tuple[str, np.ndarray, np.ndarray, list[str]]]:
+    """The blocks of each region of a litematica file, one region at a time.
+
+    Only the position, size, palette and block states of each region are
+    decoded, and block states are unpacked in bulk, without creating an
+    object per block.
+
+    Parameters
+    ----------
+    `path` : `str` or `Path`
+        The `.litematic` file.
+    `ignore` : `Iterable[str]`, default `AIR_BLOCKS`
+        Block ids to leave out.
+
+    Yields
+    ------
+    `name` : `str`
+        The name of the region.
+    `positions` : `numpy.ndarray`
+        An integer array of shape `(n, 3)` of the schematic `x`, `y` and `z`
+        coordinates of the region's blocks, in y, z, x order.
+    `states` : `numpy.ndarray`
+        The index into `palette` of each block.
+    `palette` : `list[str]`
+        The block id of each palette entry.
+    """
+    ignore = frozenset(ignore)
+    with open(path, "rb") as file:
+        data = gzip.decompress(file.read())
+    for name, region in _iter_regions(data):
+        position = [region["Position"][axis] for axis in "xyz"]
+        size = [region["Size"][axis] for axis in "xyz"]
+        # Negative sizes extend the region from its position towards lower coordinates
+        low = np.array([p + s + 1 if s < 0 else p for p, s in zip(position, size)], dtype=np.int64)
+        width, height, length = (abs(s) for s in size)
+        palette = [block["Name"] for block in region["BlockStatePalette"]]
+        states = unpack_bits(region["BlockStates"], width * height * length, _needed_bits(len(palette)))
+        kept = np.flatnonzero(np.array([block not in ignore for block in palette], dtype=bool)[states])
+        y, z, x = np.unravel_index(kept, (height, length, width))
+        yield name, np.stack((x, y, z), axis=1) + low, states[kept], palette
+
+
+def read_cells(path: str | Path, ignore: Iterable[str] = AIR_BLOCKS) -> np.ndarray:
+    """The columns of a litematica file which hold any block, e.g., the raster
+    of a path built by `schematic_from_raster`.
+
+    Parameters
+    ----------
+    `path` : `str` or `Path`
+        The `.litematic` file.
+    `ignore` : `Iterable[str]`, default `AIR_BLOCKS`
+        Block ids which do not count as a block.
+
+    Returns
+    -------
+    `cells` : `numpy.ndarray`
+        An integer array of shape `(n, 2)` of the unique schematic `x` and `z`
+        coordinates, sorted by `x` then `z`.
+    """
+    columns = [positions[:, [0, 2]] for _, positions, _, _ in iter_region_blocks(path, ignore)]
+    if not columns:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(columns), axis=0)
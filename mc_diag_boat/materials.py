@@ -0,0 +1,245 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from typing import Mapping, Sequence
+from dataclasses import dataclass, field
+from math import ceil
+import numpy as np
+from numpy.typing import ArrayLike
+import litemapy as lm
+from .vec2 import Vec2
+from .schematic import Layout, _as_stacks, _stack_ids
+
+
+STACK_SIZE = 64
+SHULKER_SLOTS = 27
+
+
+@dataclass(frozen=True)
+class BillOfMaterials:
+    """The number of each item needed to build one or more paths.
+    """
+    counts: dict[str, int] = field(default_factory=dict)
+    stack_sizes: Mapping[str, int] = field(default_factory=dict)
+
+    def __add__(self, other: "BillOfMaterials") -> "BillOfMaterials":
+        counts = dict(self.counts)
+        for item, count in other.counts.items():
+            counts[item] = counts.get(item, 0) + count
+        return BillOfMaterials(counts, {**other.stack_sizes, **self.stack_sizes})
+
+    def total(self) -> int:
+        """The total number of items.
+
+        Returns
+        -------
+        `total` : `int`
+            The sum of all item counts.
+        """
+        return sum(self.counts.values())
+
+    def stacks(self) -> dict[str, int]:
+        """The number of inventory slots needed for each item.
+
+        Returns
+        -------
+        `stacks` : `dict[str, int]`
+            The count of each item divided by its stack size (64, unless given
+            in `stack_sizes`), rounded up.
+        """
+        return {
+            item: ceil(count / self.stack_sizes.get(item, STACK_SIZE))
+            for item, count in self.counts.items()
+        }
+
+    def shulkers(self) -> int:
+        """The number of shulker boxes needed to carry all items, if each slot
+        holds only one item type.
+
+        Returns
+        -------
+        `shulkers` : `int`
+            The total number of stacks divided by 27, rounded up.
+        """
+        return ceil(sum(self.stacks().values()) / SHULKER_SLOTS)
+
+
+def raster_lengths(offsets: ArrayLike) -> np.ndarray:
+    """The number of positions in the raster of each offset, without computing
+    the rasters.
+
+    Parameters
+    ----------
+    `offsets` : `ArrayLike`
+        An array of shape `(..., 2)` of path endpoints relative to block (0, 0),
+        as passed to `generate_schematic`.
+
+    Returns
+    -------
+    `lengths` : `numpy.ndarray`
+        An integer array of shape `(...)`, equal to `len(Vec2(x, z).raster())`
+        for each offset.
+    """
+    offsets = np.asarray(offsets, dtype=float)
+    return np.ceil(np.abs(offsets).max(axis=-1)).astype(np.int64) + 1
+
+
+def placed_counts(offsets: ArrayLike, gap_sizes: ArrayLike) -> np.ndarray:
+    """The number of positions at which a block stack is placed, for every
+    combination of offset and gap size.
+
+    Counts are computed in closed form. Only offsets with fractional
+    coordinates need their rasters computed, and only for a gap size of `0`,
+    as those are the only rasters which can place twice at a position.
+
+    Parameters
+    ----------
+    `offsets` : `ArrayLike`
+        An array of shape `(n_offsets, 2)` of path endpoints.
+    `gap_sizes` : `ArrayLike`
+        An array of shape `(n_gap_sizes,)` of non-negative gap sizes.
+
+    Returns
+    -------
+    `counts` : `numpy.ndarray`
+        An integer array of shape `(n_offsets, n_gap_sizes)`, matching the
+        number of stacked positions in the schematics `generate_schematic`
+        would create.
+    """
+    offsets = np.asarray(offsets, dtype=float).reshape(-1, 2)
+    lengths = raster_lengths(offsets)
+    gap_sizes = np.asarray(gap_sizes, dtype=np.int64).reshape(-1)
+    if np.any(gap_sizes < 0):
+        raise ValueError("gap_sizes must be non-negative")
+    # Every (gap_size + 1)th position is placed, except for the endpoint
+    counts = (lengths[:, None] - 1 + gap_sizes) // (gap_sizes + 1)
+    if np.any(gap_sizes == 0):
+        fractional = np.flatnonzero(np.any(offsets % 1 != 0, axis=1))
+        repeats = np.array([
+            _repeated_positions(Vec2(*offsets[index]).raster_array()[:-1])
+            for index in fractional
+        ], dtype=np.int64)
+        counts[np.ix_(fractional, gap_sizes == 0)] -= repeats[:, None]
+    return counts
+
+
+def _repeated_positions(cells: np.ndarray) -> int:
+    """The number of cells which repeat the cell before them.
+    """
+    return int(np.count_nonzero(np.all(cells[1:] == cells[:-1], axis=1)))
+
+
+def bill_of_materials(
+    offset: Vec2,
+    gap_size: int = 0,
+    blocks: lm.BlockState | Sequence[lm.BlockState] | Sequence[Sequence[lm.BlockState]] = lm.BlockState("minecraft:blue_ice"),
+    layout: Layout | None = None,
+    stack_sizes: Mapping[str, int] | None = None,
+) -> BillOfMaterials:
+    """The items needed to build the path to the given offset, without
+    generating its schematic.
+
+    Parameters
+    ----------
+    `offset` : `Vec2`
+        The position of the endpoint of the path, as passed to `generate_schematic`.
+    `gap_size` : `int`, default `0`
+        The number of blocks to skip between each included block.
+    `blocks` : `litemapy.BlockState` or `Sequence` thereof, or `Sequence` of `Sequence`s
+        The stack of blocks to place at each position, or, with a `layout`,
+        a sequence of stacks.
+    `layout` : `numpy.ndarray` or `Callable[[numpy.ndarray], numpy.ndarray]`, optional
+        The index of the stack to place at each raster position, as passed to
+        `generate_schematic`. Only with a layout is the raster computed.
+    `stack_sizes` : `Mapping[str, int]`, optional
+        The stack size of items which do not stack to 64.
+
+    Returns
+    -------
+    `materials` : `BillOfMaterials`
+        The count of each block id.
+    """
+    stacks = _as_stacks(blocks)
+    if layout is None:
+        stack_counts = placed_counts([offset.as_tuple()], [gap_size])[0]
+        return _materials(stacks, stack_counts, stack_sizes)
+    cells = offset.raster_array()
+    stack_ids = _stack_ids(cells, gap_size, layout, len(stacks))
+    placed = np.flatnonzero(stack_ids >= 0)
+    placed_ids = stack_ids[placed]
+    # A position placed twice in a row keeps the earlier stack's blocks only
+    # above the height of the later stack
+    overwritten = np.zeros(len(placed), dtype=bool)
+    overwritten[:-1] = np.all(cells[placed[1:]] == cells[placed[:-1]], axis=1)
+    stack_counts = np.bincount(placed_ids[~overwritten], minlength=len(stacks))
+    materials = _materials(stacks, stack_counts, stack_sizes)
+    pairs = np.bincount(
+        placed_ids[:-1][overwritten[:-1]] * len(stacks) + placed_ids[1:][overwritten[:-1]],
+        minlength=len(stacks) ** 2,
+    ).reshape(len(stacks), len(stacks))
+    for earlier, later in zip(*np.nonzero(pairs)):
+        materials += _materials(
+            [stacks[earlier][len(stacks[later]):]],
+            [pairs[earlier, later]],
+            stack_sizes,
+        )
+    return materials
+
+
+def bill_of_materials_sweep(
+    offsets: ArrayLike,
+    gap_sizes: ArrayLike,
+    blocks: lm.BlockState | Sequence[lm.BlockState] = lm.BlockState("minecraft:blue_ice"),
+) -> dict[str, np.ndarray]:
+    """The items needed to build each of many paths at each of many gap sizes,
+    e.g., for budgeting a whole network.
+
+    Parameters
+    ----------
+    `offsets` : `ArrayLike`
+        An array of shape `(n_offsets, 2)` of path endpoints.
+    `gap_sizes` : `ArrayLike`
+        An array of shape `(n_gap_sizes,)` of non-negative gap sizes.
+    `blocks` : `litemapy.BlockState` or `Sequence[litemapy.BlockState]`
+        The stack of blocks to place at each position.
+
+    Returns
+    -------
+    `counts` : `dict[str, numpy.ndarray]`
+        For each block id, an integer array of shape `(n_offsets, n_gap_sizes)`.
+        Sum over the first axis for the totals of a network.
+    """
+    positions = placed_counts(offsets, gap_sizes)
+    per_position: dict[str, int] = {}
+    for block_state in _as_stacks(blocks)[0]:
+        per_position[block_state.id] = per_position.get(block_state.id, 0) + 1
+    return {item: positions * count for item, count in per_position.items()}
+
+
+def _materials(
+    stacks: Sequence[Sequence[lm.BlockState]],
+    stack_counts: Sequence[int] | np.ndarray,
+    stack_sizes: Mapping[str, int] | None,
+) -> BillOfMaterials:
+    counts: dict[str, int] = {}
+    for stack, stack_count in zip(stacks, stack_counts):
+        for block_state in stack:
+            counts[block_state.id] = counts.get(block_state.id, 0) + int(stack_count)
+    return BillOfMaterials(
+        {item: count for item, count in counts.items() if count > 0},
+        dict(stack_sizes or {}),
+    )
@@ -0,0 +1,291 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Finding where planned paths cross or pass close to one another, and
+combining networks of paths into one schematic.
+"""
+
+
+from typing import Iterable, Sequence
+from dataclasses import dataclass
+import numpy as np
+import litemapy as lm
+from .vec2 import Vec2
+from .schematic import Layout, SXN_SIZE, _as_cells, _as_stacks, _stack_ids, _fill_region
+
+
+CONFLICT_RULES = ("first", "last", "tallest")
+
+
+@dataclass(frozen=True)
+class Encounter:
+    """A place where two paths cross or pass within the clearance.
+
+    Attributes
+    ----------
+    `routes` : `tuple[int, int]`
+        The indices of the two paths, lowest first.
+    `kind` : `str`
+        `"crossing"` if the paths share a block or cross diagonally between
+        blocks, otherwise `"near_miss"`.
+    `ranges` : `tuple[tuple[int, int], tuple[int, int]]`
+        The start and stop raster indices of the encounter along each path.
+    `position` : `tuple[int, int]`
+        The world position, on the first path, closest to the second path.
+    `distance` : `int`
+        The smallest Chebyshev distance between the paths, `0` if they share
+        a block.
+    """
+    routes: tuple[int, int]
+    kind: str
+    ranges: tuple[tuple[int, int], tuple[int, int]]
+    position: tuple[int, int]
+    distance: int
+
+
+def _near_pairs(cells: np.ndarray, route_ids: np.ndarray, clearance: int) -> tuple[np.ndarray, np.ndarray]:
+    """The index pairs `(a, b)` of cells on different routes, with
+    `route_ids[a] < route_ids[b]`, within `clearance` of one another.
+
+    Cells are hashed into a grid of `clearance + 1` sized buckets, so only
+    cells in neighbouring buckets are compared.
+    """
+    size = clearance + 1
+    buckets = cells // size
+    # Bucket keys which stay distinct for neighbouring buckets
+    low = buckets.min(axis=0) - 1
+    width = int(buckets[:, 1].max() - low[1]) + 2
+    keys = (buckets[:, 0] - low[0]) * width + (buckets[:, 1] - low[1])
+    order = np.argsort(keys, kind="stable")
+    bucket_keys, bucket_starts, bucket_counts = np.unique(keys[order], return_index=True, return_counts=True)
+    # Routes are in order within each bucket
+    route_low = route_ids[order][bucket_starts]
+    route_high = route_ids[order][bucket_starts + bucket_counts - 1]
+    pairs_a, pairs_b = [], []
+    for dx in (-1, 0, 1):
+        for dz in (-1, 0, 1):
+            # Pairs of occupied buckets, then every pair of cells within them
+            target = bucket_keys + dx * width + dz
+            found = np.minimum(np.searchsorted(bucket_keys, target), len(bucket_keys) - 1)
+            first = np.flatnonzero(bucket_keys[found] == target)
+            second = found[first]
+            # Most neighbouring buckets only hold cells of one route
+            useful = route_high[second] > route_low[first]
+            first, second = first[useful], second[useful]
+            count_a, count_b = bucket_counts[first], bucket_counts[second]
+            n_pairs = count_a * count_b
+            pair = np.repeat(np.arange(len(first)), n_pairs)
+            within = np.arange(len(pair)) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+            a = order[bucket_starts[first][pair] + within // count_b[pair]]
+            b = order[bucket_starts[second][pair] + within % count_b[pair]]
+            keep = route_ids[a] < route_ids[b]
+            a, b = a[keep], b[keep]
+            keep = np.abs(cells[a] - cells[b]).max(axis=1) <= clearance
+            pairs_a.append(a[keep])
+            pairs_b.append(b[keep])
+    return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
+
+def _diagonal_crossings(
+    cells: np.ndarray,
+    route_ids: np.ndarray,
+    a: np.ndarray,
+    b: np.ndarray,
+) -> np.ndarray:
+    """Whether each pair of adjacent cells is where the two paths
+    cross without sharing a block, i.e., path `a` steps diagonally across
+    path `b`'s step between the other two blocks of a 2x2 square.
+    """
+    crossing = np.zeros(len(a), dtype=bool)
+    last = len(cells) - 1
+    for a_step in (-1, 1):
+        a_next = np.clip(a + a_step, 0, last)
+        step = cells[a_next] - cells[a]
+        diagonal = (route_ids[a_next] == route_ids[a]) & np.all(np.abs(step) == 1, axis=1)
+        for b_step in (-1, 1):
+            b_next = np.clip(b + b_step, 0, last)
+            same_route = route_ids[b_next] == route_ids[b]
+            # b and its neighbour are the other corners of a's diagonal step
+            corners = (
+                np.all(cells[b] == cells[a] + step * [1, 0], axis=1)
+                & np.all(cells[b_next] == cells[a] + step * [0, 1], axis=1)
+            )
+            crossing |= diagonal & same_route & corners
+    return crossing
+
+
+def find_encounters(
+    paths: Iterable[tuple[np.ndarray | Sequence[Vec2[int]], Vec2[int]]],
+    clearance: int = 1,
+) -> list[Encounter]:
+    """Find every crossing and near miss between paths.
+
+    The cost grows with the total length of the paths and how crowded they
+    are, not with the number of pairs of paths.
+
+    Parameters
+    ----------
+    `paths` : `Iterable[tuple[numpy.ndarray | Sequence[Vec2[int]], Vec2[int]]]`
+        Each path's raster and the world position of its raster cell (0, 0).
+    `clearance` : `int`, default `1`
+        Paths passing within this Chebyshev distance of each other are a near
+        miss.
+
+    Returns
+    -------
+    `encounters` : `list[Encounter]`
+        The encounters, ordered by route pair and then along the first route.
+        Each run of close positions along a pair of paths is one encounter.
+    """
+    if clearance < 0:
+        raise ValueError("clearance must be non-negative")
+    rasters = [_as_cells(raster) + [origin.x, origin.z] for raster, origin in paths]
+    if sum(len(raster) for raster in rasters) == 0:
+        return []
+    lengths = np.array([len(raster) for raster in rasters])
+    starts = np.cumsum(lengths) - lengths
+    cells = np.concatenate(rasters)
+    route_ids = np.repeat(np.arange(len(rasters)), lengths)
+    a, b = _near_pairs(cells, route_ids, max(clearance, 1))
+    distance = np.abs(cells[a] - cells[b]).max(axis=1)
+    crossing = distance == 0
+    adjacent = np.flatnonzero(distance == 1)
+    crossing[adjacent] = _diagonal_crossings(cells, route_ids, a[adjacent], b[adjacent])
+    keep = (distance <= clearance) | crossing
+    a, b, distance, crossing = a[keep], b[keep], distance[keep], crossing[keep]
+    order = np.lexsort((b, a, route_ids[b], route_ids[a]))
+    a, b, distance, crossing = a[order], b[order], distance[order], crossing[order]
+    if len(a) == 0:
+        return []
+    # An encounter ends where the route pair changes or the first path moves
+    # further along than the clearance allows
+    new_pair = np.any(np.diff(np.stack((route_ids[a], route_ids[b]), axis=1), axis=0) != 0, axis=1)
+    group_starts = np.concatenate(([0], np.flatnonzero(new_pair | (np.diff(a) > 2 * clearance + 1)) + 1))
+    group = np.repeat(np.arange(len(group_starts)), np.diff(np.append(group_starts, len(a))))
+    closest = np.lexsort((distance, group))[group_starts]
+    index_a = a - starts[route_ids[a]]
+    index_b = b - starts[route_ids[b]]
+    columns = zip(
+        route_ids[a[group_starts]].tolist(),
+        route_ids[b[group_starts]].tolist(),
+        np.logical_or.reduceat(crossing, group_starts).tolist(),
+        np.minimum.reduceat(index_a, group_starts).tolist(),
+        (np.maximum.reduceat(index_a, group_starts) + 1).tolist(),
+        np.minimum.reduceat(index_b, group_starts).tolist(),
+        (np.maximum.reduceat(index_b, group_starts) + 1).tolist(),
+        cells[a[closest]].tolist(),
+        distance[closest].tolist(),
+    )
+    return [
+        Encounter(
+            (route_a, route_b),
+            "crossing" if crosses else "near_miss",
+            ((start_a, stop_a), (start_b, stop_b)),
+            tuple(position),
+            closest_distance,
+        )
+        for route_a, route_b, crosses, start_a, stop_a, start_b, stop_b, position, closest_distance in columns
+    ]
+
+
+def network_schematic(
+    paths: Iterable[tuple[np.ndarray | Sequence[Vec2[int]], Vec2[int]]],
+    gap_size: int = 0,
+    blocks: lm.BlockState | Sequence[lm.BlockState] | Sequence[Sequence[lm.BlockState]] = lm.BlockState("minecraft:blue_ice"),
+    name: str | None = None,
+    layouts: Sequence[Layout | None] | None = None,
+    conflict: str = "first",
+    tile_size: int = SXN_SIZE,
+) -> lm.Schematic:
+    """Combine many paths into one schematic, with one region per chunk.
+
+    Blocks where paths overlap, e.g., near a hub, are placed once, so adding
+    paths never adds more regions than the chunks they newly reach.
+
+    Parameters
+    ----------
+    `paths` : `Iterable[tuple[numpy.ndarray | Sequence[Vec2[int]], Vec2[int]]]`
+        Each path's raster and the world position of its raster cell (0, 0).
+    `gap_size` : `int`, default `0`
+        The number of blocks to skip between each included block of each path.
+    `blocks` : `litemapy.BlockState` or `Sequence` thereof, or `Sequence` of `Sequence`s
+        The stack of blocks to place at each position, or, with `layouts`,
+        a sequence of stacks shared by all paths.
+    `name` : `str`, optional
+        The name of the schematic, shown in the Litematica UI.
+    `layouts` : `Sequence[numpy.ndarray | Callable | None]`, optional
+        The layout of each path, as for `schematic.schematic_from_raster`.
+        Must be as long as `paths`.
+    `conflict` : `str`, default `"first"`
+        Which stack is kept where paths place different stacks at the same
+        position: that of the `"first"` or `"last"` path to place one there, or
+        the `"tallest"` stack, with ties going to the first path. Where a path
+        places several stacks at one position, its last is used.
+    `tile_size` : `int`, default `16`
+        The size of the square grid cells regions are confined to. A multiple
+        of the chunk size trades fewer regions for more empty volume.
+
+    Returns
+    -------
+    `schematic` : `litemapy.Schematic`
+        The schematic, in world coordinates, with regions ordered by grid cell.
+    """
+    if conflict not in CONFLICT_RULES:
+        raise ValueError(f"conflict must be one of {CONFLICT_RULES}")
+    paths = list(paths)
+    stacks = _as_stacks(blocks)
+    if layouts is None:
+        layouts = [None] * len(paths)
+    elif len(layouts) != len(paths):
+        raise ValueError("layouts must have one layout per path")
+    all_cells, all_stack_ids, all_routes = [], [], []
+    for route, ((raster, origin), layout) in enumerate(zip(paths, layouts)):
+        cells = _as_cells(raster)
+        stack_ids = _stack_ids(cells, gap_size, layout, len(stacks))
+        placed = stack_ids >= 0
+        all_cells.append(cells[placed] + [origin.x, origin.z])
+        all_stack_ids.append(stack_ids[placed])
+        all_routes.append(np.full(int(placed.sum()), route))
+    cells = np.concatenate(all_cells)
+    if len(cells) == 0:
+        raise ValueError("Empty schematic does not have any regions")
+    stack_ids = np.concatenate(all_stack_ids)
+    routes = np.concatenate(all_routes)
+    # Each path's last stack at a position, then one stack per position by
+    # the conflict rule, as the first of each position in this order
+    placement = np.arange(len(cells))
+    heights = np.array([len(stack) for stack in stacks])[stack_ids]
+    route_order = {"first": routes, "last": -routes, "tallest": routes}[conflict]
+    keys = [-placement, route_order]
+    if conflict == "tallest":
+        keys.append(-heights)
+    order = np.lexsort(keys + [cells[:, 1], cells[:, 0]])
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = np.any(np.diff(cells[order], axis=0) != 0, axis=1)
+    keep = order[first]
+    cells, stack_ids = cells[keep], stack_ids[keep]
+    # Regions follow the chunk grid
+    chunks = cells // tile_size
+    order = np.lexsort((cells[:, 1], cells[:, 0], chunks[:, 1], chunks[:, 0]))
+    cells, stack_ids, chunks = cells[order], stack_ids[order], chunks[order]
+    starts = np.flatnonzero(np.any(np.diff(chunks, axis=0) != 0, axis=1)) + 1
+    if name is None:
+        name = lm.info.DEFAULT_NAME
+    schem = lm.Schematic(name=name, author="mc_diag_boat")
+    for index, group in enumerate(np.split(np.arange(len(cells)), starts)):
+        schem.regions[str(index)] = _fill_region(cells[group], stack_ids[group], stacks)
+    return schem
@@ -15,10 +15,13 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-from typing import Sequence
+from typing import Generic, Iterable, Iterator, Sequence, TypeVar
 import numpy as np
 
 
+_T = TypeVar("_T")
+
+
 def pareto_indices(points: Sequence[Sequence] | np.ndarray) -> np.ndarray:
     """The index of each sequence on the pareto front of all passed sequences.
 
@@ -45,3 +48,212 @@ def pareto_indices(points: Sequence[Sequence] | np.ndarray) -> np.ndarray:
             arr=points,
     ))[0]
 
+
+def epsilon_pareto_indices(
+    points: Sequence[Sequence] | np.ndarray,
+    epsilons: float | Sequence[float] | np.ndarray,
+) -> np.ndarray:
+    """The index of one representative sequence per box of an
+    epsilon-approximate pareto front of all passed sequences.
+
+    Measure space is divided into a grid of boxes, `epsilons` wide along each
+    measure. Only boxes which are not dominated by another box are kept, and
+    each kept box is represented by the single point closest to its best
+    corner. Every point of the exact front is therefore within `epsilons` of a
+    returned point, while the number of returned points is bounded by the
+    number of boxes spanned by all but one measure, regardless of how many
+    near-equivalent points are passed.
+
+    As with `pareto_indices`, this function aims for maximization, so measures
+    which are intended to be minimized should be negated prior to being passed.
+
+    Parameters
+    ----------
+    `points` : `Sequence[Sequence]` or `numpy.ndarray`
+        A sequence of sequences or 2D numpy array of numeric measures, one
+        inner sequence per object.
+    `epsilons` : `float` or `Sequence[float]` or `numpy.ndarray`
+        The tolerance of each measure, e.g., `(0.5, 4)` to treat destinations
+        within half a block and patterns within 4 blocks in length as
+        equivalent. A single value is used for all measures. All values must
+        be positive.
+
+    Returns
+    -------
+    `indices` : `numpy.ndarray`
+        An array of the index of each representative sequence, sorted in
+        ascending order.
+    """
+    points = np.asarray(points, dtype=float)
+    if points.ndim != 2:
+        raise ValueError("points must be 2-dimensional")
+    epsilons = np.broadcast_to(np.asarray(epsilons, dtype=float), points.shape[1:])
+    if np.any(epsilons <= 0):
+        raise ValueError("epsilons must be positive")
+    if len(points) == 0:
+        return np.empty(0, dtype=np.intp)
+    scaled = points / epsilons
+    boxes = np.floor(scaled)
+    corner_dist = np.sum((boxes + 1 - scaled) ** 2, axis=1)
+    # Best box first, and within each box the point closest to the corner first
+    order = np.lexsort((corner_dist, *boxes.T[::-1] * -1))
+    boxes = boxes[order]
+    first_in_box = np.ones(len(order), dtype=bool)
+    first_in_box[1:] = np.any(boxes[1:] != boxes[:-1], axis=1)
+    boxes, order = boxes[first_in_box], order[first_in_box]
+    # A box can only be dominated by boxes sorted before it
+    if boxes.shape[1] == 1:
+        kept = np.zeros(len(boxes), dtype=bool)
+        kept[0] = True
+    elif boxes.shape[1] == 2:
+        best_second = np.maximum.accumulate(boxes[:, 1])
+        kept = np.ones(len(boxes), dtype=bool)
+        kept[1:] = boxes[1:, 1] > best_second[:-1]
+    else:
+        archive: ParetoArchive[int] = ParetoArchive(boxes.shape[1])
+        kept = np.array([archive.insert(box) for box in boxes], dtype=bool)
+    return np.sort(order[kept])
+
+
+class ParetoArchive(Generic[_T]):
+    """An incrementally maintained pareto front.
+
+    Points are inserted one at a time, and any point that is dominated by an
+    archived point is discarded immediately, as is any archived point that
+    becomes dominated by a newly inserted one. As with `pareto_indices`, this
+    class aims for maximization, so measures which are intended to be minimized
+    should be negated prior to being inserted.
+
+    Each point may be paired with an item (e.g., the `Pattern` it measures),
+    which is kept for as long as its point remains on the front.
+    """
+
+    def __init__(self, n_objectives: int) -> None:
+        """
+        Parameters
+        ----------
+        `n_objectives` : `int`
+            The number of measures in each point. Must be positive.
+        """
+        if n_objectives < 1:
+            raise ValueError("n_objectives must be positive")
+        self._points = np.empty((16, n_objectives))
+        self._items: list[_T | None] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[tuple[np.ndarray, _T | None]]:
+        return zip(self.points, self.items)
+
+    @property
+    def n_objectives(self) -> int:
+        """`int` : The number of measures in each point.
+        """
+        return self._points.shape[1]
+
+    @property
+    def points(self) -> np.ndarray:
+        """`numpy.ndarray` : A copy of the archived points, in insertion order.
+        """
+        return self._points[:len(self)].copy()
+
+    @property
+    def items(self) -> list[_T | None]:
+        """`list` : The items paired with the archived points, in insertion order.
+        """
+        return list(self._items)
+
+    def is_dominated(self, point: Sequence | np.ndarray) -> bool:
+        """Whether a point is dominated by any archived point.
+
+        Parameters
+        ----------
+        `point` : `Sequence` or `numpy.ndarray`
+            The measures to compare against the archive.
+
+        Returns
+        -------
+        `dominated` : `bool`
+            `True` if inserting `point` would be rejected.
+        """
+        point = self._as_point(point)
+        archived = self._points[:len(self)]
+        return bool(np.any(np.all(archived >= point, axis=1) & np.any(archived > point, axis=1)))
+
+    def insert(self, point: Sequence | np.ndarray, item: _T | None = None) -> bool:
+        """Add a point to the archive if it is not dominated.
+
+        Points which are equal to an archived point are kept alongside it,
+        matching the behavior of `pareto_indices`.
+
+        Parameters
+        ----------
+        `point` : `Sequence` or `numpy.ndarray`
+            The measures of the candidate.
+        `item` : optional
+            The object described by `point`.
+
+        Returns
+        -------
+        `inserted` : `bool`
+            Whether the point was added to the front. If `False`, the point
+            and its item were discarded.
+        """
+        point = self._as_point(point)
+        size = len(self)
+        archived = self._points[:size]
+        if np.any(np.all(archived >= point, axis=1) & np.any(archived > point, axis=1)):
+            return False
+        kept = ~(np.all(point >= archived, axis=1) & np.any(point > archived, axis=1))
+        if not kept.all():
+            kept_indices = np.flatnonzero(kept)
+            size = len(kept_indices)
+            self._points[:size] = archived[kept_indices]
+            self._items = [self._items[index] for index in kept_indices]
+        if size == len(self._points):
+            self._points = np.concatenate((self._points, np.empty_like(self._points)))
+        self._points[size] = point
+        self._items.append(item)
+        return True
+
+    def extend(self, points: Iterable[Sequence | np.ndarray], items: Iterable[_T] | None = None) -> int:
+        """Insert several points, e.g., as they stream from a generator.
+
+        Parameters
+        ----------
+        `points` : `Iterable`
+            The measures of each candidate.
+        `items` : `Iterable`, optional
+            The object described by each point, in the same order as `points`.
+
+        Returns
+        -------
+        `n_inserted` : `int`
+            The number of points which were on the front when inserted. Some of
+            these may have since been removed by later points.
+        """
+        if items is None:
+            return sum(self.insert(point) for point in points)
+        return sum(self.insert(point, item) for point, item in zip(points, items, strict=True))
+
+    def remove(self, item: _T) -> None:
+        """Remove the first archived point paired with `item`.
+
+        Points which were discarded because `item`'s point dominated them are
+        not restored.
+
+        Parameters
+        ----------
+        `item`
+            The item to remove, compared by equality.
+        """
+        index = self._items.index(item)
+        self._points[index:len(self) - 1] = self._points[index + 1:len(self)]
+        del self._items[index]
+
+    def _as_point(self, point: Sequence | np.ndarray) -> np.ndarray:
+        point = np.asarray(point, dtype=float)
+        if point.shape != (self.n_objectives,):
+            raise ValueError(f"point must have exactly {self.n_objectives} measures")
+        return point
@@ -16,13 +16,14 @@
 
 
 from types import ModuleType
-from typing import Iterable
+from typing import Hashable, Iterable, Self, Sequence
 from dataclasses import dataclass
 from functools import cached_property
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
 from .vec2 import Vec2
+from .angle import BoatAngle
 from .optimization import pareto_indices
 
 
@@ -49,6 +50,16 @@ class Pattern(list[Vec2[int]]):
             raise IndexError("Pattern with length <2 has no points to determine deviation")
         return (self.target - self.target.project(self[-1])).length()
 
+    def freeze(self) -> "FrozenPattern":
+        """An immutable, hashable copy of this pattern.
+
+        Returns
+        -------
+        `frozen` : `FrozenPattern`
+            A pattern with the same block positions and target as this one.
+        """
+        return FrozenPattern(self, self.target)
+
     def plot(self) -> tuple[Figure, ModuleType]:
         """A plot representing the block positions in this pattern.
 
@@ -84,6 +95,236 @@ class Pattern(list[Vec2[int]]):
         ax.set_yticks([i for i in range(abs(self[-1].z) + 1)])
         return fig, plt
 
+
+class FrozenPattern(tuple[Vec2[int], ...]):
+    """An immutable counterpart of `Pattern`, usable in sets and as a dict key.
+
+    Equality and hashing consider the canonical step sequence (the offsets
+    between subsequent block positions) and the target, so patterns which only
+    differ by where their first block lies are treated as the same pattern.
+    The hash is computed once, on first use.
+    """
+
+    def __new__(cls, iterable: Iterable, target: Vec2) -> Self:
+        frozen = super().__new__(cls, iterable)
+        object.__setattr__(frozen, "target", target)
+        return frozen
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self) -> tuple[type[Self], tuple[tuple[Vec2[int], ...], Vec2]]:
+        return type(self), (tuple(self), self.target)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, FrozenPattern):
+            return NotImplemented
+        return (
+            hash(self) == hash(other)
+            and self.target == other.target
+            and self.steps == other.steps
+        )
+
+    def __ne__(self, other: object) -> bool:
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    @cached_property
+    def _hash(self) -> int:
+        return hash((self.steps, self.target))
+
+    @cached_property
+    def steps(self) -> tuple[Vec2[int], ...]:
+        """`tuple[Vec2[int], ...]` : The offset from each block position to the next.
+        """
+        return tuple(b - a for a, b in zip(self, self[1:]))
+
+    def deviation(self) -> float:
+        """The distance between the extension of this pattern's direction and
+        the target destination.
+
+        Returns
+        -------
+        `deviation` : `float`
+            The deviation distance in blocks.
+        """
+        if len(self) <= 1:
+            raise IndexError("Pattern with length <2 has no points to determine deviation")
+        end = self[-1] - self[0]
+        return (self.target - self.target.project(end)).length()
+
+    def thaw(self) -> Pattern:
+        """A mutable copy of this pattern.
+
+        Returns
+        -------
+        `pattern` : `Pattern`
+            A pattern with the same block positions and target as this one.
+        """
+        return Pattern(self, self.target)
+
+
+def group_patterns(
+    patterns: Iterable[Pattern | FrozenPattern],
+    match_target: bool = True,
+) -> dict[FrozenPattern, list[Pattern | FrozenPattern]]:
+    """Group equivalent patterns together in a single pass.
+
+    Parameters
+    ----------
+    `patterns` : `Iterable[Pattern | FrozenPattern]`
+        The patterns to group, e.g., the patterns generated for several
+        boat angles.
+    `match_target` : `bool`, default `True`
+        Whether patterns must also share a target to be grouped together.
+        If `False`, patterns are grouped by their step sequence alone.
+
+    Returns
+    -------
+    `groups` : `dict[FrozenPattern, list[Pattern | FrozenPattern]]`
+        The patterns of each group, in their original order, keyed by the frozen
+        form of the first pattern of the group. Groups are ordered by the first
+        appearance of each group.
+    """
+    groups: dict[Hashable, tuple[FrozenPattern, list[Pattern | FrozenPattern]]] = {}
+    for pattern in patterns:
+        frozen = pattern if isinstance(pattern, FrozenPattern) else pattern.freeze()
+        key = frozen if match_target else frozen.steps
+        if key in groups:
+            groups[key][1].append(pattern)
+        else:
+            groups[key] = (frozen, [pattern])
+    return {frozen: members for frozen, members in groups.values()}
+
+
+def unique_patterns(
+    patterns: Iterable[Pattern | FrozenPattern],
+    match_target: bool = True,
+) -> list[Pattern | FrozenPattern]:
+    """The first of each set of equivalent patterns, in a single pass.
+
+    Parameters
+    ----------
+    `patterns` : `Iterable[Pattern | FrozenPattern]`
+        The patterns to deduplicate.
+    `match_target` : `bool`, default `True`
+        Whether patterns must also share a target to be considered duplicates.
+        If `False`, patterns are compared by their step sequence alone.
+
+    Returns
+    -------
+    `unique` : `list[Pattern | FrozenPattern]`
+        The patterns which are not equivalent to any earlier pattern,
+        in their original order.
+    """
+    return [members[0] for members in group_patterns(patterns, match_target).values()]
+
+
+@dataclass(frozen=True)
+class DriftProfile:
+    """The lateral offset between a boat's line of travel and the blocks of a
+    road built by repeating a pattern.
+
+    Attributes
+    ----------
+    `offsets` : `numpy.ndarray`
+        The signed distance, in blocks, of each sampled block centre from the
+        boat's line. Offsets on opposite sides of the line have opposite signs.
+    `spacing` : `int`
+        The number of raster positions between samples: `1` if every block
+        was sampled, the pattern period if only the start of each repetition was.
+    """
+    offsets: np.ndarray
+    spacing: int
+
+    def max(self) -> float:
+        """The largest distance of any sampled block from the boat's line."""
+        return float(np.abs(self.offsets).max(initial=0.0))
+
+    def percentile(self, q: float | Sequence[float]) -> float | np.ndarray:
+        """Percentiles of the distances of the sampled blocks from the boat's line.
+
+        Parameters
+        ----------
+        `q` : `float` or `Sequence[float]`
+            The percentiles to compute, between `0` and `100`.
+        """
+        return np.percentile(np.abs(self.offsets), q)
+
+    def first_past(self, threshold: float = 0.5) -> int | None:
+        """The raster index of the first sampled block further than
+        `threshold` from the boat's line.
+
+        Parameters
+        ----------
+        `threshold` : `float`, default `0.5`
+            The distance in blocks. The default finds where the line first
+            leaves the blocks themselves.
+
+        Returns
+        -------
+        `index` : `int` or `None`
+            The raster index, or `None` if no sampled block is that far.
+        """
+        past = np.flatnonzero(np.abs(self.offsets) > threshold)
+        return int(past[0]) * self.spacing if len(past) else None
+
+
+def drift_profile(
+    pattern: Pattern | FrozenPattern,
+    angle: BoatAngle | None = None,
+    length: int | None = None,
+    per_period: bool = False,
+) -> DriftProfile:
+    """The lateral drift along a road built by repeating a pattern.
+
+    The road starts with the first block of `pattern` and repeats it end to
+    start, and the boat travels from the centre of the first block at its
+    boat angle. Since every repetition shifts the road by the same amount,
+    the offset of each block is the offset of its place in the pattern plus
+    a multiple of the offset of one repetition.
+
+    Parameters
+    ----------
+    `pattern` : `Pattern | FrozenPattern`
+        The pattern, with at least two block positions.
+    `angle` : `BoatAngle` or `None`, default `None`
+        The boat angle to travel at. If `None`, the boat angle closest to the
+        pattern's target.
+    `length` : `int` or `None`, default `None`
+        The number of raster positions in the road. If `None`, enough to
+        reach the pattern's target.
+    `per_period` : `bool`, default `False`
+        Whether to sample only the first block of each repetition, rather
+        than every block.
+
+    Returns
+    -------
+    `profile` : `DriftProfile`
+        The offset of each sampled block.
+    """
+    if len(pattern) <= 1:
+        raise IndexError("Pattern with length <2 has no points to determine drift")
+    if angle is None:
+        angle = BoatAngle.from_angle(pattern.target.angle())
+    dx, dz = angle.unit_vector()
+    cells = np.array([coord.as_tuple() for coord in pattern], dtype=np.float64)
+    cells -= cells[0]
+    # Cross products with the direction of travel give signed distances from the line
+    lateral = dx * cells[:, 1] - dz * cells[:, 0]
+    period = len(pattern) - 1
+    if length is None:
+        advance = dx * cells[-1, 0] + dz * cells[-1, 1]
+        length = int(np.ceil(pattern.target.length() / advance * period)) + 1 if advance > 0 else period
+    repeats = np.arange(-(-length // period)) * lateral[-1]
+    if per_period:
+        return DriftProfile(repeats, period)
+    return DriftProfile(np.add.outer(repeats, lateral[:-1]).ravel()[:length], 1)
+
+
 @dataclass(frozen=True)
 class PatternGenerator:
     """A class which generates all patterns (up to `max_pattern_len`) for a
@@ -0,0 +1,254 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Planning a path interactively, where the destination is nudged many times
+and each edit should only recompute what it changed.
+"""
+
+
+from typing import Sequence
+import numpy as np
+import litemapy as lm
+from .vec2 import Vec2
+from .angle import BoatAngle
+from .pattern import Pattern, unique_patterns
+from .optimization import pareto_indices
+from .schematic import (
+    Layout, _as_stacks, _stack_ids, _region_bounds, _fill_region, _copy_region, _template_key,
+)
+
+
+METRIC_COLUMNS = ("boat_angle", "length", "dest_error", "deviation")
+
+
+class IncrementalPlanner:
+    """The candidate patterns, their pareto front and the schematic of the path
+    from `origin` to `destination`, kept up to date as the destination moves.
+
+    As in `service.pareto_job`, candidates are the patterns for the `n_angles`
+    boat angles closest to the offset, and the pareto front ranks them by
+    destination error, deviation and length. The path itself follows the boat
+    offset of `road_index`, and is built as by `generate_schematic`, in world
+    coordinates.
+
+    When the destination moves, the blocks of a boat angle's patterns are only
+    recomputed if the start of its raster changed, and the schematic reuses
+    every region whose blocks did not change, however far along the path. The
+    raster and the schematic are only recomputed when `raster`, `regions` or
+    `schematic()` are used.
+
+    Parameters
+    ----------
+    `origin`, `destination` : `Vec2[int]`
+        The start and end blocks of the path.
+    `n_angles` : `int`, default `4`
+        The number of boat angles to generate patterns for.
+    `max_pattern_len` : `int`, default `64`
+        The length of the longest pattern generated per boat angle.
+    `gap_size` : `int`, default `0`
+        The gap size of the path.
+    `blocks` : `litemapy.BlockState` or `Sequence` thereof, or `Sequence` of `Sequence`s
+        The stack, or stacks with a `layout`, to place at each position.
+    `layout` : `numpy.ndarray` or `Callable[[numpy.ndarray], numpy.ndarray]`, optional
+        The index of the stack to place at each raster position. An array
+        layout must be replaced, with `set_layout`, when the raster length changes.
+    `name` : `str`, optional
+        The name of the schematic.
+
+    Attributes
+    ----------
+    `angles` : `list[BoatAngle]`
+        The boat angles closest to the offset, closest first.
+    `boat_offsets` : `list[Vec2[float]]`
+        The offset projected onto each boat angle.
+    `patterns` : `list[Pattern]`
+        The candidate patterns of every boat angle, shortest first per angle.
+    `metrics` : `numpy.ndarray`
+        One row per candidate pattern, with the columns of `METRIC_COLUMNS`.
+    `pareto_front` : `list[Pattern]`
+        The deduplicated pareto front of the candidates.
+    `changed_regions` : `int`
+        The number of regions built by the last schematic update, rather than reused.
+    """
+
+    def __init__(
+        self,
+        origin: Vec2[int],
+        destination: Vec2[int],
+        n_angles: int = 4,
+        max_pattern_len: int = 64,
+        gap_size: int = 0,
+        blocks: lm.BlockState | Sequence[lm.BlockState] | Sequence[Sequence[lm.BlockState]] = lm.BlockState("minecraft:blue_ice"),
+        layout: Layout | None = None,
+        name: str | None = None,
+    ) -> None:
+        self.origin = origin
+        self.n_angles = n_angles
+        self.max_pattern_len = max_pattern_len
+        self.gap_size = gap_size
+        self.stacks = _as_stacks(blocks)
+        self.layout = layout
+        self.name = lm.info.DEFAULT_NAME if name is None else name
+        self.road_index = 0
+        self.changed_regions = 0
+        # Pattern prefixes by boat angle index, as cells and as Vec2 lists
+        self._prefixes: dict[int, tuple[np.ndarray, list[Vec2[int]]]] = {}
+        # A current region of each region shape, to copy new regions from
+        self._templates: dict[bytes, lm.Region] = {}
+        self._region_keys: list[bytes] = []
+        self._template_keys: list[bytes] = []
+        self._regions: list[lm.Region] = []
+        self._raster: np.ndarray | None = None
+        self.move_to(destination)
+
+    @property
+    def offset(self) -> Vec2[int]:
+        """`Vec2[int]` : The offset from the origin to the destination."""
+        return self.destination - self.origin
+
+    @property
+    def road_offset(self) -> Vec2[float]:
+        """`Vec2[float]` : The boat offset the path follows."""
+        return self.boat_offsets[self.road_index]
+
+    def move_to(self, destination: Vec2[int]) -> None:
+        """Change the destination, updating the candidate patterns, their
+        metrics and the pareto front.
+
+        Parameters
+        ----------
+        `destination` : `Vec2[int]`
+            The new end block of the path.
+        """
+        if destination == self.origin:
+            raise ValueError("Destination must be different from origin")
+        self.destination = destination
+        offset = self.offset
+        self.angles = BoatAngle.closest(offset.angle(), self.n_angles)
+        self.boat_offsets = [offset.project(Vec2(*angle.unit_vector())) for angle in self.angles]
+        patterns: list[Pattern] = []
+        metrics = []
+        for angle, target in zip(self.angles, self.boat_offsets):
+            cells, coords = self._prefix(angle, target)
+            angle_patterns = [Pattern(coords[:length], target) for length in range(2, len(cells) + 1)]
+            patterns.extend(angle_patterns)
+            metrics.append(np.column_stack((
+                np.full(len(angle_patterns), angle.index),
+                np.arange(2, len(cells) + 1),
+                np.full(len(angle_patterns), (offset - target).length()),
+                # Computed as the patterns do, so that ties rank the same
+                [pattern.deviation() for pattern in angle_patterns],
+            )).reshape(-1, len(METRIC_COLUMNS)))
+        self.patterns = patterns
+        self.metrics = np.concatenate(metrics) if metrics else np.zeros((0, len(METRIC_COLUMNS)))
+        front = pareto_indices(-self.metrics[:, [2, 3, 1]]) if len(self.metrics) else []
+        self.pareto_front = unique_patterns([patterns[index] for index in front], match_target=False)
+        self._raster = None
+
+    def select(self, road_index: int) -> None:
+        """Choose which boat offset the path follows.
+
+        Parameters
+        ----------
+        `road_index` : `int`
+            The index into `boat_offsets`, `0` being the closest boat angle.
+        """
+        if not 0 <= road_index < len(self.boat_offsets):
+            raise ValueError(f"road_index must be in [0, {len(self.boat_offsets)})")
+        self.road_index = road_index
+        self._raster = None
+
+    def set_layout(self, layout: Layout | None) -> None:
+        """Replace the layout of the path."""
+        self.layout = layout
+        self._raster = None
+
+    def _prefix(self, angle: BoatAngle, target: Vec2[float]) -> tuple[np.ndarray, list[Vec2[int]]]:
+        """The first blocks of the raster to `target`, as many as the longest
+        pattern, reusing the previous block objects if they did not change.
+        """
+        n_points = int(np.ceil(max(abs(target.x), abs(target.z)))) + 1
+        # Patterns never span the whole raster, as in PatternGenerator
+        count = min(n_points - 1, self.max_pattern_len)
+        cells = next(target.raster_chunks(chunk_size=count))[:count] if count > 0 else np.zeros((0, 2), dtype=int)
+        previous = self._prefixes.get(angle.index)
+        if previous is not None and np.array_equal(previous[0], cells):
+            return previous
+        prefix = cells, [Vec2(int(x), int(z)) for x, z in cells.tolist()]
+        self._prefixes[angle.index] = prefix
+        return prefix
+
+    @property
+    def raster(self) -> np.ndarray:
+        """`numpy.ndarray` : The `(n, 2)` world positions of the path."""
+        if self._raster is None:
+            self._raster = (self.origin + self.road_offset).raster_array(self.origin)
+            self._update_regions()
+        return self._raster
+
+    @property
+    def regions(self) -> list[lm.Region]:
+        """`list[litemapy.Region]` : The regions of the path's schematic."""
+        self.raster
+        return self._regions
+
+    def _update_regions(self) -> None:
+        cells = self._raster
+        stack_ids = _stack_ids(cells, self.gap_size, self.layout, len(self.stacks))
+        placed = np.flatnonzero(stack_ids >= 0)
+        placed_cells = cells[placed]
+        placed_stack_ids = stack_ids[placed]
+        previous = dict(zip(self._region_keys, zip(self._regions, self._template_keys)))
+        keys, template_keys, regions = [], [], []
+        # Only shapes of the current regions are kept, so the templates do not grow with each move
+        templates: dict[bytes, lm.Region] = {}
+        changed = 0
+        for start, stop in _region_bounds(placed_cells):
+            region_cells = placed_cells[start:stop]
+            region_stack_ids = placed_stack_ids[start:stop]
+            key = region_cells.tobytes() + region_stack_ids.tobytes()
+            if key in previous:
+                region, template_key = previous[key]
+            else:
+                changed += 1
+                template_key = _template_key(region_cells, region_stack_ids)
+                template = templates.get(template_key, self._templates.get(template_key))
+                if template is None:
+                    region = _fill_region(region_cells, region_stack_ids, self.stacks)
+                else:
+                    region = _copy_region(template, region_cells)
+            templates.setdefault(template_key, region)
+            keys.append(key)
+            template_keys.append(template_key)
+            regions.append(region)
+        self._region_keys, self._template_keys, self._regions = keys, template_keys, regions
+        self._templates = templates
+        self.changed_regions = changed
+
+    def schematic(self) -> lm.Schematic:
+        """The schematic of the path, as `generate_schematic` would build it
+        in world coordinates.
+
+        Returns
+        -------
+        `schematic` : `litemapy.Schematic`
+            A new schematic sharing its regions with this planner.
+        """
+        schem = lm.Schematic(name=self.name, author="mc_diag_boat")
+        for index, region in enumerate(self.regions):
+            schem.regions[str(index)] = region
+        return schem
@@ -0,0 +1,267 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from typing import Iterable, Iterator, Literal, Self, Sequence
+from pathlib import Path
+import struct
+import numpy as np
+from .vec2 import Vec2
+
+
+MAGIC = b"MCDBRSTR"
+VERSION = 1
+ENCODINGS = ("int32", "delta")
+ANCHOR_INTERVAL = 1 << 16
+
+# magic, version, encoding, anchor interval, count, first x, first z
+_HEADER = struct.Struct("<8sHHIQii")
+_HEADER_SIZE = 64
+
+
+class RasterWriter:
+    """Writes a raster to a compact file, one chunk at a time.
+
+    The file holds a fixed-size header followed by the cells, either as `int32`
+    `x`, `z` pairs, which can be sliced directly from disk, or as `int16` steps
+    from the previous cell, which take half the space. Delta-encoded files also
+    hold the absolute position of every `ANCHOR_INTERVAL`th cell after the steps,
+    so that slices can be read without summing every prior step.
+
+    Use as a context manager, or call `close()` to finish the file.
+    """
+
+    def __init__(self, path: str | Path, encoding: Literal["int32", "delta"] = "int32") -> None:
+        """
+        Parameters
+        ----------
+        `path` : `str` or `Path`
+            The file to write. Existing files are overwritten.
+        `encoding` : `Literal["int32", "delta"]`, default `"int32"`
+            How cells are stored. `"delta"` requires every step between
+            subsequent cells to fit in an `int16`, as rasters' steps always do.
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding must be one of {ENCODINGS}")
+        self.path = Path(path)
+        self.encoding = encoding
+        self.count = 0
+        self._file = open(self.path, "wb")
+        self._file.write(bytes(_HEADER_SIZE))
+        self._first = np.zeros(2, dtype=np.int64)
+        self._last = np.zeros(2, dtype=np.int64)
+        self._anchors: list[np.ndarray] = []
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def write(self, cells: np.ndarray | Sequence[Vec2[int]]) -> None:
+        """Append cells to the raster.
+
+        Parameters
+        ----------
+        `cells` : `numpy.ndarray` or `Sequence[Vec2[int]]`
+            An integer array of shape `(k, 2)`, e.g., a chunk from
+            `Vec2.raster_chunks`, or a list of `Vec2[int]`, e.g., from `Vec2.raster`.
+        """
+        if not isinstance(cells, np.ndarray):
+            cells = np.array([coord.as_tuple() for coord in cells], dtype=np.int64)
+        cells = cells.reshape(-1, 2).astype(np.int64, copy=False)
+        if len(cells) == 0:
+            return
+        if np.any(np.abs(cells) > np.iinfo(np.int32).max):
+            raise ValueError("cells must fit in int32")
+        if self.count == 0:
+            self._first = cells[0].copy()
+            self._last = cells[0].copy()
+        if self.encoding == "int32":
+            self._file.write(cells.astype("<i4").tobytes())
+        else:
+            steps = np.diff(cells, axis=0, prepend=self._last[None])
+            if np.any(np.abs(steps) > np.iinfo(np.int16).max):
+                raise ValueError("steps between cells must fit in int16 for delta encoding")
+            self._file.write(steps.astype("<i2").tobytes())
+            anchor_indices = np.arange(-self.count % ANCHOR_INTERVAL, len(cells), ANCHOR_INTERVAL)
+            self._anchors.append(cells[anchor_indices])
+        self._last = cells[-1].copy()
+        self.count += len(cells)
+
+    def close(self) -> None:
+        """Write the anchors and header, and close the file.
+        """
+        if self._file.closed:
+            return
+        if self.encoding == "delta":
+            for anchors in self._anchors:
+                self._file.write(anchors.astype("<i4").tobytes())
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(
+            MAGIC,
+            VERSION,
+            ENCODINGS.index(self.encoding),
+            ANCHOR_INTERVAL,
+            self.count,
+            int(self._first[0]),
+            int(self._first[1]),
+        ))
+        self._file.close()
+
+
+def write_raster(
+    path: str | Path,
+    raster: np.ndarray | Sequence[Vec2[int]] | Iterable[np.ndarray],
+    encoding: Literal["int32", "delta"] = "int32",
+) -> int:
+    """Write a raster to a compact file.
+
+    Parameters
+    ----------
+    `path` : `str` or `Path`
+        The file to write.
+    `raster` : `numpy.ndarray`, `Sequence[Vec2[int]]` or `Iterable[numpy.ndarray]`
+        A whole raster, or chunks of a raster such as those from
+        `Vec2.raster_chunks`, which are written as they are produced.
+    `encoding` : `Literal["int32", "delta"]`, default `"int32"`
+        How cells are stored. See `RasterWriter`.
+
+    Returns
+    -------
+    `count` : `int`
+        The number of cells written.
+    """
+    with RasterWriter(path, encoding) as writer:
+        if isinstance(raster, np.ndarray) or (
+            isinstance(raster, Sequence) and (len(raster) == 0 or isinstance(raster[0], Vec2))
+        ):
+            writer.write(raster)
+        else:
+            for chunk in raster:
+                writer.write(chunk)
+    return writer.count
+
+
+class RasterFile:
+    """A raster file written by `RasterWriter`, read through a memory map.
+
+    Indexing and slicing return `int64` arrays of shape `(k, 2)`, reading only
+    the part of the file they cover. E.g., `raster[1000:5001]` can be passed to
+    `schematic.schematic_from_raster` with `start_index=1000`.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        """
+        Parameters
+        ----------
+        `path` : `str` or `Path`
+            The file to read.
+        """
+        self.path = Path(path)
+        with open(self.path, "rb") as file:
+            header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"{self.path} is not a raster file")
+        magic, version, encoding, interval, count, first_x, first_z = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a raster file")
+        if version != VERSION:
+            raise ValueError(f"Unsupported raster file version {version}")
+        self.encoding = ENCODINGS[encoding]
+        self.anchor_interval = interval
+        self.count = count
+        self.first = np.array((first_x, first_z), dtype=np.int64)
+        if count == 0:
+            self._data = np.zeros((0, 2), dtype="<i4")
+            self._anchors = np.zeros((0, 2), dtype="<i4")
+        elif self.encoding == "int32":
+            self._data = np.memmap(self.path, "<i4", "r", _HEADER_SIZE, (count, 2))
+        else:
+            self._data = np.memmap(self.path, "<i2", "r", _HEADER_SIZE, (count, 2))
+            n_anchors = -(-count // interval)
+            self._anchors = np.memmap(self.path, "<i4", "r", _HEADER_SIZE + count * 4, (n_anchors, 2))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int | slice) -> np.ndarray:
+        if isinstance(index, slice):
+            indices = range(*index.indices(self.count))
+            if len(indices) == 0:
+                return np.zeros((0, 2), dtype=np.int64)
+            low, high = min(indices[0], indices[-1]), max(indices[0], indices[-1])
+            return self._read(low, high + 1)[indices[0] - low::indices.step]
+        if not -self.count <= index < self.count:
+            raise IndexError("raster index out of range")
+        index %= self.count
+        return self._read(index, index + 1)[0]
+
+    @property
+    def cells(self) -> np.ndarray:
+        """`numpy.ndarray` : The memory-mapped `int32` cells of an
+        `"int32"`-encoded file, without copying.
+        """
+        if self.encoding != "int32":
+            raise ValueError("Only int32-encoded rasters can be mapped directly")
+        return self._data
+
+    def chunks(self, chunk_size: int = 1 << 20) -> Iterator[np.ndarray]:
+        """The raster as consecutive chunks.
+
+        Parameters
+        ----------
+        `chunk_size` : `int`, default `1 << 20`
+            The maximum number of cells in each chunk.
+
+        Returns
+        -------
+        `chunks` : `Iterator[numpy.ndarray]`
+            Arrays of shape `(k, 2)` which, concatenated, hold every cell.
+        """
+        for start in range(0, self.count, chunk_size):
+            yield self._read(start, min(start + chunk_size, self.count))
+
+    def to_vec2s(self, start: int = 0, stop: int | None = None) -> list[Vec2[int]]:
+        """A slice of the raster as `Vec2`s, as returned by `Vec2.raster`.
+
+        Parameters
+        ----------
+        `start` : `int`, default `0`
+            The first index.
+        `stop` : `int`, optional
+            The index after the last. Defaults to the end of the raster.
+
+        Returns
+        -------
+        `raster` : `list[Vec2[int]]`
+            The cells of the slice.
+        """
+        return [Vec2(x, z) for x, z in self[start:stop].tolist()]
+
+    def _read(self, start: int, stop: int) -> np.ndarray:
+        if start >= stop:
+            return np.zeros((0, 2), dtype=np.int64)
+        if self.encoding == "int32":
+            return np.asarray(self._data[start:stop], dtype=np.int64)
+        anchor_index = start // self.anchor_interval
+        anchor_start = anchor_index * self.anchor_interval
+        steps = np.asarray(self._data[anchor_start + 1:stop], dtype=np.int64)
+        cells = np.empty((stop - anchor_start, 2), dtype=np.int64)
+        cells[0] = self._anchors[anchor_index]
+        np.cumsum(steps, axis=0, out=cells[1:])
+        cells[1:] += cells[0]
+        return cells[start - anchor_start:]
@@ -0,0 +1,219 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Writing candidate pattern metrics as columnar tables, for analyzing the
+candidates of many routes in bulk.
+"""
+
+
+from typing import Any, Iterable, Literal, Self, Sequence
+from pathlib import Path
+import numpy as np
+from .vec2 import Vec2
+from .angle import BoatAngle
+from .pattern import Pattern, FrozenPattern
+
+
+CANDIDATE_COLUMNS = ("route", "boat_angle", "length", "dest_error", "deviation")
+CANDIDATE_DTYPES = (np.int64, np.int16, np.int32, np.float64, np.float64)
+FORMATS = ("npz", "csv", "parquet")
+_CSV_ROWS = 1 << 16
+
+
+def _table(route: int | np.ndarray, columns: Sequence[Any]) -> dict[str, np.ndarray]:
+    length = len(columns[0])
+    return {
+        name: np.broadcast_to(np.asarray(values, dtype=dtype), (length,))
+        for name, dtype, values in zip(CANDIDATE_COLUMNS, CANDIDATE_DTYPES, (route, *columns))
+    }
+
+
+def pattern_table(
+    patterns: Sequence[Pattern | FrozenPattern],
+    offset: Vec2,
+    route: int = 0,
+) -> dict[str, np.ndarray]:
+    """The metrics of candidate patterns for one route, as columns.
+
+    The metrics are those of `service.pareto_job` records: the boat angle index
+    of each pattern's target, its length, the distance from its target to
+    `offset` and its deviation.
+
+    Parameters
+    ----------
+    `patterns` : `Sequence[Pattern | FrozenPattern]`
+        The candidate patterns.
+    `offset` : `Vec2`
+        The offset of the route.
+    `route` : `int`, default `0`
+        The id of the route, repeated in every row.
+
+    Returns
+    -------
+    `table` : `dict[str, numpy.ndarray]`
+        One array per name in `CANDIDATE_COLUMNS`.
+    """
+    # Patterns share a few targets, so each target's metrics are computed once
+    targets: dict[Vec2, tuple[int, float]] = {}
+    for pattern in patterns:
+        if pattern.target not in targets:
+            targets[pattern.target] = (
+                BoatAngle.from_angle(pattern.target.angle()).index,
+                (offset - pattern.target).length(),
+            )
+    return _table(route, (
+        [targets[pattern.target][0] for pattern in patterns],
+        [len(pattern) for pattern in patterns],
+        [targets[pattern.target][1] for pattern in patterns],
+        [pattern.deviation() for pattern in patterns],
+    ))
+
+
+def record_table(records: Sequence[dict[str, Any]], route: int = 0) -> dict[str, np.ndarray]:
+    """The metrics of candidate pattern records for one route, as columns,
+    e.g., from `service.pareto_job` or `batch.plan_routes`.
+
+    Parameters
+    ----------
+    `records` : `Sequence[dict[str, Any]]`
+        The records, each with `"boat_angle"`, `"length"`, `"dest_error"` and
+        `"deviation"` entries.
+    `route` : `int`, default `0`
+        The id of the route, repeated in every row.
+
+    Returns
+    -------
+    `table` : `dict[str, numpy.ndarray]`
+        One array per name in `CANDIDATE_COLUMNS`.
+    """
+    return _table(route, [[record[name] for record in records] for name in CANDIDATE_COLUMNS[1:]])
+
+
+class CandidateWriter:
+    """Writes tables of candidate metrics to a file, one table at a time.
+
+    CSV and Parquet files are streamed, so only the current table is held in
+    memory. A `.npz` archive holds one array per column, which are only
+    written on `close()`. Parquet requires the optional `pyarrow` package.
+
+    Use as a context manager, or call `close()` to finish the file.
+
+    Parameters
+    ----------
+    `path` : `str` or `Path`
+        The file to write. Existing files are overwritten.
+    `format` : `Literal["npz", "csv", "parquet"]`, optional
+        The file format. If not given, it is taken from the file extension.
+    """
+
+    def __init__(self, path: str | Path, format: Literal["npz", "csv", "parquet"] | None = None) -> None:
+        self.path = Path(path)
+        self.format = self.path.suffix.lstrip(".").lower() if format is None else format
+        if self.format not in FORMATS:
+            raise ValueError(f"format must be one of {FORMATS}")
+        self.count = 0
+        self._closed = False
+        self._chunks: list[dict[str, np.ndarray]] = []
+        self._file = None
+        self._parquet = None
+        if self.format == "csv":
+            self._file = open(self.path, "w", newline="")
+            self._file.write(",".join(CANDIDATE_COLUMNS) + "\n")
+        elif self.format == "parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise ImportError("Writing Parquet files requires the pyarrow package") from e
+            self._arrow = pa
+            schema = pa.schema([(name, pa.from_numpy_dtype(dtype)) for name, dtype in zip(CANDIDATE_COLUMNS, CANDIDATE_DTYPES)])
+            self._parquet = pq.ParquetWriter(str(self.path), schema)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def write(self, table: dict[str, np.ndarray]) -> None:
+        """Append the rows of a table, e.g., from `pattern_table`.
+
+        Parameters
+        ----------
+        `table` : `dict[str, numpy.ndarray]`
+            One equal-length array per name in `CANDIDATE_COLUMNS`.
+        """
+        columns = [np.asarray(table[name], dtype=dtype) for name, dtype in zip(CANDIDATE_COLUMNS, CANDIDATE_DTYPES)]
+        if len({len(column) for column in columns}) > 1:
+            raise ValueError("All columns must be the same length")
+        if self.format == "csv":
+            # Formatted a column at a time, with floats in their shortest exact form
+            for start in range(0, len(columns[0]), _CSV_ROWS):
+                text = [
+                    column[start:start + _CSV_ROWS].astype(str).tolist() if column.dtype.kind == "i"
+                    else list(map(repr, column[start:start + _CSV_ROWS].tolist()))
+                    for column in columns
+                ]
+                self._file.writelines(",".join(row) + "\n" for row in zip(*text))
+        elif self.format == "parquet":
+            self._parquet.write_table(self._arrow.table(dict(zip(CANDIDATE_COLUMNS, columns))))
+        else:
+            self._chunks.append(dict(zip(CANDIDATE_COLUMNS, columns)))
+        self.count += len(columns[0])
+
+    def close(self) -> None:
+        """Finish the file. Further calls do nothing."""
+        if self._closed:
+            return
+        self._closed = True
+        if self.format == "npz":
+            np.savez(self.path, **{
+                name: np.concatenate([chunk[name] for chunk in self._chunks]) if self._chunks else np.zeros(0, dtype=dtype)
+                for name, dtype in zip(CANDIDATE_COLUMNS, CANDIDATE_DTYPES)
+            })
+            self._chunks = []
+        elif self._file is not None:
+            self._file.close()
+        elif self._parquet is not None:
+            self._parquet.close()
+
+
+def write_candidates(
+    path: str | Path,
+    tables: Iterable[dict[str, np.ndarray]],
+    format: Literal["npz", "csv", "parquet"] | None = None,
+) -> int:
+    """Write tables of candidate metrics, e.g., one per route, to one file.
+
+    Parameters
+    ----------
+    `path` : `str` or `Path`
+        The file to write.
+    `tables` : `Iterable[dict[str, numpy.ndarray]]`
+        The tables, e.g., from `pattern_table` or `record_table`.
+    `format` : `Literal["npz", "csv", "parquet"]`, optional
+        The file format, taken from the file extension if not given.
+
+    Returns
+    -------
+    `count` : `int`
+        The number of rows written.
+    """
+    with CandidateWriter(path, format) as writer:
+        for table in tables:
+            writer.write(table)
+    return writer.count
@@ -15,7 +15,8 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-from typing import Sequence
+from typing import Callable, Sequence
+import numpy as np
 import litemapy as lm
 from .vec2 import Vec2
 
@@ -23,6 +24,176 @@ from .vec2 import Vec2
 SXN_SIZE = 16
 
 
+Layout = np.ndarray | Callable[[np.ndarray], np.ndarray]
+
+
+def gap_mask(length: int, gap_size: int) -> np.ndarray:
+    """A mask over raster indices which keeps every `gap_size` + 1 index,
+    as well as the last index.
+
+    Parameters
+    ----------
+    `length` : `int`
+        The length of the raster.
+    `gap_size` : `int`
+        The number of indices to skip between each included index.
+        Should be non-negative.
+
+    Returns
+    -------
+    `mask` : `numpy.ndarray`
+        A boolean array of shape `(length,)`.
+    """
+    mask = periodic_mask(length, gap_size + 1)
+    if length > 0:
+        mask[-1] = True
+    return mask
+
+
+def periodic_mask(length: int, period: int, phase: int = 0) -> np.ndarray:
+    """A mask over raster indices which selects every `period`th index.
+
+    Parameters
+    ----------
+    `length` : `int`
+        The length of the raster.
+    `period` : `int`
+        The spacing between selected indices. Must be positive.
+    `phase` : `int`, default `0`
+        The first selected index.
+
+    Returns
+    -------
+    `mask` : `numpy.ndarray`
+        A boolean array of shape `(length,)`.
+    """
+    if period < 1:
+        raise ValueError("period must be positive")
+    return np.arange(length) % period == phase % period
+
+
+def straight_mask(raster: Sequence[Vec2[int]] | np.ndarray) -> np.ndarray:
+    """A mask over raster indices which selects positions on straight,
+    axis-aligned segments, e.g., where rails can be placed.
+
+    A position is on a straight segment if the steps into and out of it are
+    the same single-block step along the x or z axis. The first and last
+    positions only consider the step they have.
+
+    Parameters
+    ----------
+    `raster` : `Sequence[Vec2[int]]` or `numpy.ndarray`
+        The raster to inspect.
+
+    Returns
+    -------
+    `mask` : `numpy.ndarray`
+        A boolean array of shape `(len(raster),)`.
+    """
+    cells = _as_cells(raster)
+    if len(cells) < 2:
+        return np.zeros(len(cells), dtype=bool)
+    steps = np.diff(cells, axis=0)
+    axis_step = np.abs(steps).sum(axis=1) == 1
+    mask = np.empty(len(cells), dtype=bool)
+    mask[0] = axis_step[0]
+    mask[-1] = axis_step[-1]
+    mask[1:-1] = axis_step[:-1] & np.all(steps[:-1] == steps[1:], axis=1)
+    return mask
+
+
+def layout_from_masks(
+    length: int,
+    masks: Sequence[tuple[np.ndarray, int]],
+    default: int = 0,
+) -> np.ndarray:
+    """Build a layout, the index of the block stack to place at each raster
+    index, from masks.
+
+    Parameters
+    ----------
+    `length` : `int`
+        The length of the raster.
+    `masks` : `Sequence[tuple[numpy.ndarray, int]]`
+        Pairs of a boolean mask of shape `(length,)` and the stack index to use
+        where the mask is set. Later masks take precedence over earlier ones.
+        A stack index of `-1` leaves the masked positions empty.
+    `default` : `int`, default `0`
+        The stack index used where no mask is set.
+
+    Returns
+    -------
+    `layout` : `numpy.ndarray`
+        An integer array of shape `(length,)`.
+    """
+    layout = np.full(length, default, dtype=np.int64)
+    for mask, stack_index in masks:
+        layout[mask] = stack_index
+    return layout
+
+
+def _as_cells(raster: Sequence[Vec2[int]] | np.ndarray) -> np.ndarray:
+    if isinstance(raster, np.ndarray):
+        return raster.reshape(-1, 2).astype(np.int64, copy=False)
+    return np.array([coord.as_tuple() for coord in raster], dtype=np.int64).reshape(-1, 2)
+
+
+def _as_levels(levels: int | np.ndarray | None, length: int) -> np.ndarray | None:
+    if levels is None:
+        return None
+    return np.broadcast_to(np.asarray(levels, dtype=np.int64), (length,))
+
+
+def _as_stacks(
+    blocks: lm.BlockState | Sequence[lm.BlockState] | Sequence[Sequence[lm.BlockState]],
+) -> list[list[lm.BlockState]]:
+    if isinstance(blocks, lm.BlockState):
+        return [[blocks]]
+    if len(blocks) == 0:
+        raise ValueError("Must be at least one BlockState provided.")
+    if isinstance(blocks[0], lm.BlockState):
+        return [list(blocks)]
+    stacks = [list(stack) for stack in blocks]
+    if any(len(stack) == 0 for stack in stacks):
+        raise ValueError("Must be at least one BlockState provided in each stack.")
+    return stacks
+
+
+def _stack_ids(
+    cells: np.ndarray,
+    gap_size: int,
+    layout: Layout | None,
+    n_stacks: int,
+    start_index: int = 0,
+    stations: np.ndarray | None = None,
+) -> np.ndarray:
+    """The stack index of each raster position, `-1` where no blocks are placed.
+
+    With `stations`, gaps and the endpoint apply to whole stations rather than
+    to single positions.
+    """
+    if layout is None:
+        stack_ids = np.zeros(len(cells), dtype=np.int64)
+    else:
+        stack_ids = np.asarray(layout(cells) if callable(layout) else layout, dtype=np.int64)
+        if stack_ids.shape != (len(cells),):
+            raise ValueError("layout must have one stack index per raster position")
+        if np.any(stack_ids >= n_stacks) or np.any(stack_ids < -1):
+            raise ValueError(f"layout stack indices must be -1 or in [0, {n_stacks})")
+    if stations is None:
+        stack_ids = np.where(periodic_mask(len(cells), gap_size + 1, -start_index), stack_ids, -1)
+        # The endpoint is left for the start of the next path
+        stack_ids[-1:] = -1
+        return stack_ids
+    stations = np.asarray(stations, dtype=np.int64)
+    if stations.shape != (len(cells),):
+        raise ValueError("stations must have one station per raster position")
+    stack_ids = np.where((stations + start_index) % (gap_size + 1) == 0, stack_ids, -1)
+    if len(cells):
+        stack_ids[stations == stations[-1]] = -1
+    return stack_ids
+
+
 def _add_gaps(raster: Sequence[Vec2[int]], gap_size: int) -> list[Vec2[int]]:
     """Add gaps to the raster, effectively removing all indices except every
     `gap_size` + 1 index.
@@ -40,11 +211,63 @@ def _add_gaps(raster: Sequence[Vec2[int]], gap_size: int) -> list[Vec2[int]]:
     `raster_with_gaps` : `list[Vec2[int]]`
         The raster, with only every `gap_size` + 1 block included.
     """
-    return [
-        coord
-        for index, coord in enumerate(raster)
-        if index % (gap_size + 1) == 0 or index == len(raster) - 1
-    ]
+    return [raster[index] for index in np.flatnonzero(gap_mask(len(raster), gap_size))]
+
+
+def _region_bounds(cells: np.ndarray, levels: np.ndarray | None = None) -> list[tuple[int, int]]:
+    """The start and stop index of each, at biggest, chunk-sized region of
+    consecutive cells. With `levels`, regions are also cut where the level
+    changes, so each region has a single level.
+    """
+    if len(cells) == 0:
+        return []
+    steps = np.diff(cells, axis=0)
+    if np.all(np.all(steps >= 0, axis=0) | np.all(steps <= 0, axis=0)):
+        return _monotone_region_bounds(cells, levels)
+    bounds: list[tuple[int, int]] = []
+    start = 0
+    window = 4 * SXN_SIZE
+    while start < len(cells):
+        window_cells = cells[start:start + window]
+        span = (
+            np.maximum.accumulate(window_cells) - np.minimum.accumulate(window_cells)
+        ).max(axis=1)
+        cut = span >= SXN_SIZE
+        if levels is not None:
+            cut |= levels[start:start + window] != levels[start]
+        breaks = np.flatnonzero(cut)
+        if len(breaks) == 0 and start + window < len(cells):
+            window *= 2
+            continue
+        stop = start + int(breaks[0]) if len(breaks) > 0 else len(cells)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+
+def _monotone_region_bounds(cells: np.ndarray, levels: np.ndarray | None = None) -> list[tuple[int, int]]:
+    """`_region_bounds` for cells which never step backwards along either
+    axis, e.g., a straight path. The span of a region is then the distance
+    from its first cell, so where a region starting at each index would stop
+    is found in bulk, and only following the chain of stops is sequential.
+    """
+    if len(cells) == 0:
+        return []
+    stops = np.full(len(cells), len(cells))
+    for axis in range(cells.shape[1]):
+        # Flip decreasing coordinates so that each axis is sorted ascending
+        coords = cells[:, axis] if cells[-1, axis] >= cells[0, axis] else -cells[:, axis]
+        stops = np.minimum(stops, np.searchsorted(coords, coords + SXN_SIZE, side="left"))
+    if levels is not None:
+        changes = np.flatnonzero(np.diff(levels)) + 1
+        stops = np.minimum(stops, np.append(changes, len(cells))[np.searchsorted(changes, np.arange(len(cells)), side="right")])
+    bounds: list[tuple[int, int]] = []
+    stops = stops.tolist()
+    start = 0
+    while start < len(cells):
+        bounds.append((start, stops[start]))
+        start = stops[start]
+    return bounds
 
 
 def _cut_regions(raster: Sequence[Vec2[int]]) -> list[Sequence[Vec2[int]]]:
@@ -60,16 +283,70 @@ def _cut_regions(raster: Sequence[Vec2[int]]) -> list[Sequence[Vec2[int]]]:
     `regions` : `list[Sequence[Vec2[int]]]`
         The list of regions, each region spanning at most 16 blocks square.
     """
-    regions: list[Sequence[Vec2]] = []
-    region_start_index = 0
-    for index in range(len(raster)):
-        diff = (raster[index] - raster[region_start_index])
-        if abs(diff.x) >= SXN_SIZE or abs(diff.z) >= SXN_SIZE:
-            regions.append(raster[region_start_index:index])
-            region_start_index = index
-    if region_start_index < len(raster) - 1:
-        regions.append(raster[region_start_index:len(raster) - 1])
-    return regions
+    return [
+        raster[start:stop]
+        for start, stop in _region_bounds(_as_cells(raster[:-1]))
+    ]
+
+
+def _block_array(region: lm.Region) -> np.ndarray:
+    """The palette index array backing a region, indexed by `[x, y, z]` storage
+    coordinates. Litemapy only offers per-block access, so bulk fills write to
+    this array directly.
+    """
+    return region._Region__blocks
+
+
+def _fill_region(
+    cells: np.ndarray,
+    stack_ids: np.ndarray,
+    stacks: Sequence[Sequence[lm.BlockState]],
+    y: int = 0,
+) -> lm.Region:
+    """Create a region holding the given stack of blocks at each cell, with the
+    bottom of each stack at height `y`.
+
+    The region spans the bounding box of `cells`, and extends from the first
+    cell towards positive or negative x and z depending on the sign of the last
+    cell's coordinates.
+    """
+    low = cells.min(axis=0)
+    high = cells.max(axis=0)
+    sign = np.where(cells[-1] >= 0, 1, -1)
+    origin = np.where(sign > 0, low, high)
+    span = (high - low + 1) * sign
+    used_stacks = np.unique(stack_ids)
+    region = lm.Region(
+        x=int(origin[0]),
+        y=int(y),
+        z=int(origin[1]),
+        width=int(span[0]),
+        height=max(len(stacks[stack_id]) for stack_id in used_stacks),
+        length=int(span[1]),
+    )
+    store = cells - low
+    heights = np.array([len(stack) for stack in stacks])
+    level_indices = np.zeros((len(stacks), region.height), dtype=np.uint32)
+    palette = [lm.BlockState("minecraft:air")]
+    # Stacks are registered in order of first appearance so that the palette
+    # matches placing each block individually
+    first_indices = np.unique(stack_ids, return_index=True)[1]
+    for stack_id in stack_ids[np.sort(first_indices)]:
+        rel = cells[np.argmax(stack_ids == stack_id)] - origin
+        for level, block_state in enumerate(stacks[stack_id]):
+            region[int(rel[0]), level, int(rel[1])] = block_state
+            if block_state not in palette:
+                palette.append(block_state)
+            level_indices[stack_id, level] = palette.index(block_state)
+    blocks = _block_array(region)
+    for level in range(region.height):
+        at_level = np.flatnonzero(heights[stack_ids] > level)
+        # Where a cell is repeated, the later stack is placed over the earlier
+        keys = store[at_level, 0] * abs(region.length) + store[at_level, 1]
+        last = len(keys) - 1 - np.unique(keys[::-1], return_index=True)[1]
+        at_level = at_level[last]
+        blocks[store[at_level, 0], level, store[at_level, 1]] = level_indices[stack_ids[at_level], level]
+    return region
 
 
 def _make_region(raster: Sequence[Vec2[int]], blocks: Sequence[lm.BlockState]) -> lm.Region:
@@ -86,29 +363,138 @@ def _make_region(raster: Sequence[Vec2[int]], blocks: Sequence[lm.BlockState]) -
     """
     if len(blocks) == 0:
         raise ValueError("Must be at least one BlockState provided.")
-    region_span = Vec2(
-        raster[-1].x - raster[0].x + (1 if raster[-1].x >= 0 else -1),
-        raster[-1].z - raster[0].z + (1 if raster[-1].z >= 0 else -1)
-    )
+    cells = _as_cells(raster)
+    return _fill_region(cells, np.zeros(len(cells), dtype=np.int64), [blocks])
+
+
+def _template_key(cells: np.ndarray, stack_ids: np.ndarray) -> bytes:
+    """A key which is equal for regions built by `_fill_region` with the same
+    content, whatever their position.
+    """
+    low = cells.min(axis=0)
+    sign = cells[-1] >= 0
+    return b"".join((sign.tobytes(), (cells - low).tobytes(), stack_ids.tobytes()))
+
+
+def _copy_region(template: lm.Region, cells: np.ndarray, y: int = 0) -> lm.Region:
+    """Create a region with the content of `template`, positioned to hold
+    `cells`, which must have the same shape as the template's cells.
+    """
+    low = cells.min(axis=0)
+    high = cells.max(axis=0)
+    origin = np.where(np.array([template.width, template.length]) > 0, low, high)
     region = lm.Region(
-        x=raster[0].x,
-        y=0,
-        z=raster[0].z,
-        width=int(region_span.x),
-        height=len(blocks),
-        length=int(region_span.z),
+        x=int(origin[0]),
+        y=int(y),
+        z=int(origin[1]),
+        width=template.width,
+        height=template.height,
+        length=template.length,
     )
-    for coords in raster:
-        for block_index, block_state in enumerate(blocks):
-            region[coords.x - raster[0].x, block_index, coords.z - raster[0].z] = block_state
+    region._Region__blocks = _block_array(template).copy()
+    region._Region__palette = list(template._Region__palette)
     return region
 
 
+def _build_regions(
+    cells: np.ndarray,
+    stack_ids: np.ndarray,
+    stacks: Sequence[Sequence[lm.BlockState]],
+    levels: np.ndarray | None = None,
+) -> list[lm.Region]:
+    placed = np.flatnonzero(stack_ids >= 0)
+    placed_cells = cells[placed]
+    placed_stack_ids = stack_ids[placed]
+    placed_levels = None if levels is None else levels[placed]
+    # Along a straight path most regions have the same shape, so each shape
+    # is only filled once
+    templates: dict[bytes, lm.Region] = {}
+    regions = []
+    for start, stop in _region_bounds(placed_cells, placed_levels):
+        region_cells = placed_cells[start:stop]
+        region_stack_ids = placed_stack_ids[start:stop]
+        y = 0 if placed_levels is None else placed_levels[start]
+        key = _template_key(region_cells, region_stack_ids)
+        if key in templates:
+            regions.append(_copy_region(templates[key], region_cells, y))
+        else:
+            region = _fill_region(region_cells, region_stack_ids, stacks, y)
+            templates[key] = region
+            regions.append(region)
+    return regions
+
+
+def schematic_from_raster(
+    raster: Sequence[Vec2[int]] | np.ndarray,
+    gap_size: int = 0,
+    blocks: lm.BlockState | Sequence[lm.BlockState] | Sequence[Sequence[lm.BlockState]] = lm.BlockState("minecraft:blue_ice"),
+    name: str | None = None,
+    layout: Layout | None = None,
+    start_index: int = 0,
+    levels: int | np.ndarray | None = None,
+    stations: np.ndarray | None = None,
+) -> lm.Schematic:
+    """Create a schematic for a precomputed raster, or a slice of one.
+
+    As with `generate_schematic`, the last position of the raster is left empty
+    as the start of the next path, so consecutive slices of a long raster should
+    share their boundary position, e.g., `raster[a:b + 1]` and `raster[b:c + 1]`.
+    A raster with several positions per step along the path, such as from
+    `Vec2.thick_raster_array`, needs its `stations` so that gaps and the
+    endpoint cover whole cross-sections of the road.
+
+    Parameters
+    ----------
+    `raster` : `Sequence[Vec2[int]]` or `numpy.ndarray`
+        The block positions of the path, e.g., from `Vec2.raster_array`,
+        `Vec2.thick_raster_array` or a `raster_file.RasterFile` slice.
+    `gap_size` : `int`, default `0`
+        The number of blocks to skip between each included block.
+    `blocks` : `litemapy.BlockState` or `Sequence` thereof, or `Sequence` of `Sequence`s
+        The stack of blocks to place at each position, or, with a `layout`,
+        a sequence of stacks.
+    `name` : `str`, optional
+        The name of the schematic, shown in the Litematica UI.
+    `layout` : `numpy.ndarray` or `Callable[[numpy.ndarray], numpy.ndarray]`, optional
+        The index of the stack to place at each position of `raster`.
+    `start_index` : `int`, default `0`
+        The index of the first position of `raster` within the whole raster,
+        so that gaps line up between slices. With `stations`, it is added to
+        each station instead.
+    `levels` : `int` or `numpy.ndarray`, optional
+        The height of the bottom block at each position of `raster`, e.g., from
+        `heightmap.path_levels`. Regions are cut where the level changes. If
+        not given, all stacks start at height 0.
+    `stations` : `numpy.ndarray`, optional
+        The station of each position of `raster` along the path, e.g., from
+        `Vec2.thick_raster_array` with `return_stations`. Gaps then skip whole
+        stations, and the positions at the last station are left empty. If not
+        given, each position is its own station.
+
+    Returns
+    -------
+    `schematic` : `litemapy.Schematic`
+        The schematic object representing the path, in the coordinates of `raster`.
+    """
+    cells = _as_cells(raster)
+    stacks = _as_stacks(blocks)
+    stack_ids = _stack_ids(cells, gap_size, layout, len(stacks), start_index, stations)
+    if name is None:
+        name = lm.info.DEFAULT_NAME
+    schem = lm.Schematic(name=name, author="mc_diag_boat")
+    regions = _build_regions(cells, stack_ids, stacks, _as_levels(levels, len(cells)))
+    for index, region in enumerate(regions):
+        schem.regions[str(index)] = region
+    return schem
+
+
 def generate_schematic(
     offset: Vec2,
     gap_size: int = 0,
-    blocks: lm.BlockState | Sequence[lm.BlockState] = lm.BlockState("minecraft:blue_ice"),
-    name: str | None = None
+    blocks: lm.BlockState | Sequence[lm.BlockState] | Sequence[Sequence[lm.BlockState]] = lm.BlockState("minecraft:blue_ice"),
+    name: str | None = None,
+    layout: Layout | None = None,
+    levels: int | np.ndarray | None = None,
 ) -> lm.Schematic:
     """Create a schematic for the path to the given offset.
 
@@ -125,8 +511,21 @@ def generate_schematic(
     `gap_size` : `int`, default `0`
         The number of blocks to skip between each included block. `0` or `1`
         are recommended for boat roads. Should be non-negative.
+    `blocks` : `litemapy.BlockState` or `Sequence` thereof, or `Sequence` of `Sequence`s
+        The stack of blocks to place at each position, bottom first. With a
+        `layout`, a sequence of such stacks may be given instead.
     `name` : `str`, optional
         The name of the schematic, shown in the Litematica UI.
+    `layout` : `numpy.ndarray` or `Callable[[numpy.ndarray], numpy.ndarray]`, optional
+        The index of the stack in `blocks` to place at each raster position, or
+        `-1` to leave it empty, e.g., as built by `layout_from_masks`. A callable
+        is passed the `(n, 2)` raster array and must return such indices. Gaps
+        are applied on top of the layout. If not given, the first stack is placed
+        at every position.
+    `levels` : `int` or `numpy.ndarray`, optional
+        The height of the bottom block at each raster position, e.g., to follow
+        terrain with `heightmap.path_levels`. If not given, all stacks start at
+        height 0.
 
     Returns
     -------
@@ -134,15 +533,117 @@ def generate_schematic(
         The schematic object representing the path from block (0, 0) to block
         `offset`, with gaps added.
     """
-    raster = offset.raster()
-    gapped_raster = _add_gaps(raster, gap_size)
-    regioned_raster = _cut_regions(gapped_raster)
+    return schematic_from_raster(offset.raster_array(), gap_size, blocks, name, layout, levels=levels)
+
+
+def lane_translations(offset: Vec2, n_lanes: int, spacing: float = 3) -> np.ndarray:
+    """The integer translation of each lane of a multi-lane road.
+
+    Lanes are translated along the minor axis of the path, i.e., the axis it
+    advances along least, so each lane keeps exactly the first lane's shape and
+    no two lanes share a block.
+
+    Parameters
+    ----------
+    `offset` : `Vec2`
+        The offset of the path, which sets its direction.
+    `n_lanes` : `int`
+        The number of lanes, including the first.
+    `spacing` : `float`, default `3`
+        The distance between the centre lines of neighbouring lanes,
+        perpendicular to the path. The sign sets which side lanes are added on.
+        Rounded to the nearest whole block along the minor axis, but at least one.
+
+    Returns
+    -------
+    `translations` : `numpy.ndarray`
+        An integer array of shape `(n_lanes, 2)`, starting with `(0, 0)`.
+    """
+    if n_lanes < 1:
+        raise ValueError("n_lanes must be positive")
+    direction = np.array(offset.as_tuple(), dtype=float)
+    if not np.any(direction):
+        raise ValueError("offset must be non-zero")
+    major = int(np.argmax(np.abs(direction)))
+    # A step of one block along the minor axis moves the lane this far
+    # perpendicular to the path
+    perpendicular = abs(direction[major]) / np.hypot(*direction)
+    step = max(1, round(abs(spacing) / perpendicular)) * (1 if spacing >= 0 else -1)
+    translations = np.zeros((n_lanes, 2), dtype=np.int64)
+    translations[:, 1 - major] = np.arange(n_lanes) * step
+    return translations
+
+
+def multi_lane_schematic(
+    offset: Vec2,
+    n_lanes: int = 2,
+    spacing: float = 3,
+    gap_size: int = 0,
+    blocks: lm.BlockState | Sequence[lm.BlockState] | Sequence[Sequence[lm.BlockState]] = lm.BlockState("minecraft:blue_ice"),
+    name: str | None = None,
+    layout: Layout | None = None,
+    shared_regions: bool = True,
+) -> lm.Schematic:
+    """Create a schematic of parallel lanes of the path to the given offset.
+
+    The raster, gaps and layout are computed once, and each lane is an integer
+    translation of the first, as given by `lane_translations`.
+
+    Parameters
+    ----------
+    `offset` : `Vec2`
+        The endpoint of the first lane. See `generate_schematic`.
+    `n_lanes` : `int`, default `2`
+        The number of lanes.
+    `spacing` : `float`, default `3`
+        The distance between neighbouring lanes, perpendicular to the path.
+    `gap_size`, `blocks`, `name`, `layout`
+        As for `generate_schematic`. Every lane has the same gaps and layout.
+    `shared_regions` : `bool`, default `True`
+        Cut regions across all lanes together, so nearby lanes share regions
+        and the schematic has fewer of them. Otherwise, each lane has its own
+        regions, translated copies of the first lane's.
+
+    Returns
+    -------
+    `schematic` : `litemapy.Schematic`
+        The schematic object representing the lanes, with the first lane
+        starting at block (0, 0).
+    """
+    cells = offset.raster_array()
+    stacks = _as_stacks(blocks)
+    stack_ids = _stack_ids(cells, gap_size, layout, len(stacks))
+    translations = lane_translations(offset, n_lanes, spacing)
+    if shared_regions:
+        # Lanes close enough to share regions are grouped, and their positions
+        # ordered along the raster, across the lanes at each raster cell. Runs
+        # of a repeated cell stay together, so no cell is split across regions.
+        runs = np.concatenate(([0], np.cumsum(np.any(np.diff(cells, axis=0) != 0, axis=1))))
+        lanes = np.arange(n_lanes)
+        spread = np.abs(translations).sum(axis=1)
+        group_starts = [0]
+        for lane in lanes[1:]:
+            if spread[lane] - spread[group_starts[-1]] > SXN_SIZE // 2:
+                group_starts.append(lane)
+        regions = []
+        for group in np.split(lanes, group_starts[1:]):
+            lane_cells = (translations[group][:, None] + cells[None]).reshape(-1, 2)
+            lane_index = np.repeat(np.arange(len(group)), len(cells))
+            order = np.lexsort((lane_index, np.tile(runs, len(group))))
+            regions.extend(_build_regions(lane_cells[order], np.tile(stack_ids, len(group))[order], stacks))
+    else:
+        first_lane = _build_regions(cells, stack_ids, stacks)
+        placed_cells = cells[stack_ids >= 0]
+        bounds = _region_bounds(placed_cells)
+        regions = list(first_lane)
+        for translation in translations[1:]:
+            regions.extend(
+                _copy_region(template, placed_cells[start:stop] + translation)
+                for template, (start, stop) in zip(first_lane, bounds)
+            )
     if name is None:
         name = lm.info.DEFAULT_NAME
     schem = lm.Schematic(name=name, author="mc_diag_boat")
-    if isinstance(blocks, lm.BlockState):
-        blocks = [blocks]
-    for index, region in enumerate(regioned_raster):
-        schem.regions[str(index)] = _make_region(region, blocks)
+    for index, region in enumerate(regions):
+        schem.regions[str(index)] = region
     return schem
-
@@ -0,0 +1,334 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""A local planning service which keeps computed patterns and imported
+dependencies warm between requests.
+
+Requests and responses are newline-delimited JSON objects, sent over a TCP or
+Unix socket. Each request has the form
+`{"id": ..., "method": ..., "params": {...}}`, and is answered with either
+`{"id": ..., "result": ...}` or `{"id": ..., "error": {"type": ..., "message": ...}}`.
+Requests on one connection are handled concurrently, so responses may arrive
+out of order.
+
+Methods
+-------
+`patterns`
+    `{"offset": [x, z], "n_angles": 4, "max_pattern_len": 64}`
+    All patterns for the `n_angles` boat angles closest to the offset.
+`pareto`
+    Same parameters as `patterns`. The deduplicated pareto front of those
+    patterns by destination error, deviation and length.
+`schematic`
+    `{"offset": [x, z], "path": str, "gap_size": 0, "blocks": ["minecraft:blue_ice"], "name": null}`
+    Saves the schematic for the path to `offset` at `path`, relative to the
+    service's output directory, which it may not leave. `blocks` may also be
+    a single block.
+
+Run with `python -m mc_diag_boat.service --port 8765` or `--unix PATH`, and
+`--output-dir DIR` to choose where schematics are saved.
+"""
+
+
+from typing import Any, Callable
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import multiprocessing
+import re
+import litemapy as lm
+from .vec2 import Vec2
+from .angle import BoatAngle
+from .pattern import Pattern, PatternGenerator, unique_patterns
+from .optimization import ParetoArchive
+from .schematic import generate_schematic
+
+
+_BLOCK_PATTERN = re.compile(r"^([^\[\]]+)(?:\[(.*)\])?$")
+
+
+def parse_block(text: str) -> lm.BlockState:
+    """Parse a block state from its identifier, e.g., `"minecraft:lever[face=floor]"`.
+
+    Parameters
+    ----------
+    `text` : `str`
+        The block id, optionally followed by comma-separated `key=value`
+        properties in square brackets.
+
+    Returns
+    -------
+    `block` : `litemapy.BlockState`
+        The parsed block state.
+    """
+    match = _BLOCK_PATTERN.match(text.strip())
+    if match is None:
+        raise ValueError(f"Invalid block state: {text}")
+    block_id, properties = match.groups()
+    if not properties:
+        return lm.BlockState(block_id)
+    return lm.BlockState(block_id, **dict(
+        prop.split("=", 1) for prop in properties.split(",")
+    ))
+
+
+@lru_cache(maxsize=1024)
+def _boat_patterns(offset: tuple[float, float], n_angles: int, max_pattern_len: int) -> list[Pattern]:
+    target = Vec2(*offset)
+    return [
+        pattern
+        for angle in BoatAngle.closest(target.angle(), n_angles)
+        for pattern in PatternGenerator(target.project(Vec2(*angle.unit_vector())), max_pattern_len).patterns
+    ]
+
+
+def _pattern_record(offset: Vec2, pattern: Pattern) -> dict[str, Any]:
+    return {
+        "boat_angle": BoatAngle.from_angle(pattern.target.angle()).index,
+        "cells": [coord.as_tuple() for coord in pattern],
+        "target": pattern.target.as_tuple(),
+        "dest_error": (offset - pattern.target).length(),
+        "deviation": pattern.deviation(),
+        "length": len(pattern),
+    }
+
+
+def patterns_job(offset: tuple[float, float], n_angles: int = 4, max_pattern_len: int = 64) -> list[dict[str, Any]]:
+    """All patterns for the boat angles closest to an offset, as records.
+    """
+    target = Vec2(*offset)
+    return [
+        _pattern_record(target, pattern)
+        for pattern in _boat_patterns(offset, n_angles, max_pattern_len)
+    ]
+
+
+def pareto_job(offset: tuple[float, float], n_angles: int = 4, max_pattern_len: int = 64) -> list[dict[str, Any]]:
+    """The deduplicated pareto front of `patterns_job`, as records.
+    """
+    target = Vec2(*offset)
+    archive: ParetoArchive[Pattern] = ParetoArchive(3)
+    for pattern in _boat_patterns(offset, n_angles, max_pattern_len):
+        archive.insert(
+            (-(target - pattern.target).length(), -pattern.deviation(), -len(pattern)),
+            pattern,
+        )
+    return [
+        _pattern_record(target, pattern)
+        for pattern in unique_patterns(archive.items, match_target=False)
+    ]
+
+
+def schematic_job(
+    offset: tuple[float, float],
+    path: str,
+    gap_size: int = 0,
+    blocks: str | tuple[str, ...] = ("minecraft:blue_ice",),
+    name: str | None = None,
+) -> dict[str, Any]:
+    """Save the schematic of the path to an offset.
+    """
+    if isinstance(blocks, str):
+        blocks = (blocks,)
+    schem = generate_schematic(Vec2(*offset), gap_size, [parse_block(block) for block in blocks], name)
+    schem.save(path)
+    return {"path": path, "regions": len(schem.regions)}
+
+
+class PlanningService:
+    """Serves planning requests, running computations on an executor pool.
+
+    Results are cached by method and parameters. Identical requests which
+    arrive while a computation is running wait on that computation rather
+    than starting another.
+    """
+    JOBS: dict[str, Callable[..., Any]] = {
+        "patterns": patterns_job,
+        "pareto": pareto_job,
+        "schematic": schematic_job,
+    }
+    UNCACHED = {"schematic"}
+    OUTPUT_PATHS = {"schematic": "path"}
+
+    def __init__(
+        self,
+        executor: Executor | None = None,
+        cache_size: int = 4096,
+        output_dir: str | Path = ".",
+    ) -> None:
+        """
+        Parameters
+        ----------
+        `executor` : `concurrent.futures.Executor`, optional
+            The pool to run computations on. If not given, a process pool with
+            one worker per CPU is created, and shut down by `close()`. A process
+            pool should not fork its workers, or they keep client connections
+            open after the service closes them.
+        `cache_size` : `int`, default `4096`
+            The number of results to keep, least recently used first out.
+        `output_dir` : `str` or `Path`, default `"."`
+            The directory files are saved in. Requested paths are relative to
+            it, and paths which leave it are rejected.
+        """
+        self._owns_executor = executor is None
+        self.executor = _process_pool() if executor is None else executor
+        self.cache_size = cache_size
+        self.output_dir = Path(output_dir).resolve()
+        self._cache: OrderedDict[str, Any] = OrderedDict()
+        self._pending: dict[str, asyncio.Future] = {}
+
+    def close(self) -> None:
+        """Shut down the executor, if it was created by this service.
+        """
+        if self._owns_executor:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def call(self, method: str, params: dict[str, Any]) -> Any:
+        """Run a method, reusing cached or in-flight results of identical calls.
+
+        Parameters
+        ----------
+        `method` : `str`
+            The name of the method, one of `PlanningService.JOBS`.
+        `params` : `dict[str, Any]`
+            The keyword arguments of the method.
+
+        Returns
+        -------
+        `result`
+            The JSON-serializable result of the method.
+        """
+        if method not in self.JOBS:
+            raise ValueError(f"Unknown method {method}")
+        params = {key: tuple(value) if isinstance(value, list) else value for key, value in params.items()}
+        if method in self.OUTPUT_PATHS and self.OUTPUT_PATHS[method] in params:
+            name = self.OUTPUT_PATHS[method]
+            params[name] = self._output_path(params[name])
+        key = json.dumps([method, params], sort_keys=True)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if key not in self._pending:
+            loop = asyncio.get_running_loop()
+            self._pending[key] = loop.run_in_executor(
+                self.executor,
+                _call_job,
+                self.JOBS[method],
+                params,
+            )
+        future = self._pending[key]
+        try:
+            result = await asyncio.shield(future)
+        finally:
+            if self._pending.get(key) is future and future.done():
+                del self._pending[key]
+        if method not in self.UNCACHED:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _output_path(self, path: Any) -> str:
+        """Resolve a requested output path within the output directory."""
+        if not isinstance(path, str):
+            raise TypeError("path must be a string")
+        resolved = (self.output_dir / path).resolve()
+        if resolved == self.output_dir or not resolved.is_relative_to(self.output_dir):
+            raise ValueError(f"path {path} is outside the output directory")
+        return str(resolved)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer each newline-delimited JSON request on a connection.
+        """
+        lock = asyncio.Lock()
+        tasks: set[asyncio.Task] = set()
+
+        async def respond(line: bytes) -> None:
+            request_id = None
+            try:
+                request = json.loads(line)
+                request_id = request.get("id")
+                response = {"id": request_id, "result": await self.call(request["method"], request.get("params", {}))}
+            except Exception as e:
+                response = {"id": request_id, "error": {"type": type(e).__name__, "message": str(e)}}
+            async with lock:
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(respond(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, unix_path: str | None = None) -> None:
+        """Serve requests until cancelled.
+
+        Parameters
+        ----------
+        `host` : `str`, default `"127.0.0.1"`
+            The address to listen on, if not serving on a Unix socket.
+        `port` : `int`, default `8765`
+            The port to listen on, if not serving on a Unix socket.
+        `unix_path` : `str`, optional
+            The path of a Unix socket to listen on instead of TCP.
+        """
+        if unix_path is None:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        else:
+            server = await asyncio.start_unix_server(self.handle_connection, unix_path)
+        async with server:
+            await server.serve_forever()
+
+
+def _call_job(job: Callable[..., Any], params: dict[str, Any]) -> Any:
+    return job(**params)
+
+
+def _process_pool(max_workers: int | None = None) -> ProcessPoolExecutor:
+    # Workers start during a request, so forked ones would inherit the open client sockets
+    return ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve mc_diag_boat planning requests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None, help="Path of a Unix socket to serve on instead of TCP")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output-dir", default=".", help="Directory to save schematics in")
+    args = parser.parse_args()
+    service = PlanningService(_process_pool(args.workers), output_dir=args.output_dir)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.executor.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main()
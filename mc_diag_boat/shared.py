@@ -0,0 +1,242 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from typing import Iterator, Sequence, Self
+from dataclasses import dataclass
+from itertools import count
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+import os
+import secrets
+import tempfile
+import weakref
+import numpy as np
+from .vec2 import Vec2
+from .pattern import Pattern
+
+
+@dataclass(frozen=True, slots=True)
+class SessionSpec:
+    """The picklable description of a `SharedSession`, passed to workers so
+    they can create blocks that the session will own.
+    """
+    prefix: str
+    journal: str
+
+
+@dataclass(frozen=True, slots=True)
+class SharedArrayRef:
+    """The picklable description of an array in a shared memory block.
+    """
+    name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+
+_block_numbers = count()
+
+
+def share_array(spec: SessionSpec, array: np.ndarray) -> SharedArrayRef:
+    """Copy an array into a new shared memory block owned by a session.
+
+    This is called by workers. The block's name is journaled before it is
+    created, so the session can remove it even if the worker crashes before
+    returning the reference.
+
+    Parameters
+    ----------
+    `spec` : `SessionSpec`
+        The `spec` of the session which will own the block.
+    `array` : `numpy.ndarray`
+        The array to share.
+
+    Returns
+    -------
+    `ref` : `SharedArrayRef`
+        The reference to return to the session's process.
+    """
+    array = np.ascontiguousarray(array)
+    name = f"{spec.prefix}_{os.getpid()}_{next(_block_numbers)}"
+    with open(spec.journal, "a") as journal:
+        journal.write(name + "\n")
+    block = SharedMemory(name=name, create=True, size=max(array.nbytes, 1))
+    # Ownership passes to the session, which unlinks the block when done
+    resource_tracker.unregister(block._name, "shared_memory")
+    np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+    block.close()
+    return SharedArrayRef(name, array.shape, array.dtype.str)
+
+
+def share_arrays(spec: SessionSpec, **arrays: np.ndarray) -> dict[str, SharedArrayRef]:
+    """Copy several arrays into shared memory blocks owned by a session.
+
+    Parameters
+    ----------
+    `spec` : `SessionSpec`
+        The `spec` of the session which will own the blocks.
+    `**arrays` : `numpy.ndarray`
+        The arrays to share, by name.
+
+    Returns
+    -------
+    `refs` : `dict[str, SharedArrayRef]`
+        The reference of each array, by the same names.
+    """
+    return {key: share_array(spec, array) for key, array in arrays.items()}
+
+
+class SharedSession:
+    """Owns the shared memory blocks created by workers for a batch of work,
+    and gives zero-copy views of them.
+
+    Blocks are unlinked when released, or all at once when the session is
+    closed, including blocks created by workers which crashed before their
+    references were returned. A released block's memory stays mapped until the
+    last view of it is dropped, so views never dangle. Use as a context manager.
+
+    Blocks outlive the worker that created them only on POSIX systems.
+    """
+
+    def __init__(self, directory: str | Path | None = None) -> None:
+        """
+        Parameters
+        ----------
+        `directory` : `str` or `Path`, optional
+            Where to keep the journal of block names. Defaults to the system
+            temporary directory.
+        """
+        prefix = f"mcdb_{os.getpid()}_{secrets.token_hex(4)}"
+        journal = Path(directory or tempfile.gettempdir()) / f"{prefix}.journal"
+        journal.touch()
+        self.spec = SessionSpec(prefix, str(journal))
+        self._released: set[str] = set()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def attach(self, ref: SharedArrayRef) -> np.ndarray:
+        """A zero-copy view of a shared array.
+
+        Parameters
+        ----------
+        `ref` : `SharedArrayRef`
+            The reference returned by `share_array`.
+
+        Returns
+        -------
+        `array` : `numpy.ndarray`
+            A view of the block's contents. The block stays mapped for as long
+            as this view, or any view derived from it, is referenced.
+        """
+        block = SharedMemory(name=ref.name)
+        array = np.frombuffer(block.buf, np.dtype(ref.dtype), int(np.prod(ref.shape)))
+        # The array's base is a memoryview holding an export of the mapping,
+        # which keeps the mapping open until it and every view of it are gone
+        weakref.finalize(array.base, block.close).atexit = False
+        return array.reshape(ref.shape)
+
+    def attach_all(self, refs: dict[str, SharedArrayRef]) -> dict[str, np.ndarray]:
+        """Zero-copy views of several shared arrays.
+
+        Parameters
+        ----------
+        `refs` : `dict[str, SharedArrayRef]`
+            The references returned by `share_arrays`.
+
+        Returns
+        -------
+        `arrays` : `dict[str, numpy.ndarray]`
+            A view of each array, by the same names.
+        """
+        return {key: self.attach(ref) for key, ref in refs.items()}
+
+    def release(self, ref: SharedArrayRef) -> None:
+        """Unlink a block, so its memory is freed once no views of it remain.
+
+        Parameters
+        ----------
+        `ref` : `SharedArrayRef`
+            The reference of the block to release.
+        """
+        self._unlink(ref.name)
+
+    def close(self) -> None:
+        """Release every block created for this session, attached or not.
+        """
+        journal = Path(self.spec.journal)
+        if journal.exists():
+            for name in journal.read_text().split():
+                self._unlink(name)
+            journal.unlink()
+
+    def _unlink(self, name: str) -> None:
+        if name in self._released:
+            return
+        try:
+            block = SharedMemory(name=name)
+        except FileNotFoundError:
+            pass
+        else:
+            block.unlink()
+            block.close()
+        self._released.add(name)
+
+
+def patterns_to_arrays(patterns: Sequence[Pattern]) -> dict[str, np.ndarray]:
+    """Pack patterns into flat arrays, e.g., for `share_arrays`.
+
+    Parameters
+    ----------
+    `patterns` : `Sequence[Pattern]`
+        The patterns to pack.
+
+    Returns
+    -------
+    `arrays` : `dict[str, numpy.ndarray]`
+        `"cells"`, the `(n_cells, 2)` block positions of all patterns in order,
+        `"lengths"`, the number of cells in each pattern, and `"targets"`, the
+        `(n_patterns, 2)` target of each pattern.
+    """
+    lengths = np.array([len(pattern) for pattern in patterns], dtype=np.int64)
+    cells = np.array(
+        [coord.as_tuple() for pattern in patterns for coord in pattern],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    targets = np.array([pattern.target.as_tuple() for pattern in patterns], dtype=float).reshape(-1, 2)
+    return {"cells": cells, "lengths": lengths, "targets": targets}
+
+
+def patterns_from_arrays(cells: np.ndarray, lengths: np.ndarray, targets: np.ndarray) -> Iterator[Pattern]:
+    """Unpack patterns packed by `patterns_to_arrays`, one at a time.
+
+    Parameters
+    ----------
+    `cells`, `lengths`, `targets` : `numpy.ndarray`
+        The arrays returned by `patterns_to_arrays`.
+
+    Returns
+    -------
+    `patterns` : `Iterator[Pattern]`
+        The patterns, in their original order.
+    """
+    stops = np.cumsum(lengths)
+    for start, stop, target in zip((stops - lengths).tolist(), stops.tolist(), targets.tolist()):
+        yield Pattern((Vec2(x, z) for x, z in cells[start:stop].tolist()), Vec2(*target))
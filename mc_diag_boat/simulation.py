@@ -0,0 +1,251 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Simulating a boat travelling along planned roads, to rank candidate
+patterns and boat angles by how far a boat actually gets on them.
+"""
+
+
+from typing import Sequence
+from dataclasses import dataclass
+import numpy as np
+from .vec2 import Vec2
+from .angle import BoatAngle
+from .pattern import Pattern, FrozenPattern
+from .schematic import _as_cells, periodic_mask
+
+
+BOAT_WIDTH = 1.375
+# A boat is supported while its hitbox overlaps a placed block, i.e., while the
+# Chebyshev distance between the boat and the block's centre is below this
+_REACH = (BOAT_WIDTH + 1) / 2
+_NEIGHBOURS = np.array([(dx, dz) for dx in (-1, 0, 1) for dz in (-1, 0, 1)], dtype=np.int64)
+
+
+@dataclass(frozen=True)
+class Simulation:
+    """The outcome of simulating a boat along each of several roads.
+
+    Attributes
+    ----------
+    `failure_distance` : `numpy.ndarray`
+        The distance travelled by each boat before its hitbox first stopped
+        overlapping any placed block, `inf` where the boat reached the end.
+    `min_margin` : `numpy.ndarray`
+        The smallest margin of support along each road, in blocks: how much
+        further the boat could have drifted sideways before losing the road.
+        Negative where the boat fell off, `-inf` where it left the road
+        entirely.
+    `distance` : `numpy.ndarray`
+        The distance each boat was meant to travel.
+    """
+    failure_distance: np.ndarray
+    min_margin: np.ndarray
+    distance: np.ndarray
+
+    def completed(self) -> np.ndarray:
+        """Whether each boat reached the end of its road."""
+        return np.isinf(self.failure_distance)
+
+    def objectives(self) -> np.ndarray:
+        """The distance travelled and the minimum margin of each road, as
+        columns to maximize, e.g., with `pareto_indices`.
+
+        Returns
+        -------
+        `objectives` : `numpy.ndarray`
+            A float array of shape `(n, 2)`.
+        """
+        return np.column_stack((np.minimum(self.failure_distance, self.distance), self.min_margin))
+
+
+def _directions(angles: Sequence[BoatAngle], n: int) -> np.ndarray:
+    if len(angles) != n:
+        raise ValueError("angles must have one boat angle per road")
+    return np.array([angle.unit_vector() for angle in angles], dtype=np.float64).reshape(-1, 2)
+
+
+def _distances(distance: float | Sequence[float] | None, default: np.ndarray) -> np.ndarray:
+    if distance is None:
+        return default
+    distances = np.broadcast_to(np.asarray(distance, dtype=np.float64), default.shape)
+    if np.any(distances < 0):
+        raise ValueError("distance must be non-negative")
+    return distances
+
+
+def _keys(ids: np.ndarray, cells: np.ndarray, radius: int) -> np.ndarray:
+    side = 2 * radius + 1
+    return (ids * side + cells[:, 0] + radius) * side + cells[:, 1] + radius
+
+
+def _simulate(
+    roads: list[np.ndarray],
+    directions: np.ndarray,
+    distances: np.ndarray,
+    step: float,
+    max_steps: int,
+) -> Simulation:
+    """Move a boat from the first block of each road along its direction,
+    checking its hitbox against the road's placed blocks after every step.
+
+    Each road holds block positions relative to the boat's start. Roads are
+    simulated in batches of at most `max_steps` steps (or one road if it is
+    longer), with every step of every road in the batch checked at once.
+    """
+    if step <= 0:
+        raise ValueError("step must be positive")
+    n = len(roads)
+    failure_distance = np.full(n, np.inf)
+    min_margin = np.full(n, np.inf)
+    n_steps = np.floor(distances / step).astype(np.int64) + 1
+    first = 0
+    while first < n:
+        stop = first + max(1, int(np.searchsorted(np.cumsum(n_steps[first:]), max_steps, side="right")))
+        batch = range(first, stop)
+        counts = n_steps[first:stop]
+        road_ids = np.repeat(np.arange(len(batch)), counts)
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        travelled = (np.arange(counts.sum()) - np.repeat(offsets, counts)) * step
+        boats = travelled[:, None] * directions[first:stop][road_ids]
+        # Sorted keys of (road, x, z), so that every lookup is one searchsorted
+        cells = np.concatenate([roads[i] for i in batch])
+        cell_ids = np.repeat(np.arange(len(batch)), [len(roads[i]) for i in batch])
+        radius = int(max(np.abs(cells).max(), np.abs(boats).max())) + 2
+        road_keys = np.unique(_keys(cell_ids, cells, radius))
+        nearest = np.full(len(boats), np.inf)
+        base = np.rint(boats).astype(np.int64)
+        for offset in _NEIGHBOURS:
+            candidates = base + offset
+            candidate_keys = _keys(road_ids, candidates, radius)
+            found = np.searchsorted(road_keys, candidate_keys)
+            found = road_keys[np.minimum(found, len(road_keys) - 1)] == candidate_keys
+            gap = np.abs(candidates - boats).max(axis=1)
+            nearest = np.where(found, np.minimum(nearest, gap), nearest)
+        margin = _REACH - nearest
+        min_margin[first:stop] = np.minimum.reduceat(margin, offsets)
+        failed = np.where(margin <= 0, travelled, np.inf)
+        failure_distance[first:stop] = np.minimum.reduceat(failed, offsets)
+        first = stop
+    return Simulation(failure_distance, min_margin, distances)
+
+
+def simulate_patterns(
+    patterns: Sequence[Pattern | FrozenPattern],
+    angles: Sequence[BoatAngle] | None = None,
+    distance: float | Sequence[float] | None = None,
+    gap_size: int = 0,
+    step: float = 0.25,
+    max_steps: int = 1 << 21,
+) -> Simulation:
+    """Simulate a boat on the road built by repeating each pattern.
+
+    Each road starts with the first block of its pattern, and the pattern
+    is repeated end to start, as when building, for as far as the boat
+    travels. Gaps are left along the whole road as in `gap_mask`. The boat
+    starts at the centre of the first block and moves in a straight line at
+    its boat angle, so a pattern whose direction drifts away from the boat
+    angle eventually loses the boat.
+
+    Parameters
+    ----------
+    `patterns` : `Sequence[Pattern | FrozenPattern]`
+        The candidate patterns, each with at least two block positions.
+    `angles` : `Sequence[BoatAngle]` or `None`, default `None`
+        The boat angle to travel at for each pattern. If `None`, the boat
+        angle closest to each pattern's target is used. The same pattern may
+        be passed several times to compare several boat angles.
+    `distance` : `float`, `Sequence[float]` or `None`, default `None`
+        How far each boat travels. If `None`, the length of each pattern's target.
+    `gap_size` : `int`, default `0`
+        The number of blocks to skip between each placed block.
+    `step` : `float`, default `0.25`
+        The distance the boat moves between hitbox checks. Should be well
+        below the boat width so the boat cannot skip over a gap.
+    `max_steps` : `int`, default `2097152`
+        The number of steps checked at once, bounding memory use.
+
+    Returns
+    -------
+    `simulation` : `Simulation`
+        The failure distance and minimum margin of each pattern, in order.
+    """
+    if any(len(pattern) < 2 for pattern in patterns):
+        raise ValueError("Patterns must have at least two block positions")
+    if angles is None:
+        angles = [BoatAngle.from_angle(pattern.target.angle()) for pattern in patterns]
+    directions = _directions(angles, len(patterns))
+    distances = _distances(distance, np.array([pattern.target.length() for pattern in patterns]))
+    roads = []
+    for pattern, direction, length in zip(patterns, directions, distances):
+        cells = _as_cells(pattern)
+        cells = cells - cells[0]
+        period = cells[-1]
+        advance = period @ direction
+        # Enough repetitions to pass the end of the trip, plus one for the hitbox
+        repeats = int(length / advance) + 2 if advance > 0 else 1
+        road = (np.arange(repeats)[:, None, None] * period + cells[:-1]).reshape(-1, 2)
+        roads.append(road[periodic_mask(len(road), gap_size + 1)])
+    return _simulate(roads, directions, distances, step, max_steps)
+
+
+def simulate_rasters(
+    rasters: Sequence[Sequence[Vec2[int]] | np.ndarray],
+    angles: Sequence[BoatAngle] | None = None,
+    distance: float | Sequence[float] | None = None,
+    gap_size: int = 0,
+    step: float = 0.25,
+    max_steps: int = 1 << 21,
+) -> Simulation:
+    """Simulate a boat on each raster, built as by `schematic_from_raster`.
+
+    Parameters
+    ----------
+    `rasters` : `Sequence[Sequence[Vec2[int]] | numpy.ndarray]`
+        The rasters of the roads, each with at least two positions. The
+        endpoint of each raster is not placed, and gaps are left as in
+        `gap_mask`.
+    `angles` : `Sequence[BoatAngle]` or `None`, default `None`
+        The boat angle to travel at along each raster. If `None`, the boat
+        angle closest to the direction from the first to the last position.
+    `distance` : `float`, `Sequence[float]` or `None`, default `None`
+        How far each boat travels. If `None`, the distance from the first to
+        the last position of each raster along its boat angle.
+    `gap_size` : `int`, default `0`
+        The number of blocks to skip between each placed block.
+    `step` : `float`, default `0.25`
+        The distance the boat moves between hitbox checks.
+    `max_steps` : `int`, default `2097152`
+        The number of steps checked at once, bounding memory use.
+
+    Returns
+    -------
+    `simulation` : `Simulation`
+        The failure distance and minimum margin of each raster, in order.
+    """
+    roads = []
+    for raster in rasters:
+        cells = _as_cells(raster)
+        if len(cells) < 2:
+            raise ValueError("Rasters must have at least two positions")
+        roads.append(cells - cells[0])
+    if angles is None:
+        angles = [BoatAngle.from_angle(Vec2(*(road[-1].tolist())).angle()) for road in roads]
+    directions = _directions(angles, len(roads))
+    distances = _distances(distance, np.array([max(0.0, road[-1] @ d) for road, d in zip(roads, directions)]))
+    roads = [road[:-1][periodic_mask(len(road) - 1, gap_size + 1)] for road in roads]
+    return _simulate(roads, directions, distances, step, max_steps)
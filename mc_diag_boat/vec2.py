@@ -15,9 +15,10 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-from typing import ClassVar, Generic, Self, SupportsIndex, TypeVar, overload
+from typing import ClassVar, Generic, Iterator, Self, SupportsIndex, TypeVar, overload
 from dataclasses import dataclass
 from math import radians, degrees, sin, cos, atan2, dist
+import numpy as np
 import skimage.draw
 from .angle import Angle
 
@@ -275,20 +276,215 @@ class Vec2(Generic[_T]):
         `raster` : `list` of `Vec2[int]`
             The list of block locations in the continuous, direct path.
         """
+        return [Vec2(int(x), int(z)) for x, z in self.raster_array(origin, block_coords).tolist()]
+
+    def raster_array(self, origin: "Vec2 | None" = None, block_coords: bool = True) -> np.ndarray:
+        """The raster of this vector, as an array.
+
+        Parameters
+        ----------
+        `origin` : `Vec2` or `None`, optional
+            The start coordinate of the raster.
+            If `None` (default), `Vec2(0, 0)` is used.
+        `block_coords` : `bool`, optional
+            Whether the origin and end coordinate parameters represent
+            block locations or continuous coordinate values.
+
+        Returns
+        -------
+        `raster` : `numpy.ndarray`
+            An integer array of shape `(n, 2)` holding the `x` and `z` values
+            of the same block locations as `raster()`, in the same order.
+        """
+        if origin is None:
+            origin = Vec2(0, 0)
+        if block_coords:
+            coord_adjustment = Vec2.ZERO
+        else:
+            coord_adjustment = Vec2(-0.5, -0.5)
+        return np.stack(skimage.draw.line_nd(
+            (origin + coord_adjustment).as_tuple(),
+            (self + coord_adjustment).as_tuple(),
+            endpoint=True,
+        ), axis=1)
+
+    def raster_chunks(
+        self,
+        origin: "Vec2 | None" = None,
+        block_coords: bool = True,
+        chunk_size: int = 1 << 20,
+    ) -> Iterator[np.ndarray]:
+        """The raster of this vector, as consecutive array chunks.
+
+        The chunks are computed one at a time, so memory use is bounded by
+        `chunk_size` regardless of the length of the raster.
+
+        Parameters
+        ----------
+        `origin` : `Vec2` or `None`, optional
+            The start coordinate of the raster.
+            If `None` (default), `Vec2(0, 0)` is used.
+        `block_coords` : `bool`, optional
+            Whether the origin and end coordinate parameters represent
+            block locations or continuous coordinate values.
+        `chunk_size` : `int`, default `1 << 20`
+            The maximum number of block locations in each chunk.
+
+        Returns
+        -------
+        `chunks` : `Iterator[numpy.ndarray]`
+            Integer arrays of shape `(k, 2)` which, concatenated, equal
+            `raster_array()` with the same parameters.
+        """
         if origin is None:
             origin = Vec2(0, 0)
         if block_coords:
             coord_adjustment = Vec2.ZERO
         else:
             coord_adjustment = Vec2(-0.5, -0.5)
-        return [
-            Vec2(int(x), int(z))
-            for x, z in zip(*skimage.draw.line_nd(
-                (origin + coord_adjustment).as_tuple(),
-                (self + coord_adjustment).as_tuple(),
-                endpoint=True,
-            ))
-        ]
+        start = np.asarray((origin + coord_adjustment).as_tuple(), dtype=float)
+        stop = np.asarray((self + coord_adjustment).as_tuple(), dtype=float)
+        # Mirrors skimage.draw.line_nd(start, stop, endpoint=True), including
+        # numpy.linspace's arithmetic, so that both give identical rasters
+        n_points = int(np.ceil(np.max(np.abs(stop - start)))) + 1
+        delta = stop - start
+        div = n_points - 1
+        step = delta / div if div > 0 else delta
+        step_zero = div > 0 and bool(np.any(step == 0))
+
+        def coords(first: int, last: int) -> np.ndarray:
+            points = np.arange(first, last, dtype=float).reshape(-1, 1)
+            if div <= 0:
+                points = points * delta
+            elif step_zero:
+                points = points / div * delta
+            else:
+                points = points * step
+            points += start
+            if last == n_points and n_points > 1:
+                points[-1] = stop
+            return points
+
+        head = coords(0, min(2, n_points))
+        floor_axes = (
+            (head[0] % 1 == 0.5) & (head[1] - head[0] == 1)
+            if n_points > 1 else np.zeros(2, dtype=bool)
+        )
+        for first in range(0, n_points, chunk_size):
+            points = coords(first, min(first + chunk_size, n_points))
+            yield np.where(floor_axes, np.floor(points), np.round(points)).astype(int)
+
+    def thick_raster_array(
+        self,
+        width: float,
+        origin: "Vec2 | None" = None,
+        block_coords: bool = True,
+        caps: str = "butt",
+        return_stations: bool = False,
+    ) -> np.ndarray | tuple[np.ndarray, np.ndarray]:
+        """The blocks covered by a road of the given width along this vector.
+
+        A block is covered if its centre lies within `width / 2` of the line,
+        extended at the ends according to `caps`. Each covered block appears
+        once, ordered along the line by the major axis (the axis the line
+        advances along most), then across it.
+
+        Parameters
+        ----------
+        `width` : `float`
+            The width of the road, perpendicular to the line. Must be positive.
+        `origin` : `Vec2` or `None`, optional
+            The start coordinate of the line.
+            If `None` (default), `Vec2(0, 0)` is used.
+        `block_coords` : `bool`, optional
+            Whether the origin and end coordinate parameters represent
+            block locations or continuous coordinate values.
+        `caps` : `str`, default `"butt"`
+            The shape of the road's ends: `"butt"` ends square at the end
+            points, `"square"` extends square past them by `width / 2`, and
+            `"round"` extends them by half circles.
+        `return_stations` : `bool`, default `False`
+            Also return, for each block, its major axis distance from the
+            origin's block in the direction of travel, e.g., for the `stations`
+            of `schematic.schematic_from_raster`, so that gaps and the endpoint
+            cover the whole width of the road.
+
+        Returns
+        -------
+        `raster` : `numpy.ndarray`
+            An integer array of shape `(n, 2)` holding the `x` and `z` values
+            of the covered blocks.
+        `stations` : `numpy.ndarray`
+            If `return_stations`, an integer array of shape `(n,)`.
+        """
+        if width <= 0:
+            raise ValueError("width must be positive")
+        if caps not in ("butt", "square", "round"):
+            raise ValueError(f"Unknown caps: {caps}")
+        if origin is None:
+            origin = Vec2(0, 0)
+        if block_coords:
+            coord_adjustment = Vec2.ZERO
+        else:
+            coord_adjustment = Vec2(-0.5, -0.5)
+        start = np.asarray((origin + coord_adjustment).as_tuple(), dtype=float)
+        stop = np.asarray((self + coord_adjustment).as_tuple(), dtype=float)
+        length = float(np.hypot(*(stop - start)))
+        if length == 0:
+            raise ValueError("The line must have non-zero length")
+        # Work in (major, minor) axis coordinates
+        major = int(np.argmax(np.abs(stop - start)))
+        axes = [major, 1 - major]
+        start, stop = start[axes], stop[axes]
+        unit = (stop - start) / length
+        half = width / 2
+        extend = half if caps == "square" else 0.0
+        first, last = start - unit * extend, stop + unit * extend
+        span = length + 2 * extend
+        reach = half if caps == "round" else half * abs(unit[1]) + extend * abs(unit[0])
+        eps = 1e-9
+        columns = np.arange(
+            np.ceil(min(start[0], stop[0]) - reach - eps),
+            np.floor(max(start[0], stop[0]) + reach + eps) + 1,
+        )
+        if unit[0] < 0:
+            columns = columns[::-1]
+        rel = columns - first[0]
+        # Within half the width of the line
+        low = first[1] + (rel * unit[1] - half) / unit[0]
+        high = first[1] + (rel * unit[1] + half) / unit[0]
+        low, high = np.minimum(low, high), np.maximum(low, high)
+        # Between the ends
+        if unit[1] != 0:
+            end_low = first[1] - rel * unit[0] / unit[1]
+            end_high = first[1] + (span - rel * unit[0]) / unit[1]
+            low = np.maximum(low, np.minimum(end_low, end_high))
+            high = np.minimum(high, np.maximum(end_low, end_high))
+        else:
+            outside = (rel * unit[0] < -eps) | (rel * unit[0] > span + eps)
+            low[outside], high[outside] = np.inf, -np.inf
+        if caps == "round":
+            # The road is convex, so each column covers one interval
+            empty = low > high
+            low[empty], high[empty] = np.inf, -np.inf
+            for end in (start, stop):
+                reach_sq = half ** 2 - (columns - end[0]) ** 2
+                inside = reach_sq >= 0
+                radius = np.sqrt(np.where(inside, reach_sq, 0))
+                low = np.where(inside, np.minimum(low, end[1] - radius), low)
+                high = np.where(inside, np.maximum(high, end[1] + radius), high)
+        low = np.ceil(low - eps)
+        high = np.floor(high + eps)
+        counts = np.maximum(high - low + 1, 0).astype(np.int64)
+        column_index = np.repeat(np.arange(len(columns)), counts)
+        within = np.arange(len(column_index)) - np.repeat(np.cumsum(counts) - counts, counts)
+        raster = np.empty((len(column_index), 2), dtype=np.int64)
+        raster[:, major] = columns[column_index]
+        raster[:, 1 - major] = low[column_index] + within
+        if not return_stations:
+            return raster
+        stations = ((columns[column_index] - np.round(start[0])) * np.sign(unit[0])).astype(np.int64)
+        return raster, stations
 
 
 Vec2.NORTH = Vec2(0, -1)
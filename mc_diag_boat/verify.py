@@ -0,0 +1,282 @@
+# MC Diag Boat - A set of functions for building diagonal boat roads in Minecraft
+# Copyright (C) 2024  ribqahisabsent
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Checking built or existing schematics against planned paths, and
+recovering the path a schematic was built from.
+"""
+
+
+from dataclasses import dataclass
+import numpy as np
+from .vec2 import Vec2
+from .angle import BoatAngle
+from .schematic import _as_cells, periodic_mask
+
+
+@dataclass
+class RouteDiff:
+    """The differences between the planned and the built positions of a path.
+
+    Attributes
+    ----------
+    `missing` : `numpy.ndarray`
+        The `(n, 2)` planned positions where nothing is built.
+    `extra` : `numpy.ndarray`
+        The `(n, 2)` built positions which are not planned.
+    """
+    missing: np.ndarray
+    extra: np.ndarray
+
+    def __bool__(self) -> bool:
+        return len(self.missing) > 0 or len(self.extra) > 0
+
+
+@dataclass
+class RouteFit:
+    """The path which best explains a set of built positions.
+
+    Attributes
+    ----------
+    `origin` : `Vec2[int]`
+        The first block of the path.
+    `offset` : `Vec2[float]`
+        The offset from `origin` to the endpoint of the path, along `angle`.
+    `angle` : `BoatAngle`
+        The boat angle of the path.
+    `gap_size` : `int`
+        The number of blocks skipped between each placed block.
+    `diff` : `RouteDiff`
+        The differences between the fitted path and the built positions.
+    """
+    origin: Vec2[int]
+    offset: Vec2[float]
+    angle: BoatAngle
+    gap_size: int
+    diff: RouteDiff
+
+
+def _cell_keys(cells: np.ndarray) -> np.ndarray:
+    return (cells[:, 0] << 32) + cells[:, 1]
+
+
+def diff_cells(planned: np.ndarray, built: np.ndarray) -> RouteDiff:
+    """The planned positions which are not built, and the built positions
+    which are not planned.
+
+    Parameters
+    ----------
+    `planned`, `built` : `numpy.ndarray`
+        Integer arrays of shape `(n, 2)`. Duplicate positions are ignored.
+
+    Returns
+    -------
+    `diff` : `RouteDiff`
+        The missing and extra positions, each sorted by `x` then `z`.
+    """
+    planned, built = _as_cells(planned), _as_cells(built)
+    planned_keys, built_keys = _cell_keys(planned), _cell_keys(built)
+    missing = planned[~np.isin(planned_keys, built_keys)]
+    extra = built[~np.isin(built_keys, planned_keys)]
+    return RouteDiff(np.unique(missing, axis=0), np.unique(extra, axis=0))
+
+
+def planned_cells(offset: Vec2, origin: Vec2[int] = Vec2(0, 0), gap_size: int = 0) -> np.ndarray:
+    """The positions at which `generate_schematic` places blocks for a path
+    to `offset`, with the schematic pasted at block `origin`.
+
+    Returns
+    -------
+    `cells` : `numpy.ndarray`
+        An integer array of shape `(n, 2)`, in raster order.
+    """
+    # Rasterized from (0, 0) as the schematic is, since rounding depends on the start
+    cells = offset.raster_array()[:-1] + [origin.x, origin.z]
+    return cells[periodic_mask(len(cells), gap_size + 1)]
+
+
+def verify_path(
+    built: np.ndarray,
+    offset: Vec2,
+    origin: Vec2[int] = Vec2(0, 0),
+    gap_size: int = 0,
+) -> RouteDiff:
+    """Compare built positions, e.g., from `litematic.read_cells`, with
+    a planned path.
+
+    Parameters
+    ----------
+    `built` : `numpy.ndarray`
+        The `(n, 2)` positions holding blocks.
+    `offset` : `Vec2`
+        The offset of the planned path, as passed to `generate_schematic`.
+    `origin` : `Vec2[int]`, default `Vec2(0, 0)`
+        The position of the first block of the planned path in the same
+        coordinates as `built`.
+    `gap_size` : `int`, default `0`
+        The gap size of the planned path.
+
+    Returns
+    -------
+    `diff` : `RouteDiff`
+        The missing and extra positions.
+    """
+    return diff_cells(planned_cells(offset, origin, gap_size), built)
+
+
+def _merge_intervals(low: np.ndarray, high: np.ndarray, owner: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Join the overlapping intervals of each owner, so each owner counts
+    once wherever its intervals overlap.
+    """
+    order = np.lexsort((low, owner))
+    low, high, owner = low[order], high[order], owner[order]
+    while True:
+        repeat = np.flatnonzero((owner[1:] == owner[:-1]) & (low[1:] <= high[:-1])) + 1
+        if len(repeat) == 0:
+            return low, high
+        # Only merge into intervals which are not merged away themselves
+        repeat = repeat[~np.isin(repeat - 1, repeat)]
+        high[repeat - 1] = np.maximum(high[repeat - 1], high[repeat])
+        low, high, owner = np.delete(low, repeat), np.delete(high, repeat), np.delete(owner, repeat)
+
+
+def _fit_length(
+    relative: np.ndarray,
+    unit: np.ndarray,
+    major: int,
+    gap_size: int,
+    n_steps: int,
+) -> tuple[int, float]:
+    """The length along the major axis of a raster of `n_steps` steps at
+    `unit` which best agrees with the `relative` positions.
+
+    Raster position `i` rounds `i * scale * unit / |unit[major]|`, where
+    `n_steps` is the length rounded up and `scale` is at most one step short
+    of `1`. A position `x` blocks along the major axis can only be raster
+    position `x` or `x + 1`, and each pairing bounds `scale` to an interval.
+    The best `scale` is the point where the most positions are kept plus the
+    most raster positions land on a position, which is the fewest missing
+    and extra positions.
+
+    Returns
+    -------
+    `count` : `int`
+        The number of kept positions plus the number of raster positions
+        which land on a position.
+    `length` : `float`
+        The fitted length.
+    """
+    step = unit / abs(unit[major])
+    floor = (n_steps - 1) / n_steps
+    lows, highs, owners, indices = [], [], [], []
+    along = np.rint(relative[:, major] * step[major]).astype(np.int64)
+    for shift in (0, 1):
+        index = along + shift
+        # The endpoint is never built
+        kept = (index > 0) & (index % (gap_size + 1) == 0) & (index < n_steps)
+        coefficients = index[kept, None] * step
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bounds = ((relative[kept] - 0.5) / coefficients, (relative[kept] + 0.5) / coefficients)
+        # A zero coefficient puts no bound on the scale, if the position is within reach
+        reachable = np.abs(relative[kept]) <= 0.5
+        low = np.where(coefficients != 0, np.minimum(*bounds), np.where(reachable, -np.inf, np.inf)).max(axis=1)
+        high = np.where(coefficients != 0, np.maximum(*bounds), np.where(reachable, np.inf, -np.inf)).min(axis=1)
+        low, high = np.maximum(low, floor), np.minimum(high, 1.0)
+        valid = low <= high
+        lows.append(low[valid])
+        highs.append(high[valid])
+        owners.append(np.flatnonzero(kept)[valid])
+        indices.append(index[kept][valid])
+    low, high = np.concatenate(lows), np.concatenate(highs)
+    if len(low) == 0:
+        return 0, float(n_steps)
+    # Each position counts once if kept, and each raster position once if it lands on one
+    position_low, position_high = _merge_intervals(low, high, np.concatenate(owners))
+    index_low, index_high = _merge_intervals(low, high, np.concatenate(indices))
+    low, high = np.concatenate((position_low, index_low)), np.concatenate((position_high, index_high))
+    # Sweep the interval ends, opening before closing at equal scales
+    events = np.concatenate((low, high))
+    deltas = np.concatenate((np.ones(len(low), dtype=np.int64), -np.ones(len(high), dtype=np.int64)))
+    order = np.lexsort((-deltas, events))
+    events, coverage = events[order], np.cumsum(deltas[order])
+    best = int(np.argmax(coverage))
+    scale = (events[best] + events[min(best + 1, len(events) - 1)]) / 2
+    return int(coverage[best]), float(scale * n_steps)
+
+
+def fit_path(built: np.ndarray) -> RouteFit:
+    """The straight path, at a boat angle, which best explains built positions.
+
+    Either end of the positions may be the start. The gap size comes from the
+    typical spacing along the path and the boat angle from a least-squares
+    fit of the positions, with its neighbouring boat angles also tried. Each
+    built position then bounds the length of the path, and the length which
+    agrees with the most positions is kept, so missing or stray blocks do not
+    throw the fit off. Of the candidates which agree with the most positions,
+    the one with the fewest missing and extra positions is returned, and the
+    shortest of those.
+
+    Parameters
+    ----------
+    `built` : `numpy.ndarray`
+        The `(n, 2)` positions holding blocks, e.g., from `litematic.read_cells`.
+        At least two unique positions are needed.
+
+    Returns
+    -------
+    `fit` : `RouteFit`
+        The fitted path and its differences from `built`.
+    """
+    built = np.unique(_as_cells(built), axis=0)
+    if len(built) < 2:
+        raise ValueError("At least two positions are needed to fit a path")
+    # Raster positions step by at most one block along the major axis
+    major = int(np.ptp(built[:, 1]) > np.ptp(built[:, 0]))
+    built = built[np.lexsort((built[:, 1 - major], built[:, major]))]
+    spacing = np.diff(built[:, major])
+    gap_size = max(int(np.median(spacing[spacing > 0])) - 1, 0) if np.any(spacing > 0) else 0
+    candidates = []
+    for start, end in ((built[0], built[-1]), (built[-1], built[0])):
+        relative = (built - start).astype(np.float64)
+        # Least-squares slope of the minor coordinate, through the start
+        slope = (relative[:, major] @ relative[:, 1 - major]) / (relative[:, major] @ relative[:, major])
+        direction = np.empty(2)
+        direction[major] = np.sign(end[major] - start[major])
+        direction[1 - major] = slope * direction[major]
+        closest = BoatAngle.from_angle(Vec2(*direction.tolist()).angle())
+        # The endpoint is not built, and up to gap_size positions before it
+        extent = abs(int(end[major] - start[major]))
+        for angle in (closest, BoatAngle(closest.index - 1), BoatAngle(closest.index + 1)):
+            unit = np.array(angle.unit_vector())
+            if abs(unit[major]) < 1e-12 or np.sign(unit[major]) != direction[major]:
+                continue
+            for n_steps in range(extent + 1, extent + gap_size + 3):
+                count, length = _fit_length(relative, unit, major, gap_size, n_steps)
+                candidates.append((count, n_steps, Vec2(*start.tolist()), angle, unit * length / abs(unit[major])))
+    if not candidates:
+        raise ValueError("No boat angle fits the positions")
+    most = max(candidate[0] for candidate in candidates)
+    # Shorter rasters first, so they win ties in the number of errors
+    candidates = sorted((candidate for candidate in candidates if candidate[0] == most), key=lambda candidate: candidate[1])
+    best = None
+    for _, _, origin, angle, offset in candidates:
+        fit = RouteFit(origin, Vec2(*offset.tolist()), angle, gap_size, verify_path(built, Vec2(*offset.tolist()), origin, gap_size))
+        errors = len(fit.diff.missing) + len(fit.diff.extra)
+        if best is None or errors < best[0]:
+            best = errors, fit
+        if errors == 0:
+            break
+    return best[1]